@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Compare the memory held per fetched row with and without the
+``compact_rows`` execution option.
+
+Runs entirely in-process against the stand-in for ibm_db_dbi in
+test/fake_ibm_db_dbi.py::
+
+    python bench/row_memory.py [number of rows]
+
+The figure reported is the size of the row containers plus the values
+they hold, as measured by sys.getsizeof(); values shared between rows
+(such as small integers) are counted once per row, so it is an upper
+bound that is comparable between the two modes.
+
+"""
+import datetime
+import sys
+
+from suite import stand_in_engine
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, \
+    DateTime, select
+
+
+def _row_size(row):
+    size = sys.getsizeof(row)
+    raw = getattr(row, '_row', None)
+    if raw is not None:
+        # RowProxy keeps the raw DBAPI row as well
+        size += sys.getsizeof(raw)
+        values = raw
+    else:
+        values = row
+    return size + sum(sys.getsizeof(value) for value in values)
+
+
+def measure(engine, table, **execution_options):
+    conn = engine.connect().execution_options(**execution_options)
+    rows = conn.execute(select([table])).fetchall()
+    total = sys.getsizeof(rows) + sum(_row_size(row) for row in rows)
+    conn.close()
+    return float(total) / len(rows)
+
+
+def main(num_rows=100000):
+    engine, database = stand_in_engine()
+    table = Table('t', MetaData(),
+                    Column('id', Integer, primary_key=True),
+                    Column('name', String(50)),
+                    Column('created', DateTime))
+    database.add_table(table)
+    stamp = datetime.datetime(2013, 1, 26, 12, 30)
+    engine.execute(table.insert(), [{'name': u'name %d' % i, 'created': stamp}
+                                    for i in range(num_rows)])
+
+    before = measure(engine, table)
+    after = measure(engine, table, compact_rows=True)
+    print("rows fetched:             %d" % num_rows)
+    print("bytes/row, RowProxy:      %.1f" % before)
+    print("bytes/row, compact_rows:  %.1f" % after)
+    print("reduction:                %.1f%%" % (100 * (before - after) / before))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""Timing benchmarks of the dialect's hot paths.
+
+Everything runs in-process against the stand-in DBAPI in
+test/fake_ibm_db_dbi.py, so results depend only on the Python side::
+
+    python bench/suite.py [name ...]
+    python bench/suite.py --save baseline.json
+    python bench/suite.py --compare baseline.json [--threshold 0.2]
+
+Each benchmark reports the best time per operation out of ``--repeat``
+runs.  With ``--compare``, any benchmark slower than the baseline by more
+than ``--threshold`` (a fraction, 0.2 being 20%) is reported as a
+regression and the exit status is 1.  Baselines are only comparable when
+taken on the same machine and interpreter.
+
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from sqlalchemy.dialects import registry
+registry.register("db2.ibm_db", "ibm_db_sa.ibm_db", "DB2Dialect_ibm_db")
+
+import sqlalchemy
+from sqlalchemy import create_engine, MetaData, Table, Column, Index, \
+    ForeignKey, Integer, String, Date, Boolean, Numeric, DateTime, \
+    select, and_
+from sqlalchemy.schema import CreateTable, CreateIndex
+
+from ibm_db_sa import base as ibm_base
+from test.fake_ibm_db_dbi import Database, DBAPI
+
+
+BENCHMARKS = []
+
+
+def benchmark(number=1, self_timed=False):
+    """Register a benchmark.
+
+    The decorated function does any setup and returns the operation to
+    time; the operation is called ``number`` times per run.  A
+    ``self_timed`` operation returns its own duration in seconds.
+
+    """
+    def decorate(fn):
+        fn.number = number
+        fn.self_timed = self_timed
+        BENCHMARKS.append(fn)
+        return fn
+    return decorate
+
+
+def stand_in_engine(database=None, **kw):
+    """Return an engine on the stand-in DBAPI, and its Database."""
+
+    database = database or Database()
+    return create_engine("db2+ibm_db://", module=DBAPI(database), **kw), \
+                database
+
+
+def _orders_schema(metadata):
+    customers = Table('customers', metadata,
+                    Column('id', Integer, primary_key=True),
+                    Column('name', String(100), nullable=False),
+                    Column('region', String(20)),
+                    Column('created', DateTime))
+    orders = Table('orders', metadata,
+                    Column('id', Integer, primary_key=True),
+                    Column('customer_id', Integer, ForeignKey('customers.id'),
+                                nullable=False),
+                    Column('placed', Date, nullable=False),
+                    Column('shipped', Boolean, nullable=False),
+                    Column('total', Numeric(12, 2)),
+                    Column('note', String(200)),
+                    Index('ix_orders_customer', 'customer_id'))
+    return customers, orders
+
+
+@benchmark(number=500)
+def compile_select():
+    dialect = ibm_base.DB2Dialect()
+    customers, orders = _orders_schema(MetaData())
+    stmt = select([orders.c.id, orders.c.total, customers.c.name]).\
+                select_from(orders.join(customers)).\
+                where(and_(orders.c.placed >= datetime.date(2013, 1, 1),
+                           customers.c.region == 'EMEA')).\
+                order_by(orders.c.placed.desc()).\
+                limit(50)
+    return lambda: stmt.compile(dialect=dialect)
+
+
+@benchmark(number=500)
+def compile_insert():
+    dialect = ibm_base.DB2Dialect()
+    customers, orders = _orders_schema(MetaData())
+    stmt = orders.insert()
+    return lambda: stmt.compile(dialect=dialect)
+
+
+@benchmark(number=200)
+def compile_in_list():
+    dialect = ibm_base.DB2Dialect(in_list_buckets=True)
+    customers, orders = _orders_schema(MetaData())
+    stmt = select([orders]).where(orders.c.customer_id.in_(range(100)))
+    return lambda: stmt.compile(dialect=dialect)
+
+
+@benchmark(number=200)
+def compile_ddl():
+    dialect = ibm_base.DB2Dialect()
+    customers, orders = _orders_schema(MetaData())
+
+    def run():
+        CreateTable(orders).compile(dialect=dialect)
+        for index in orders.indexes:
+            CreateIndex(index).compile(dialect=dialect)
+    return run
+
+
+@benchmark()
+def reflect_50_tables():
+    metadata = MetaData()
+    previous = None
+    for i in range(50):
+        columns = [Column('id', Integer, primary_key=True),
+                   Column('name', String(50)),
+                   Column('amount', Numeric(10, 2)),
+                   Column('created', Date)]
+        if previous is not None:
+            columns.append(Column('parent_id', Integer,
+                                ForeignKey(previous.c.id)))
+        previous = Table('table_%02d' % i, metadata, *columns)
+    database = Database()
+    for table in metadata.sorted_tables:
+        database.add_table(table)
+    engine = stand_in_engine(database)[0]
+    engine.connect().close()
+
+    def run():
+        conn = engine.connect()
+        MetaData().reflect(bind=conn)
+        conn.close()
+    return run
+
+
+@benchmark()
+def executemany_10000_rows():
+    engine, database = stand_in_engine()
+    customers, orders = _orders_schema(MetaData())
+    database.add_table(orders)
+    rows = [{'customer_id': i % 100, 'placed': datetime.date(2013, 1, 26),
+             'shipped': i % 2 == 0, 'total': 10.5, 'note': 'note %d' % i}
+            for i in range(10000)]
+    conn = engine.connect()
+    return lambda: conn.execute(orders.insert(), rows)
+
+
+def _fetch(**execution_options):
+    engine, database = stand_in_engine()
+    customers, orders = _orders_schema(MetaData())
+    database.add_table(orders)
+    conn = engine.connect()
+    conn.execute(orders.insert(),
+                [{'customer_id': i % 100,
+                  'placed': datetime.date(2013, 1, 26),
+                  'shipped': i % 2 == 0, 'total': 10.5}
+                 for i in range(10000)])
+    stmt = select([orders.c.id, orders.c.placed, orders.c.shipped])
+    conn = conn.execution_options(**execution_options)
+    return lambda: conn.execute(stmt).fetchall()
+
+
+@benchmark()
+def fetch_10000_rows():
+    # Date and Boolean columns go through _IBM_Date and _IBM_Boolean
+    return _fetch()
+
+
+@benchmark()
+def fetch_10000_rows_compact():
+    return _fetch(compact_rows=True)
+
+
+def _fetch_blocks(**execution_options):
+    # 2 ms per block fetched, as over a network
+    engine, database = stand_in_engine(Database(fetch_latency=0.002))
+    customers, orders = _orders_schema(MetaData())
+    database.add_table(orders)
+    conn = engine.connect()
+    conn.execute(orders.insert(),
+                [{'customer_id': i % 100,
+                  'placed': datetime.date(2013, 1, 26),
+                  'shipped': i % 2 == 0, 'total': 10.5}
+                 for i in range(10000)])
+    stmt = select([orders.c.id, orders.c.placed, orders.c.shipped])
+    conn = conn.execution_options(**execution_options)
+
+    def run():
+        # the time spent on each block is what prefetching overlaps
+        # with the fetch of the next one
+        result = conn.execute(stmt)
+        while True:
+            rows = result.fetchmany(500)
+            if not rows:
+                break
+            for row in rows:
+                "%d %s %s" % (row.id, row.placed, row.shipped)
+    return run
+
+
+@benchmark()
+def fetch_latency():
+    return _fetch_blocks()
+
+
+@benchmark()
+def fetch_latency_prefetch():
+    return _fetch_blocks(prefetch_rows=500)
+
+
+@benchmark(self_timed=True)
+def import_time():
+    code = "import sys, time; sys.path.insert(0, %r); " \
+           "start = time.time(); import ibm_db_sa; " \
+           "sys.stdout.write(repr(time.time() - start))" % ROOT
+
+    def run():
+        return float(subprocess.check_output([sys.executable, '-c', code]))
+    return run
+
+
+def measure(fn, repeat):
+    operation = fn()
+    timings = []
+    for i in range(repeat):
+        if fn.self_timed:
+            timings.append(operation())
+        else:
+            start = time.time()
+            for j in range(fn.number):
+                operation()
+            timings.append((time.time() - start) / fn.number)
+    return min(timings)
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        'platform': platform.platform(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print results against a baseline; return the regressed names."""
+
+    regressions = []
+    print("%-28s %12s %12s %9s" % ('benchmark', 'baseline', 'current',
+                                    'change'))
+    for name, seconds in results:
+        before = baseline['results'].get(name)
+        if before is None:
+            print("%-28s %12s %12.6f %9s" % (name, '-', seconds, 'new'))
+            continue
+        change = (seconds - before) / before
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print("%-28s %12.6f %12.6f %+8.1f%%%s" % (
+                    name, before, seconds, change * 100, flag))
+    if baseline.get('environment') != environment():
+        print("\nwarning: baseline was taken in a different environment: %s"
+                    % baseline.get('environment'))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+                description="Run the ibm_db_sa benchmarks.")
+    parser.add_argument('names', nargs='*',
+                help="benchmarks to run; all by default")
+    parser.add_argument('--repeat', type=int, default=5,
+                help="runs per benchmark; the best is reported")
+    parser.add_argument('--save', metavar='FILE',
+                help="write the results to FILE as a JSON baseline")
+    parser.add_argument('--compare', metavar='FILE',
+                help="compare the results to the JSON baseline in FILE")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                help="slowdown, as a fraction, reported as a regression")
+    options = parser.parse_args(argv)
+
+    selected = [fn for fn in BENCHMARKS
+                if not options.names or fn.__name__ in options.names]
+    results = []
+    for fn in selected:
+        seconds = measure(fn, options.repeat)
+        results.append((fn.__name__, seconds))
+        if not options.compare:
+            print("%-28s %12.6f s" % (fn.__name__, seconds))
+
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump({'environment': environment(),
+                       'results': dict(results)}, f, indent=2,
+                      sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, options.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -33,6 +33,12 @@ from .base import \
     NUMERIC, SMALLINT, REAL, TIME, TIMESTAMP, \
     VARCHAR, VARGRAPHIC, dialect
 
+from .ddl import Truncate, DetachPartition, DeclareGlobalTemporaryTable, \
+    CreateMaterializedQueryTable, RefreshTable
+from .dml import DeleteChunk, chunked_delete, Call, Array, inoutparam
+from .staging import stage_table, stage_rows
+from .routing import RoutingEngine
+
 #__all__ = (
     # TODO: (put types here)
 #    'dialect'
@@ -21,12 +21,24 @@
 
 """
 import datetime
+import decimal
+import collections
+import threading
 from sqlalchemy import types as sa_types
+from sqlalchemy import processors
 from sqlalchemy import schema as sa_schema
-from sqlalchemy.sql import compiler
-from sqlalchemy.engine import default
+from sqlalchemy import exc, util, event
+from sqlalchemy.sql import compiler, expression
+from sqlalchemy.engine import default, reflection
 
 from . import reflection as ibm_reflection
+from . import cache as ibm_cache
+from . import result as ibm_result
+from . import compound as ibm_compound
+from . import dml as ibm_dml
+from . import maintenance as ibm_maintenance
+from . import watchdog as ibm_watchdog
+from . import staging as ibm_staging
 
 from sqlalchemy.types import BLOB, CHAR, CLOB, DATE, DATETIME, INTEGER,\
     SMALLINT, BIGINT, DECIMAL, NUMERIC, REAL, TIME, TIMESTAMP,\
@@ -119,13 +131,12 @@ class _IBM_Boolean(sa_types.Boolean):
         return process
 
     def bind_processor(self, dialect):
+        # BOOLEAN is SMALLINT; bound as an integer so that the driver
+        # describes the parameter as the column's type
         def process(value):
             if value is None:
                 return None
-            if value == False:
-                return '0'
-            elif value == True:
-                return '1'
+            return int(bool(value))
         return process
 
 
@@ -142,14 +153,77 @@ class _IBM_Date(sa_types.Date):
         return process
 
     def bind_processor(self, dialect):
+        # dates are bound as dates, not strings DB2 would have to cast
         def process(value):
-            if value is None:
-                return None
             if isinstance(value, datetime.datetime):
-                value = datetime.date(value.year, value.month, value.day)
-            return str(value)
+                value = value.date()
+            return value
         return process
 
+# DECIMAL values range up to 31 digits, beyond the default context
+_decimal_context = decimal.Context(prec=31)
+_decimal_string_processors = {}
+
+
+def _decimal_string_processor(scale):
+    """Return a processor converting DECIMAL values fetched as strings to
+    Decimal with ``scale`` digits after the point; one processor, with
+    its quantize exponent, is shared by all columns of a scale."""
+
+    try:
+        return _decimal_string_processors[scale]
+    except KeyError:
+        pass
+
+    Decimal = decimal.Decimal
+    if scale is None:
+        def process(value):
+            if value is None:
+                return None
+            return Decimal(value)
+    else:
+        exponent = Decimal(1).scaleb(-scale)
+        context = _decimal_context
+
+        def process(value):
+            if value is None:
+                return None
+            return Decimal(value).quantize(exponent, context=context)
+    _decimal_string_processors[scale] = process
+    return process
+
+
+def _is_float_coltype(coltype):
+    # pyodbc describes columns with Python types, ibm_db_dbi with type
+    # objects which compare equal to the SQL type names they cover
+    return coltype is float or coltype in ('DOUBLE', 'FLOAT', 'REAL')
+
+
+class _IBM_Numeric(sa_types.Numeric):
+
+    def bind_processor(self, dialect):
+        if dialect._decimal_result_type is str:
+            # the driver speaks strings; keep all digits
+            return processors.to_str
+        return super(_IBM_Numeric, self).bind_processor(dialect)
+
+    def result_processor(self, dialect, coltype):
+        result_type = dialect._decimal_result_type
+        if _is_float_coltype(coltype):
+            result_type = float
+        if result_type is decimal.Decimal:
+            if self.asdecimal:
+                return None
+            return processors.to_float
+        elif result_type is str:
+            if self.asdecimal:
+                return _decimal_string_processor(self.scale)
+            return processors.to_float
+        elif self.asdecimal:
+            return super(_IBM_Numeric, self).result_processor(dialect, coltype)
+        return None
+
+
 class DOUBLE(sa_types.Numeric):
     __visit_name__ = 'DOUBLE'
 
@@ -175,6 +249,8 @@ class XML(sa_types.Text):
 colspecs = {
     sa_types.Boolean: _IBM_Boolean,
     sa_types.Date: _IBM_Date,
+    sa_types.Numeric: _IBM_Numeric,
+    sa_types.Float: sa_types.Float,
 # really ?
 #    sa_types.Unicode: DB2VARGRAPHIC
 }
@@ -313,8 +389,39 @@ class DB2TypeCompiler(compiler.GenericTypeCompiler):
         return self.visit_BLOB(type_)
 
 
+class _EncodedStatement(unicode):
+    """Statement text which keeps its encoded forms.
+
+    Returned by ``unicode()`` of a DB2Compiler, so that a Compiled which
+    is executed many times, as from a ``compiled_cache``, is encoded for
+    a driver without unicode statement support only once.
+
+    """
+
+    def encode(self, *args):
+        try:
+            encoded = self._encoded
+        except AttributeError:
+            encoded = self._encoded = {}
+        try:
+            return encoded[args]
+        except KeyError:
+            value = encoded[args] = unicode.encode(self, *args)
+            return value
+
+
 class DB2Compiler(compiler.SQLCompiler):
 
+    _unicode_statement = None
+
+    # the autoincrement column of an INSERT whose Sequence is fired
+    # ahead of the statement; see DB2ExecutionContext.create_cursor()
+    _sequence_column = None
+
+    def __unicode__(self):
+        if self._unicode_statement is None:
+            self._unicode_statement = _EncodedStatement(self.string or '')
+        return self._unicode_statement
 
     def visit_now_func(self, fn, **kw):
         return "CURRENT_TIMESTAMP"
@@ -358,6 +465,87 @@ class DB2Compiler(compiler.SQLCompiler):
         else:
             return ""
 
+    def visit_sequence(self, sequence):
+        column = self.isinsert and \
+                    self.statement.table._autoincrement_column
+        if self.dialect._sequence_allocator is not None and \
+                column is not None and column.default is sequence and \
+                not self.statement._has_multi_parameters:
+            # fired ahead of the INSERT, so that the value is drawn from
+            # the allocator's block rather than by a NEXTVAL per row.  Not
+            # added to self.prefetch: SQLAlchemy 0.8 doesn't prefetch
+            # Sequence defaults for executemany()
+            self._sequence_column = column
+            return self._create_crud_bind_param(column, None)
+        return "NEXTVAL FOR %s" % self.preparer.format_sequence(sequence)
+
+    def visit_next_value_func(self, next_value, **kw):
+        return "NEXTVAL FOR %s" % \
+                    self.preparer.format_sequence(next_value.sequence)
+
+    def visit_delete_chunk(self, delete_chunk, **kw):
+        self.isdelete = True
+        self.stack.append({'correlate_froms': set(),
+                           'iswrapper': False,
+                           'asfrom_froms': set()})
+        select = delete_chunk._select([delete_chunk.table])
+        text = "DELETE FROM %s" % self.process(select, asfrom=True, **kw)
+        self.stack.pop(-1)
+        return text
+
+    def visit_call(self, call, **kw):
+        name = self.preparer.quote(call.name, None)
+        if call.schema:
+            name = "%s.%s" % (self.preparer.quote_schema(call.schema, None),
+                              name)
+        # callproc() takes the name apart from the argument list
+        self.call_name = name
+        return "CALL %s(%s)" % (name, ", ".join(
+                    self.process(argument, **kw)
+                    for argument in call.arguments))
+
+    def visit_db2_array(self, array, **kw):
+        return "ARRAY[%s]" % ", ".join(self.process(clause, **kw)
+                                        for clause in array.clauses)
+
+    def _in_list_bucket(self, length):
+        max_bucket = self.dialect.in_list_max_bucket
+        if length > max_bucket:
+            return -(-length // max_bucket) * max_bucket
+        bucket = 1
+        while bucket < length:
+            bucket *= 2
+        return bucket
+
+    def visit_in_op_binary(self, binary, operator, **kw):
+        opstring = compiler.OPERATORS[operator]
+        if not self.dialect.in_list_buckets or \
+                not isinstance(binary.right, expression.Grouping) or \
+                not isinstance(binary.right.element, expression.ClauseList):
+            return self._generate_generic_binary(binary, opstring, **kw)
+
+        clauses = list(binary.right.element.clauses)
+        last = clauses[-1]
+        if isinstance(last, expression.BindParameter):
+            # repeating the last value doesn't change the result of
+            # IN or NOT IN, but keeps the number of distinct
+            # statements, and so of DB2 package cache entries, small
+            max_length = self.dialect.in_list_max_length
+            if len(clauses) > max_length:
+                raise exc.CompileError(
+                        "IN list of %d values is longer than "
+                        "in_list_max_length (%d); stage the values with "
+                        "ibm_db_sa.stage_rows() and join to the staged "
+                        "table instead" % (len(clauses), max_length))
+            bucket = min(self._in_list_bucket(len(clauses)), max_length)
+            clauses.extend([last] * (bucket - len(clauses)))
+            self.dialect._count_in_list_shape(bucket)
+        return binary.left._compiler_dispatch(self, **kw) + opstring + \
+                    "(%s)" % ", ".join(clause._compiler_dispatch(self, **kw)
+                                        for clause in clauses)
+
+    visit_notin_op_binary = visit_in_op_binary
+
     def visit_join(self, join, asfrom=False, **kwargs):
         # NOTE: this is the same method as that used in mysql/base.py
         # to render INNER JOIN
@@ -369,8 +557,145 @@ class DB2Compiler(compiler.SQLCompiler):
              self.process(join.onclause, **kwargs)))
 
 
+_REFRESH_AGE_KEY = 'db2_refresh_age'
+
+
+def _set_refresh_age(dbapi_connection, age):
+    """Set ``CURRENT REFRESH AGE`` to ``'ANY'`` or 0; None sets it to
+    0."""
+
+    if isinstance(age, basestring) and age.upper() == 'ANY':
+        age = 'ANY'
+    else:
+        age = int(age or 0)
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SET CURRENT REFRESH AGE %s" % age)
+    finally:
+        cursor.close()
+
+
+# (execution option, key of the pool's per-connection info dictionary,
+# function setting the register) of the special registers set with
+# execution options
+_SPECIAL_REGISTERS = [
+    ('lock_timeout', ibm_watchdog.LOCK_TIMEOUT_KEY,
+        ibm_watchdog.set_lock_timeout),
+    ('refresh_age', _REFRESH_AGE_KEY, _set_refresh_age),
+]
+
+
+def _dialect_option(element, name, default=None):
+    """Return the ``db2_<name>`` option of a schema item.
+
+    Options are given as keyword arguments to :class:`.Table` and
+    :class:`.Index`.  :class:`.Column` and :class:`.Sequence` don't accept
+    dialect keyword arguments on all supported SQLAlchemy versions, so
+    for these the option may be set in the ``info`` dictionary instead:
+    ``Column(..., info={'db2_cache': 50})``, and for a
+    :class:`.Sequence`, whose constructor has no ``info`` argument either,
+    ``seq.info['db2_cache'] = 50`` once it is constructed.
+
+    """
+    key = 'db2_' + name
+    for options in (getattr(element, 'dialect_kwargs', None),
+                    getattr(element, 'kwargs', None),
+                    getattr(element, 'info', None)):
+        if options and key in options:
+            return options[key]
+    return default
+
+
 class DB2DDLCompiler(compiler.DDLCompiler):
 
+    def _format_column_names(self, table, columns):
+        if isinstance(columns, (basestring, sa_schema.Column)):
+            columns = [columns]
+        return ", ".join(
+                    self.preparer.format_column(col)
+                    if isinstance(col, sa_schema.Column)
+                    else self.preparer.quote(col, None)
+                    for col in columns)
+
+    def _format_partition(self, partition):
+        # a partition is either a complete partition element, rendered
+        # as given, or a tuple of (name, starting, ending[, exclusive[,
+        # starting_exclusive]]) where the bounds are SQL text such as
+        # "'2013-01-01'" or "MAXVALUE", or tuples of these for
+        # multi-column keys; exclusive applies to the ending bound
+        if isinstance(partition, basestring):
+            return partition
+
+        def bound(value):
+            if isinstance(value, (tuple, list)):
+                return ", ".join(unicode(v) for v in value)
+            return unicode(value)
+
+        name, starting, ending = partition[0:3]
+        text = ""
+        if name:
+            text += "PARTITION %s " % self.preparer.quote(name, None)
+        text += "STARTING (%s)" % bound(starting)
+        if len(partition) > 4 and partition[4]:
+            text += " EXCLUSIVE"
+        text += " ENDING (%s)" % bound(ending)
+        if len(partition) > 3 and partition[3]:
+            text += " EXCLUSIVE"
+        return text
+
+    def post_create_table(self, table):
+        opts = []
+
+        tablespace = _dialect_option(table, 'tablespace')
+        if tablespace:
+            opts.append("IN %s" % self.preparer.quote(tablespace, None))
+        index_tablespace = _dialect_option(table, 'index_tablespace')
+        if index_tablespace:
+            opts.append("INDEX IN %s" %
+                            self.preparer.quote(index_tablespace, None))
+        long_tablespace = _dialect_option(table, 'long_tablespace')
+        if long_tablespace:
+            opts.append("LONG IN %s" %
+                            self.preparer.quote(long_tablespace, None))
+
+        distribute_by = _dialect_option(table, 'distribute_by')
+        if isinstance(distribute_by, basestring) and \
+                distribute_by.upper() == 'RANDOM':
+            opts.append("DISTRIBUTE BY RANDOM")
+        elif distribute_by:
+            opts.append("DISTRIBUTE BY HASH (%s)" %
+                            self._format_column_names(table, distribute_by))
+
+        partition_by = _dialect_option(table, 'partition_by')
+        if partition_by:
+            text = "PARTITION BY RANGE (%s)" % \
+                            self._format_column_names(table, partition_by)
+            partitions = _dialect_option(table, 'partitions')
+            if partitions:
+                text += " (%s)" % ", ".join(
+                            self._format_partition(p) for p in partitions)
+            opts.append(text)
+
+        compress = _dialect_option(table, 'compress')
+        if compress is True or \
+                isinstance(compress, basestring) and \
+                compress.upper() == 'ADAPTIVE':
+            opts.append("COMPRESS YES ADAPTIVE")
+        elif isinstance(compress, basestring) and \
+                compress.upper() == 'STATIC':
+            opts.append("COMPRESS YES STATIC")
+        elif compress is False:
+            opts.append("COMPRESS NO")
+
+        organize_by = _dialect_option(table, 'organize_by')
+        if organize_by:
+            opts.append("ORGANIZE BY %s" % organize_by.upper())
+
+        if opts:
+            return "\n" + "\n".join(opts)
+        else:
+            return ""
+
     def get_column_specification(self, column, **kw):
         col_spec = [self.preparer.format_column(column)]
         col_spec.append(self.dialect.type_compiler.process(column.type))
@@ -387,13 +712,139 @@ class DB2DDLCompiler(compiler.DDLCompiler):
             col_spec.append(default)
 
         if column is column.table._autoincrement_column:
-            col_spec.append('GENERATED BY DEFAULT')
+            if _dialect_option(column, 'generated_always'):
+                col_spec.append('GENERATED ALWAYS')
+            else:
+                col_spec.append('GENERATED BY DEFAULT')
             col_spec.append('AS IDENTITY')
-            col_spec.append('(START WITH 1)')
+            identity_options = ['START WITH %d' %
+                                    _dialect_option(column, 'start', 1)]
+            increment = _dialect_option(column, 'increment')
+            if increment is not None:
+                identity_options.append('INCREMENT BY %d' % increment)
+            identity_options.extend(self._sequence_options(column))
+            col_spec.append('(%s)' % ' '.join(identity_options))
 
         column_spec = ' '.join(col_spec)
         return column_spec
 
+    def _sequence_options(self, element):
+        # CACHE / ORDER, shared by identity columns and sequences
+        options = []
+        cache = _dialect_option(element, 'cache')
+        if cache is not None:
+            if cache:
+                options.append('CACHE %d' % cache)
+            else:
+                options.append('NO CACHE')
+        order = _dialect_option(element, 'order')
+        if order is not None:
+            options.append(order and 'ORDER' or 'NO ORDER')
+        return options
+
+    def visit_create_sequence(self, create):
+        text = super(DB2DDLCompiler, self).visit_create_sequence(create)
+        options = self._sequence_options(create.element)
+        if options:
+            text += ' ' + ' '.join(options)
+        return text
+
+    def visit_truncate(self, truncate, **kw):
+        text = "TRUNCATE TABLE %s" % \
+                    self.preparer.format_table(truncate.element)
+        if truncate.reuse_storage:
+            text += " REUSE STORAGE"
+        else:
+            text += " DROP STORAGE"
+        if truncate.restrict_when_delete_triggers:
+            text += " RESTRICT WHEN DELETE TRIGGERS"
+        else:
+            text += " IGNORE DELETE TRIGGERS"
+        return text + " IMMEDIATE"
+
+    def visit_detach_partition(self, detach, **kw):
+        if isinstance(detach.into, sa_schema.Table):
+            into = self.preparer.format_table(detach.into)
+        else:
+            into = self.preparer.quote(detach.into, None)
+        return "ALTER TABLE %s DETACH PARTITION %s INTO %s" % (
+                    self.preparer.format_table(detach.element),
+                    self.preparer.quote(detach.partition, None),
+                    into)
+
+    def visit_declare_global_temporary_table(self, declare, **kw):
+        table = declare.element
+        text = "DECLARE GLOBAL TEMPORARY TABLE %s (\n\t%s\n)" % (
+                    self.preparer.format_table(table),
+                    ", \n\t".join(self.get_column_specification(column)
+                                    for column in table.columns))
+        if declare.on_commit_preserve_rows:
+            text += "\nON COMMIT PRESERVE ROWS"
+        else:
+            text += "\nON COMMIT DELETE ROWS"
+        if declare.not_logged:
+            text += " NOT LOGGED"
+        if declare.with_replace:
+            text += " WITH REPLACE"
+        tablespace = _dialect_option(table, 'tablespace')
+        if tablespace:
+            text += " IN %s" % self.preparer.quote(tablespace, None)
+        return text
+
+    def visit_create_materialized_query_table(self, create, **kw):
+        table = create.element
+        text = "CREATE TABLE %s" % self.preparer.format_table(table)
+        if len(table.columns):
+            text += " (%s)" % ", ".join(self.preparer.format_column(column)
+                                        for column in table.columns)
+        text += " AS (%s)\nDATA INITIALLY DEFERRED REFRESH %s" % (
+                    self.sql_compiler.process(create.select,
+                                              literal_binds=True),
+                    create.refresh.upper())
+        if create.enable_query_optimization:
+            text += " ENABLE QUERY OPTIMIZATION"
+        else:
+            text += " DISABLE QUERY OPTIMIZATION"
+        text += " MAINTAINED BY %s" % create.maintained_by.upper()
+        tablespace = _dialect_option(table, 'tablespace')
+        if tablespace:
+            text += " IN %s" % self.preparer.quote(tablespace, None)
+        return text
+
+    def visit_refresh_table(self, refresh, **kw):
+        text = "REFRESH TABLE %s" % \
+                    self.preparer.format_table(refresh.element)
+        if refresh.incremental is not None:
+            text += refresh.incremental and " INCREMENTAL" \
+                                        or " NOT INCREMENTAL"
+        return text
+
+    def visit_create_index(self, create, **kw):
+        index = create.element
+        text = super(DB2DDLCompiler, self).visit_create_index(create, **kw)
+
+        include = _dialect_option(index, 'include')
+        if include:
+            if not index.unique:
+                raise exc.CompileError(
+                        "INCLUDE columns are only allowed on a unique "
+                        "index; index %r is not unique" % index.name)
+            text += " INCLUDE (%s)" % \
+                        self._format_column_names(index.table, include)
+        if _dialect_option(index, 'cluster'):
+            text += " CLUSTER"
+        pctfree = _dialect_option(index, 'pctfree')
+        if pctfree is not None:
+            text += " PCTFREE %d" % pctfree
+        reverse_scans = _dialect_option(index, 'allow_reverse_scans')
+        if reverse_scans is not None:
+            text += reverse_scans and " ALLOW REVERSE SCANS" \
+                                    or " DISALLOW REVERSE SCANS"
+        compress = _dialect_option(index, 'compress')
+        if compress is not None:
+            text += compress and " COMPRESS YES" or " COMPRESS NO"
+        return text
+
     def visit_drop_index(self, drop, **kw):
         return "\nDROP INDEX %s" % (
                         self.preparer.quote(
@@ -427,32 +878,327 @@ class DB2IdentifierPreparer(compiler.IdentifierPreparer):
 
 
 class DB2ExecutionContext(default.DefaultExecutionContext):
-    pass
+    _result_cache_key = None
+    _result_cache_tables = None
+    _result_cache_stamp = None
+    _cached_result = None
+
+    # set to the batch size when the statement is held back for a
+    # compound batch, and whether its rowcount is checked there; see
+    # compound.py
+    _compound_batch_size = 0
+    _compound_check_rowcount = False
+
+    # keys of the OUT and INOUT parameters of a CALL, in order
+    _out_parameter_keys = ()
+
+    # set when the driver applies the timeout execution option itself;
+    # see watchdog.py
+    _native_timeout = False
+
+    def create_cursor(self):
+        for option, key, set_register in _SPECIAL_REGISTERS:
+            if option in self.execution_options:
+                self._set_register(key, self.execution_options[option],
+                                   set_register)
+        cursor = super(DB2ExecutionContext, self).create_cursor()
+        if self.isinsert and self.compiled._sequence_column is not None:
+            # the parameters are complete but not yet processed for the
+            # DBAPI; fill in the values drawn from the allocator
+            self.cursor = cursor
+            column = self.compiled._sequence_column
+            for parameters in self.compiled_parameters:
+                if parameters.get(column.key) is None:
+                    parameters[column.key] = self.fire_sequence(
+                                                column.default, column.type)
+        return cursor
 
+    def pre_exec(self):
+        if self.compiled is not None and \
+                isinstance(self.compiled.statement, ibm_dml.Call):
+            binds = self.compiled.binds
+            self._out_parameter_keys = [key
+                            for key in self.compiled.positiontup
+                            if binds[key].isoutparam]
+
+        result_cache = self.dialect.result_cache
+        if result_cache is not None and \
+                not self.executemany and \
+                self.execution_options.get('result_cache', False) and \
+                isinstance(self.compiled.statement, expression.SelectBase):
+            self._lookup_result_cache(result_cache)
+
+        size = ibm_compound.batch_size(
+                    self.execution_options.get('compound_dml',
+                                                self.dialect.compound_dml),
+                    self.dialect.compound_dml or
+                                ibm_compound.DEFAULT_BATCH_SIZE)
+        if size and self._can_defer_to_compound():
+            self._compound_batch_size = size
+
+    def _lookup_result_cache(self, result_cache):
+        connection = self.root_connection.connection
+        identity = self.dialect._result_cache_identity(connection)
+        tables = ibm_cache.tables_for_statement(self.compiled.statement,
+                                                identity[0])
+        # the connection's own uncommitted writes aren't to be shared
+        written = self.dialect._result_cache_writes.get(
+                    ibm_compound.raw_connection(connection), frozenset())
+        if written is None or tables & written:
+            return
+        key = result_cache.key(identity, self.statement, self.parameters[0])
+        if key is None:
+            return
+        self._cached_result = result_cache.get(key)
+        if self._cached_result is None:
+            self._result_cache_key = key
+            self._result_cache_tables = tables
+            self._result_cache_stamp = result_cache.stamp(tables)
+
+    def _set_register(self, key, value, set_register):
+        """Set a special register of the connection with
+        ``set_register(dbapi_connection, value)``, unless it is known to
+        have the value already; see :meth:`.DB2Dialect._on_checkin`."""
+
+        connection = self.root_connection.connection
+        info = connection.info
+        if key in info and info[key] == value:
+            return
+        if self.dialect._compound_batches:
+            # statements held back run under the register as it was
+            self.dialect._flush_compound(connection)
+        set_register(connection, value)
+        info[key] = value
+
+    def _timeout_cancel(self, cursor):
+        """Return the function the watchdog calls to cancel the
+        statement."""
+
+        cancel = getattr(cursor, 'cancel', None)
+        if cancel is None:
+            # cancel the statement's activity from another connection
+            connection = self.root_connection.connection
+            handle = connection.info.get(
+                            ibm_watchdog.APPLICATION_HANDLE_KEY)
+            if handle is None:
+                handle = connection.info[
+                            ibm_watchdog.APPLICATION_HANDLE_KEY] = \
+                                ibm_watchdog.application_handle(connection)
+            # the pool's connect function, for a connection outside the
+            # pool; see Watchdog.cancel_activity()
+            connect = self.root_connection.engine.pool._creator
+            watchdog = self.dialect.watchdog
+
+            def cancel():
+                watchdog.cancel_activity(connect, handle)
+        return cancel
 
-class _SelectLastRowIDMixin(object):
-    _select_lastrowid = False
-    _lastrowid = None
+    def post_exec(self):
+        super(DB2ExecutionContext, self).post_exec()
+        if self.isddl:
+            self.dialect._reflector.forget_foreign_keys(
+                                                self.root_connection)
+        maintenance = self.dialect.maintenance
+        if maintenance is not None and \
+                (self.isinsert or self.isupdate or self.isdelete):
+            rows = self.rowcount
+            if self.executemany or rows is None or rows < 0:
+                rows = max(rows, len(self.parameters))
+            table = self.compiled.statement.table
+            maintenance.record(self._dbapi_connection, (
+                    self.dialect.denormalize_name(
+                        table.schema or self.dialect.default_schema_name),
+                    self.dialect.denormalize_name(table.name)), rows)
 
     def fire_sequence(self, seq, type_):
+        allocator = self.dialect._sequence_allocator
+        if allocator is not None:
+            return allocator.next_value(
+                        (seq.schema, seq.name),
+                        lambda size: self._fetch_sequence_block(
+                                                    seq, type_, size))
         return self._execute_scalar("SELECT NEXTVAL FOR " +
                     self.dialect.identifier_preparer.format_sequence(seq) +
                     " FROM SYSIBM.SYSDUMMY1", type_)
 
-    def getlastrowid(self):
+    def _fetch_sequence_block(self, seq, type_, size):
+        # a recursive common table expression generates "size" rows,
+        # each of which draws its own NEXTVAL in the same round trip
+        stmt = "WITH SEQ_BLOCK(N) AS (" \
+                    "SELECT 1 FROM SYSIBM.SYSDUMMY1 UNION ALL " \
+                    "SELECT N + 1 FROM SEQ_BLOCK WHERE N < %d) " \
+                "SELECT NEXTVAL FOR %s FROM SEQ_BLOCK" % (
+                    size,
+                    self.dialect.identifier_preparer.format_sequence(seq))
+        if isinstance(stmt, unicode) and \
+                not self.dialect.supports_unicode_statements:
+            stmt = self.dialect._encoder(stmt)[0]
+
+        if self.dialect.positional:
+            default_params = self.dialect.execute_sequence_format()
+        else:
+            default_params = {}
+
+        conn = self.root_connection
+        conn._cursor_execute(self.cursor, stmt, default_params, self)
+        values = [row[0] for row in self.cursor.fetchall()]
+        if type_ is not None:
+            proc = type_._cached_result_processor(
+                        self.dialect, self.cursor.description[0][1])
+            if proc:
+                values = [proc(value) for value in values]
+        values.sort(reverse=(seq.increment or 1) < 0)
+        return values
+
+    def _can_defer_to_compound(self):
+        # only the ORM's unit of work expects one row per parameter set
+        if not (self.isinsert or self.isupdate or self.isdelete) or \
+                self.compiled.returning or \
+                not ibm_compound.in_flush(self.root_connection):
+            return False
+        statement = self.compiled.statement
+        if self.isinsert:
+            # the primary key must be known without asking the database
+            primary_key = statement.table.primary_key
+            if not len(primary_key) or statement._has_multi_parameters:
+                return False
+            for params in self.compiled_parameters:
+                for column in primary_key:
+                    if params.get(column.key) is None:
+                        return False
+            return True
+        columns = ibm_compound.key_criteria(statement)
+        if columns is None:
+            return False
+        self._compound_check_rowcount = self.isupdate or \
+                    len(columns) > len(statement.table.primary_key)
+        return True
+
+    @property
+    def rowcount(self):
+        if self._compound_batch_size:
+            return len(self.parameters)
+        return self.cursor.rowcount
+
+    def get_result_proxy(self):
+        if self.compiled is not None and \
+                isinstance(self.compiled.statement, ibm_dml.Call):
+            result = ibm_result.CallResultProxy(self)
+            if self._out_parameter_keys:
+                result.out_parameters = self.out_parameters
+            return result
+
+        if self._cached_result is not None:
+            return ibm_cache.CachedResultProxy(self, self._cached_result)
+        elif self._result_cache_key is not None:
+            return ibm_cache.CachingResultProxy(self)
+
+        # compact_rows=True uses the default block size, an integer
+        # value sets the number of rows fetched and processed at once
+        compact_rows = self.execution_options.get('compact_rows', False)
+        if compact_rows is True:
+            return ibm_result.CompactRowResultProxy(self)
+        elif compact_rows:
+            return ibm_result.CompactRowResultProxy(self,
+                                        block_size=int(compact_rows))
+
+        # prefetch_rows=True or a block size fetches the next
+        # prefetch_blocks blocks in the background
+        prefetch_rows = self.execution_options.get('prefetch_rows', False)
+        if prefetch_rows:
+            return ibm_result.PrefetchResultProxy(self,
+                    block_size=prefetch_rows is not True and
+                                    int(prefetch_rows) or None,
+                    queue_depth=int(
+                        self.execution_options.get('prefetch_blocks', 2)))
+        return super(DB2ExecutionContext, self).get_result_proxy()
+
+
+class SequenceAllocator(object):
+    """Hands out sequence values from blocks fetched in a single statement.
+
+    Each sequence gets its own block of pre-fetched values, guarded by
+    its own lock, so that concurrent inserts against different sequences
+    don't serialize on each other.  As with the DB2 ``CACHE`` clause,
+    values left over in a block when the process ends are never used,
+    leaving gaps in the sequence.
+
+    """
+
+    def __init__(self, block_size):
+        if block_size < 1:
+            raise ValueError("block_size must be a positive integer")
+        self.block_size = block_size
+        self._blocks = {}
+        self._locks = {}
+        self._mutex = threading.Lock()
+
+    def _lock_for(self, key):
+        self._mutex.acquire()
+        try:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+        finally:
+            self._mutex.release()
+
+    def next_value(self, key, fetch_block):
+        """Return the next value for the sequence identified by ``key``.
+
+        ``fetch_block`` is called with the block size when the local
+        block is exhausted, and must return a list of new values in the
+        order they should be handed out.
+
+        """
+        lock = self._lock_for(key)
+        lock.acquire()
+        try:
+            block = self._blocks.get(key)
+            if not block:
+                block = self._blocks[key] = \
+                            collections.deque(fetch_block(self.block_size))
+            return block.popleft()
+        finally:
+            lock.release()
+
+    def discard(self, key=None):
+        """Discard pre-fetched values, for one sequence or for all."""
+
+        self._mutex.acquire()
+        try:
+            if key is None:
+                self._blocks.clear()
+            else:
+                self._blocks.pop(key, None)
+        finally:
+            self._mutex.release()
+
+
+class _SelectLastRowIDMixin(object):
+    _select_lastrowid = False
+    _lastrowid = None
+
+    def get_lastrowid(self):
         return self._lastrowid
 
     def pre_exec(self):
+        super(_SelectLastRowIDMixin, self).pre_exec()
         if self.isinsert:
             tbl = self.compiled.statement.table
             seq_column = tbl._autoincrement_column
             insert_has_sequence = seq_column is not None
 
+            prefetched = seq_column is self.compiled._sequence_column
+
             self._select_lastrowid = insert_has_sequence and \
+                                        not prefetched and \
                                         not self.compiled.returning and \
-                                        not self.compiled.inline
+                                        not self.compiled.inline and \
+                                        not self._compound_batch_size
 
     def post_exec(self):
+        super(_SelectLastRowIDMixin, self).post_exec()
         conn = self.root_connection
         if self._select_lastrowid:
             conn._cursor_execute(self.cursor,
@@ -463,6 +1209,26 @@ class _SelectLastRowIDMixin(object):
                 self._lastrowid = int(row[0])
 
 
+class DB2Inspector(reflection.Inspector):
+
+    def get_table_names(self, schema=None, order_by=None):
+        """Return the table names of a schema; ``order_by='foreign_key'``
+        orders them by dependency from the schema's foreign key graph,
+        loaded in one catalog query."""
+
+        if order_by == 'foreign_key':
+            return self.dialect.get_sorted_table_names(
+                        self.bind, schema, info_cache=self.info_cache)
+        return super(DB2Inspector, self).get_table_names(schema, order_by)
+
+    def get_foreign_key_graph(self, schema=None):
+        """Return the foreign keys of every table in a schema; see
+        :meth:`.BaseReflector.get_foreign_key_graph`."""
+
+        return self.dialect.get_foreign_key_graph(
+                        self.bind, schema, info_cache=self.info_cache)
+
+
 class DB2Dialect(default.DefaultDialect):
 
     name = 'db2'
@@ -489,14 +1255,319 @@ class DB2Dialect(default.DefaultDialect):
     type_compiler = DB2TypeCompiler
     preparer = DB2IdentifierPreparer
     execution_ctx_cls = DB2ExecutionContext
+    inspector = DB2Inspector
 
     _reflector_cls = ibm_reflection.DB2Reflector
-
-    def __init__(self, **kw):
+    _sequence_allocator = None
+    result_cache = None
+    maintenance = None
+    in_list_buckets = False
+    in_list_max_bucket = 1024
+    # DB2's limit of parameter markers in a statement
+    in_list_max_length = 32767
+    compound_dml = 0
+    compound_dml_atomic = True
+
+    # Python type the driver returns DECIMAL values as; determined on
+    # first connect unless given with native_decimal
+    _decimal_result_type = None
+
+    def __init__(self, sequence_block_size=None, result_cache_size=None,
+                        result_cache_ttl=None, in_list_buckets=False,
+                        in_list_max_bucket=None, in_list_max_length=None,
+                        native_decimal=None,
+                        compound_dml=False, compound_dml_atomic=True,
+                        runstats_rows=None, runstats_ratio=None,
+                        reorg_check=False, maintenance_async=False, **kw):
         super(DB2Dialect, self).__init__(**kw)
 
+        if native_decimal is not None:
+            self._set_decimal_result_type(
+                    util.asbool(native_decimal) and decimal.Decimal or float)
+
         self._reflector = self._reflector_cls(self)
 
+        # when set, sequences fired ahead of an INSERT draw their values
+        # from blocks of this size, fetched in one round trip each
+        if sequence_block_size:
+            self._sequence_allocator = \
+                        SequenceAllocator(int(sequence_block_size))
+
+        # results of statements run with the "result_cache" execution
+        # option are kept in memory up to this many bytes
+        if result_cache_size:
+            self.result_cache = ibm_cache.ResultCache(
+                        int(result_cache_size),
+                        float(result_cache_ttl) if result_cache_ttl else None)
+            # table keys written in the current transaction per DBAPI
+            # connection, None if unknown; see cache.py
+            self._result_cache_writes = {}
+
+        # IN lists of bound values are padded to a power of two in
+        # length, or to a multiple of in_list_max_bucket beyond that, up
+        # to in_list_max_length values; longer lists are refused.
+        # in_list_shapes counts compilations by padded length
+        self.in_list_buckets = util.asbool(in_list_buckets)
+        if in_list_max_bucket:
+            self.in_list_max_bucket = int(in_list_max_bucket)
+        if in_list_max_length:
+            self.in_list_max_length = int(in_list_max_length)
+        self.in_list_shapes = collections.defaultdict(int)
+        self._in_list_shapes_mutex = threading.Lock()
+
+        # DML statements are held back and sent in compound batches of
+        # up to this many; batches pending per DBAPI connection
+        self.compound_dml = ibm_compound.batch_size(compound_dml)
+        self.compound_dml_atomic = util.asbool(compound_dml_atomic)
+        self._compound_batches = {}
+
+        # cancels statements past their timeout execution option
+        self.watchdog = ibm_watchdog.Watchdog()
+
+        # rows written per table are counted, and statistics collected
+        # again after this many; see maintenance.py
+        if runstats_rows:
+            self.maintenance = ibm_maintenance.MaintenanceTracker(
+                        int(runstats_rows),
+                        float(runstats_ratio) if runstats_ratio else None,
+                        util.asbool(reorg_check),
+                        util.asbool(maintenance_async))
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        # special registers set with execution options go back to their
+        # defaults before the connection is reused
+        if dbapi_connection is None:
+            return
+        info = connection_record.info
+        info.pop(ibm_compound.SESSION_KEY, None)
+        if self._compound_batches:
+            try:
+                self._flush_compound(dbapi_connection)
+            except Exception, e:
+                connection_record.invalidate(e)
+                return
+        # temporary tables staged on the connection are dropped, after
+        # the statements held back which may use them
+        try:
+            ibm_staging.checkin(self, dbapi_connection, info)
+        except Exception, e:
+            connection_record.invalidate(e)
+            return
+        for option, key, set_register in _SPECIAL_REGISTERS:
+            if info.pop(key, None) is not None:
+                try:
+                    set_register(dbapi_connection, None)
+                except Exception, e:
+                    connection_record.invalidate(e)
+                    return
+        # and tables past the thresholds are maintained outside of the
+        # COMMIT; see maintenance.py
+        if self.maintenance is not None:
+            self.maintenance.checkin(dbapi_connection)
+
+    def _count_in_list_shape(self, length):
+        # statements are compiled concurrently by the threads sharing
+        # the dialect
+        self._in_list_shapes_mutex.acquire()
+        try:
+            self.in_list_shapes[length] += 1
+        finally:
+            self._in_list_shapes_mutex.release()
+
+    def _set_decimal_result_type(self, result_type):
+        self._decimal_result_type = result_type
+        self.supports_native_decimal = result_type is decimal.Decimal
+
+    def initialize(self, connection):
+        super(DB2Dialect, self).initialize(connection)
+        event.listen(connection.engine.pool, 'checkin', self._on_checkin)
+        if self._decimal_result_type is None:
+            value = connection.scalar("SELECT CAST(1.5 AS DECIMAL(5, 2)) "
+                                      "FROM SYSIBM.SYSDUMMY1")
+            if isinstance(value, decimal.Decimal):
+                self._set_decimal_result_type(decimal.Decimal)
+            elif isinstance(value, basestring):
+                self._set_decimal_result_type(str)
+            else:
+                self._set_decimal_result_type(float)
+
+    def _result_cache_identity(self, connection):
+        # the (CURRENT SCHEMA, CURRENT USER) of a connection, looked up
+        # once per pooled connection; the dialect's first connection
+        # isn't pooled yet
+        info = getattr(connection, 'info', {})
+        if ibm_cache.IDENTITY_KEY not in info:
+            if self._compound_batches:
+                self._flush_compound(connection)
+            cursor = ibm_compound.raw_connection(connection).cursor()
+            try:
+                cursor.execute(ibm_cache.IDENTITY)
+                info[ibm_cache.IDENTITY_KEY] = tuple(value.strip().lower()
+                                            for value in cursor.fetchone())
+            finally:
+                cursor.close()
+        return info[ibm_cache.IDENTITY_KEY]
+
+    def _note_result_cache_writes(self, context, statement):
+        """Note the tables a statement writes to, for their cached results
+        to be discarded when the transaction ends."""
+
+        if context is None:
+            return
+        connection = context.root_connection.connection
+        if ibm_cache.sets_identity(statement):
+            connection.info.pop(ibm_cache.IDENTITY_KEY, None)
+        written = ibm_cache.tables_written(context.compiled, statement,
+                            self._result_cache_identity(connection)[0])
+        if written is not None and not written:
+            return
+        key = ibm_compound.raw_connection(connection)
+        pending = self._result_cache_writes.get(key, frozenset())
+        if written is None or pending is None:
+            self._result_cache_writes[key] = None
+        else:
+            self._result_cache_writes[key] = pending | written
+
+    def _end_result_cache_transaction(self, dbapi_connection):
+        key = ibm_compound.raw_connection(dbapi_connection)
+        if key not in self._result_cache_writes:
+            return
+        written = self._result_cache_writes.pop(key)
+        if written is None:
+            self.result_cache.clear()
+        else:
+            self.result_cache.invalidate(written)
+
+    def _defer_to_compound(self, context, statement, parameters):
+        connection = ibm_compound.raw_connection(context._dbapi_connection)
+        batch = self._compound_batches.get(connection)
+        if batch is None:
+            batch = self._compound_batches[connection] = \
+                        ibm_compound.CompoundBatch(self.compound_dml_atomic)
+        batch.add(statement, parameters, context._compound_check_rowcount)
+        if len(batch) >= context._compound_batch_size:
+            self._flush_compound(connection)
+
+    def _flush_compound(self, connection):
+        connection = ibm_compound.raw_connection(connection)
+        batch = self._compound_batches.pop(connection, None)
+        if batch is not None:
+            batch.execute(connection)
+
+    def _discard_compound(self, connection):
+        self._compound_batches.pop(
+                    ibm_compound.raw_connection(connection), None)
+
+    def _do_call(self, cursor, statement, parameters, context):
+        """Run a CALL having OUT or INOUT parameters, setting
+        ``context.out_parameters``; needs driver support."""
+
+        raise exc.InvalidRequestError(
+                "The %s driver can't return the OUT parameters of a "
+                "CALL" % self.driver)
+
+    def _process_out_parameters(self, context, values):
+        binds = context.compiled.binds
+        out_parameters = {}
+        for key, value in zip(context.compiled.positiontup, values):
+            if key not in context._out_parameter_keys:
+                continue
+            processor = binds[key].type.dialect_impl(self).\
+                                result_processor(self, None)
+            if processor is not None:
+                value = processor(value)
+            out_parameters[key] = value
+        context.out_parameters = out_parameters
+
+    def _watch_timeout(self, cursor, context):
+        # the watch on a statement run with the timeout execution
+        # option, to be passed to watchdog.unwatch() once it has run
+        timeout = context is not None and \
+                    context.execution_options.get('timeout')
+        if not timeout or context._native_timeout:
+            return None
+        return self.watchdog.watch(float(timeout),
+                                   context._timeout_cancel(cursor))
+
+    def do_execute(self, cursor, statement, parameters, context=None):
+        if context is not None and context._cached_result is not None:
+            return
+        if context is not None and context._compound_batch_size:
+            self._defer_to_compound(context, statement, [parameters])
+        else:
+            if context is not None and self._compound_batches:
+                self._flush_compound(context._dbapi_connection)
+            watch = self._watch_timeout(cursor, context)
+            try:
+                if context is not None and context._out_parameter_keys:
+                    self._do_call(cursor, statement, parameters, context)
+                else:
+                    super(DB2Dialect, self).do_execute(
+                                cursor, statement, parameters, context)
+            finally:
+                if watch is not None:
+                    self.watchdog.unwatch(watch)
+        if self.result_cache is not None:
+            self._note_result_cache_writes(context, statement)
+
+    def do_execute_no_params(self, cursor, statement, context=None):
+        if context is not None and context._cached_result is not None:
+            return
+        if context is not None and self._compound_batches:
+            self._flush_compound(context._dbapi_connection)
+        watch = self._watch_timeout(cursor, context)
+        try:
+            super(DB2Dialect, self).do_execute_no_params(
+                                cursor, statement, context)
+        finally:
+            if watch is not None:
+                self.watchdog.unwatch(watch)
+        if self.result_cache is not None:
+            self._note_result_cache_writes(context, statement)
+
+    def do_executemany(self, cursor, statement, parameters, context=None):
+        if context is not None and context._compound_batch_size:
+            self._defer_to_compound(context, statement, parameters)
+        else:
+            if context is not None and self._compound_batches:
+                self._flush_compound(context._dbapi_connection)
+            watch = self._watch_timeout(cursor, context)
+            try:
+                super(DB2Dialect, self).do_executemany(
+                                cursor, statement, parameters, context)
+            finally:
+                if watch is not None:
+                    self.watchdog.unwatch(watch)
+        if self.result_cache is not None:
+            self._note_result_cache_writes(context, statement)
+
+    def do_commit(self, dbapi_connection):
+        if self._compound_batches:
+            self._flush_compound(dbapi_connection)
+        super(DB2Dialect, self).do_commit(dbapi_connection)
+        if self.result_cache is not None:
+            self._end_result_cache_transaction(dbapi_connection)
+        if self.maintenance is not None:
+            self.maintenance.commit(dbapi_connection)
+
+    def do_rollback(self, dbapi_connection):
+        if self._compound_batches:
+            self._discard_compound(dbapi_connection)
+        if self.maintenance is not None:
+            self.maintenance.rollback(dbapi_connection)
+        super(DB2Dialect, self).do_rollback(dbapi_connection)
+        if self.result_cache is not None:
+            self._end_result_cache_transaction(dbapi_connection)
+
+    def do_close(self, dbapi_connection):
+        if self._compound_batches:
+            self._discard_compound(dbapi_connection)
+        if self.maintenance is not None:
+            self.maintenance.close(dbapi_connection)
+        if self.result_cache is not None:
+            self._end_result_cache_transaction(dbapi_connection)
+        super(DB2Dialect, self).do_close(dbapi_connection)
+
     # reflection: these all defer to an BaseDB2Reflector
     # object which selects between DB2 and AS/400 schemas
 
@@ -516,6 +1587,11 @@ class DB2Dialect(default.DefaultDialect):
         return self._reflector.has_sequence(connection, sequence_name,
                         schema=schema)
 
+    def get_sequence_options(self, connection, sequence_name, schema=None,
+                                                                    **kw):
+        return self._reflector.get_sequence_options(
+                                connection, sequence_name, schema=schema, **kw)
+
     def get_schema_names(self, connection, **kw):
         return self._reflector.get_schema_names(connection, **kw)
 
@@ -530,6 +1606,10 @@ class DB2Dialect(default.DefaultDialect):
         return self._reflector.get_view_definition(
                                 connection, viewname, schema=schema, **kw)
 
+    def get_table_options(self, connection, table_name, schema=None, **kw):
+        return self._reflector.get_table_options(
+                                connection, table_name, schema=schema, **kw)
+
     def get_columns(self, connection, table_name, schema=None, **kw):
         return self._reflector.get_columns(
                                 connection, table_name, schema=schema, **kw)
@@ -542,7 +1622,37 @@ class DB2Dialect(default.DefaultDialect):
         return self._reflector.get_foreign_keys(
                                 connection, table_name, schema=schema, **kw)
 
+    def get_foreign_key_graph(self, connection, schema=None, **kw):
+        return self._reflector.get_foreign_key_graph(
+                                connection, schema=schema, **kw)
+
+    def get_sorted_table_names(self, connection, schema=None, **kw):
+        return self._reflector.get_sorted_table_names(
+                                connection, schema=schema, **kw)
+
     def get_indexes(self, connection, table_name, schema=None, **kw):
         return self._reflector.get_indexes(
                                 connection, table_name, schema=schema, **kw)
 
+    def get_table_statistics(self, connection, schema=None, **kw):
+        return self._reflector.get_table_statistics(
+                                connection, schema=schema, **kw)
+
+    def get_index_statistics(self, connection, schema=None, **kw):
+        return self._reflector.get_index_statistics(
+                                connection, schema=schema, **kw)
+
+    def get_approximate_row_count(self, connection, table_name, schema=None,
+                                                                    **kw):
+        return self._reflector.get_approximate_row_count(
+                                connection, table_name, schema=schema, **kw)
+
+    def get_materialized_query_tables(self, connection, schema=None, **kw):
+        return self._reflector.get_materialized_query_tables(
+                                connection, schema=schema, **kw)
+
+    def get_materialized_query_table_names(self, connection, schema=None,
+                                                                    **kw):
+        return self._reflector.get_materialized_query_table_names(
+                                connection, schema=schema, **kw)
+
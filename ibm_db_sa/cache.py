@@ -0,0 +1,341 @@
+# +--------------------------------------------------------------------------+
+# |  Licensed Materials - Property of IBM                                    |
+# |                                                                          |
+# | (C) Copyright IBM Corporation 2008.                                      |
+# +--------------------------------------------------------------------------+
+# | This module complies with SQLAlchemy 0.8 and is                          |
+# | Licensed under the Apache License, Version 2.0 (the "License");          |
+# | you may not use this file except in compliance with the License.         |
+# | You may obtain a copy of the License at                                  |
+# | http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable |
+# | law or agreed to in writing, software distributed under the License is   |
+# | distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY |
+# | KIND, either express or implied. See the License for the specific        |
+# | language governing permissions and limitations under the License.        |
+# +--------------------------------------------------------------------------+
+# | Version: 0.3.x                                                           |
+# +--------------------------------------------------------------------------+
+"""Result caching for repeated read-only queries.
+
+The cache is enabled per engine with the ``result_cache_size`` (bytes)
+and ``result_cache_ttl`` (seconds) arguments to ``create_engine()``, and
+per statement with the ``result_cache`` execution option::
+
+    e = create_engine("db2+ibm_db://...", result_cache_size=64 * 1024 * 1024)
+
+    rows = conn.execution_options(result_cache=True).\\
+                execute(select([lookup_table])).fetchall()
+
+Results are keyed on the statement, its parameters and the
+connection's ``CURRENT SCHEMA`` and ``CURRENT USER``, and indexed by the
+schema-qualified tables they select from.  The tables written through
+the dialect by INSERT, UPDATE, DELETE, MERGE, TRUNCATE or ALTER TABLE
+are noted per DBAPI connection, and the results selecting from them are
+discarded when the transaction ends; other statements which may write,
+such as DDL and CALL, discard the whole cache.  Until then the writing
+connection itself doesn't use the cache for those tables.  A result
+fetched while a transaction invalidating its tables was ending is not
+stored.  Writes made outside the dialect, and writes to the tables
+underlying a view, are only caught by ``result_cache_ttl``.
+
+"""
+import collections
+import re
+import sys
+import threading
+import time
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from sqlalchemy.util import OrderedDict
+
+from sqlalchemy.engine.result import FullyBufferedResultProxy
+from sqlalchemy.sql import expression
+from sqlalchemy.sql import util as sql_util
+
+from .routing import is_read_only
+
+
+IDENTITY = "SELECT CURRENT_SCHEMA, CURRENT_USER FROM SYSIBM.SYSDUMMY1"
+
+# key of the pool's per-connection info dictionary holding the
+# connection's (CURRENT SCHEMA, CURRENT USER)
+IDENTITY_KEY = 'db2_result_cache_identity'
+
+_DML_TARGET = re.compile(
+        r'\s*(?:INSERT\s+INTO|UPDATE|MERGE\s+INTO|ALTER\s+TABLE|'
+        r'DELETE\s+FROM(?:\s*\(\s*SELECT\s.*?\sFROM)?|'
+        r'TRUNCATE(?:\s+TABLE)?)\s+((?:"[^"]+"|[^\s(."]+)'
+        r'(?:\s*\.\s*(?:"[^"]+"|[^\s(."]+))?)', re.I | re.S)
+
+_NAME_PART = re.compile(r'"[^"]+"|[^\s."]+')
+
+# special register assignments
+_SET = re.compile(r'\s*SET\s', re.I)
+
+# assignments changing the schema or user of later statements
+_SET_IDENTITY = re.compile(
+        r'\s*SET\s+(?:CURRENT\s+)?(?:SCHEMA|SQLID|PATH|'
+        r'SESSION\s+AUTHORIZATION|SESSION_USER)\b', re.I)
+
+
+def table_key(schema, name):
+    """Return the key of a table, lower case for case insensitivity."""
+
+    return (schema.strip().strip('"').lower(), name.strip().strip('"').lower())
+
+
+def tables_for_statement(statement, schema):
+    """Return the keys of the tables a compiled Core statement selects
+    from; tables without a schema are in ``schema``."""
+
+    return frozenset(table_key(t.schema or schema, t.name)
+                        for t in sql_util.find_tables(statement))
+
+
+def tables_written(compiled, statement, schema):
+    """Return the keys of the tables a statement may write to, empty for
+    queries, or None if they can't be told."""
+
+    if compiled is not None:
+        if compiled.isinsert or compiled.isupdate or compiled.isdelete:
+            table = compiled.statement.table
+            return frozenset([table_key(table.schema or schema, table.name)])
+        elif isinstance(compiled.statement, expression.SelectBase):
+            return frozenset()
+    if is_read_only(statement) or _SET.match(statement):
+        return frozenset()
+    m = _DML_TARGET.match(statement)
+    if m is None:
+        return None
+    name = _NAME_PART.findall(m.group(1))
+    if len(name) == 1:
+        return frozenset([table_key(schema, name[0])])
+    return frozenset([table_key(*name)])
+
+
+def sets_identity(statement):
+    """Return True if a statement may change the connection's schema or
+    user."""
+
+    return bool(_SET_IDENTITY.match(statement))
+
+
+def _freeze(parameters):
+    if isinstance(parameters, dict):
+        return tuple(sorted(parameters.items()))
+    else:
+        return tuple(parameters)
+
+
+def _estimate_size(description, rows):
+    size = sys.getsizeof(rows) + sys.getsizeof(description)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+
+class _CacheEntry(object):
+    __slots__ = ('description', 'rows', 'tables', 'size', 'expires')
+
+    def __init__(self, description, rows, tables, size, expires):
+        self.description = description
+        self.rows = rows
+        self.tables = tables
+        self.size = size
+        self.expires = expires
+
+
+class ResultCache(object):
+    """A memory-bounded LRU cache of fully fetched result rows.
+
+    Entries are keyed on statement string and bound parameters, expire
+    ``ttl`` seconds after they are stored, and are indexed by the tables
+    they select from so that writes can invalidate them.
+
+    Each table has a generation, advanced when it is invalidated; a
+    result is stored only if the generations of its tables are those
+    :meth:`stamp` returned before the statement ran.
+
+    """
+
+    def __init__(self, max_bytes, ttl=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.memory_used = 0
+        self.hits = self.misses = 0
+        self.evictions = self.invalidations = 0
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._generation = 0
+        self._generations = {}
+        self._mutex = threading.Lock()
+
+    def key(self, identity, statement, parameters):
+        """Return a cache key, or None if the parameters aren't hashable."""
+
+        key = (identity, statement, _freeze(parameters))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key):
+        self._mutex.acquire()
+        try:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry.expires is not None and \
+                    entry.expires < time.time():
+                self._discard(key, entry)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            # re-insert to mark as most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return entry
+        finally:
+            self._mutex.release()
+
+    def stamp(self, tables):
+        """Return the current generations of the given table keys."""
+
+        self._mutex.acquire()
+        try:
+            return self._stamp(tables)
+        finally:
+            self._mutex.release()
+
+    def _stamp(self, tables):
+        return (self._generation, ) + \
+                    tuple(self._generations.get(table, 0)
+                                for table in sorted(tables))
+
+    def put(self, key, tables, stamp, description, rows):
+        size = _estimate_size(description, rows)
+        if size > self.max_bytes:
+            return
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        else:
+            expires = None
+        entry = _CacheEntry(description, rows, tables, size, expires)
+
+        self._mutex.acquire()
+        try:
+            if self._stamp(tables) != stamp:
+                # invalidated while the statement ran
+                return
+            existing = self._entries.pop(key, None)
+            if existing is not None:
+                self._discard(key, existing)
+            while self._entries and \
+                    self.memory_used + size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest, self._entries.pop(oldest))
+                self.evictions += 1
+            self._entries[key] = entry
+            self.memory_used += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+        finally:
+            self._mutex.release()
+
+    def invalidate(self, tables):
+        """Discard all entries which select from any of the given table
+        keys."""
+
+        self._mutex.acquire()
+        try:
+            for table in tables:
+                self._generations[table] = \
+                                self._generations.get(table, 0) + 1
+                for key in self._by_table.pop(table, ()):
+                    entry = self._entries.pop(key, None)
+                    if entry is not None:
+                        self._discard(key, entry)
+                        self.invalidations += 1
+        finally:
+            self._mutex.release()
+
+    def clear(self):
+        self._mutex.acquire()
+        try:
+            self.invalidations += len(self._entries)
+            self._generation += 1
+            self._generations.clear()
+            self._entries.clear()
+            self._by_table.clear()
+            self.memory_used = 0
+        finally:
+            self._mutex.release()
+
+    def _discard(self, key, entry):
+        # entry has already been removed from self._entries
+        self.memory_used -= entry.size
+        for table in entry.tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return float(self.hits) / total
+
+    def stats(self):
+        """Return a dictionary of cache counters and memory use."""
+
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hit_ratio,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'memory_used': self.memory_used,
+            'max_bytes': self.max_bytes,
+        }
+
+
+class CachedResultProxy(FullyBufferedResultProxy):
+    """ResultProxy delivering rows from a cache entry; the statement
+    itself is never sent to the database."""
+
+    def __init__(self, context, entry):
+        self._entry = entry
+        super(CachedResultProxy, self).__init__(context)
+
+    def _cursor_description(self):
+        return self._entry.description
+
+    def _buffer_rows(self):
+        return collections.deque(self._entry.rows)
+
+
+class CachingResultProxy(FullyBufferedResultProxy):
+    """ResultProxy which fully fetches its rows and stores them in the
+    dialect's result cache."""
+
+    def _buffer_rows(self):
+        context = self.context
+        rows = [tuple(row) for row in self.cursor.fetchall()]
+        description = self._cursor_description()
+        if description is not None:
+            context.dialect.result_cache.put(
+                    context._result_cache_key,
+                    context._result_cache_tables,
+                    context._result_cache_stamp,
+                    tuple(tuple(d) for d in description),
+                    rows)
+        return collections.deque(rows)
+
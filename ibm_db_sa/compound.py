@@ -0,0 +1,197 @@
+# +--------------------------------------------------------------------------+
+# |  Licensed Materials - Property of IBM                                    |
+# |                                                                          |
+# | (C) Copyright IBM Corporation 2008.                                      |
+# +--------------------------------------------------------------------------+
+# | This module complies with SQLAlchemy 0.8 and is                          |
+# | Licensed under the Apache License, Version 2.0 (the "License");          |
+# | you may not use this file except in compliance with the License.         |
+# | You may obtain a copy of the License at                                  |
+# | http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable |
+# | law or agreed to in writing, software distributed under the License is   |
+# | distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY |
+# | KIND, either express or implied. See the License for the specific        |
+# | language governing permissions and limitations under the License.        |
+# +--------------------------------------------------------------------------+
+# | Version: 0.3.x                                                           |
+# +--------------------------------------------------------------------------+
+"""Batching of DML statements into compound SQL.
+
+Enabled per engine with the ``compound_dml`` argument to
+``create_engine()``, or per connection with the ``compound_dml``
+execution option; the value is the number of statements sent per batch,
+or True for the default of 100::
+
+    e = create_engine("db2+ibm_db://...", compound_dml=True)
+
+    # or, for an ORM Session
+    session = Session(bind=e.execution_options(compound_dml=50))
+
+The single-row INSERT, UPDATE and DELETE statements the ORM's unit of
+work emits are then held back on their DBAPI connection, and sent
+together as a single ``BEGIN ATOMIC ... END`` statement (``BEGIN NOT
+ATOMIC`` with ``compound_dml_atomic=False``) when the batch is full,
+before any other statement runs on the connection, and before COMMIT.
+A ROLLBACK discards the batch.  Only statements run by a
+:class:`.Session` while it flushes are held back; the connections a
+session begins are marked as its own, and the session as flushing
+between the ``before_flush`` and ``after_flush`` events.  Of those
+statements, an INSERT is only held back when it supplies its primary
+key, so that nothing has to be fetched back from the database, and an
+UPDATE or DELETE only when its WHERE clause compares each primary key
+column to a bound parameter.  All other statements run as they come.
+
+Statements held back report a rowcount of one row per parameter set,
+which is what the ORM expects of its statements by primary key.  The
+compound statement checks each UPDATE, and each DELETE with further
+criteria such as a version id, against that with ``GET DIAGNOSTICS ...
+ROW_COUNT`` and signals ``STALE_ROW_SQLSTATE`` if a statement affected
+any other number of rows; like the ORM itself, a DELETE by primary key
+alone isn't checked.
+
+Errors from the batch, including those rowcount checks, are raised from
+the statement or COMMIT which caused the batch to be sent.
+
+"""
+import weakref
+
+from sqlalchemy import event, pool
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import expression, operators
+
+
+DEFAULT_BATCH_SIZE = 100
+
+# user-defined SQLSTATE signalled when a statement in a batch didn't
+# affect exactly one row per parameter set
+STALE_ROW_SQLSTATE = '75001'
+
+_ROW_COUNT = 'SA_ROW_COUNT'
+
+# key of the connection record info dictionary holding a weak reference
+# to the Session whose transaction the connection was begun for
+SESSION_KEY = 'ibm_db_sa_compound_session'
+
+# sessions inside flush()
+_flushing = weakref.WeakKeyDictionary()
+
+
+@event.listens_for(Session, 'after_begin')
+def _after_begin(session, transaction, connection):
+    if connection.dialect.name == 'db2':
+        connection.info[SESSION_KEY] = weakref.ref(session)
+
+
+@event.listens_for(Session, 'before_flush')
+def _before_flush(session, flush_context, instances):
+    _flushing[session] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    _flushing.pop(session, None)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _after_soft_rollback(session, previous_transaction):
+    # a flush which failed ends here
+    _flushing.pop(session, None)
+
+
+def in_flush(connection):
+    """Return True if ``connection`` is running the statements of a
+    :class:`.Session`'s flush."""
+
+    ref = connection.info.get(SESSION_KEY)
+    return ref is not None and ref() in _flushing
+
+
+def batch_size(value, default=DEFAULT_BATCH_SIZE):
+    """Return the batch size for a ``compound_dml`` setting; 0 if off."""
+
+    if value is True:
+        return default
+    elif not value:
+        return 0
+    return int(value)
+
+
+def raw_connection(connection):
+    # a Connection hands the dialect the pool's proxy, the pool itself
+    # hands over the DBAPI connection
+    if isinstance(connection, pool._ConnectionFairy):
+        return connection.connection
+    return connection
+
+
+def key_criteria(statement):
+    """Return the columns an UPDATE or DELETE compares to bound
+    parameters if its WHERE clause is made of such comparisons alone and
+    covers the table's primary key, else None."""
+
+    criteria = statement._whereclause
+    if isinstance(criteria, expression.BooleanClauseList) and \
+            criteria.operator is operators.and_:
+        criteria = criteria.clauses
+    elif criteria is not None:
+        criteria = [criteria]
+    else:
+        return None
+    columns = set()
+    for criterion in criteria:
+        if not isinstance(criterion, expression.BinaryExpression) or \
+                criterion.operator is not operators.eq or \
+                not isinstance(criterion.right, expression.BindParameter) or \
+                getattr(criterion.left, 'table', None) is not statement.table:
+            return None
+        columns.add(criterion.left)
+    primary_key = set(statement.table.primary_key)
+    if not primary_key or not primary_key.issubset(columns):
+        return None
+    return columns
+
+
+class CompoundBatch(object):
+    """DML statements held back to be sent as one compound statement."""
+
+    def __init__(self, atomic=True):
+        self.atomic = atomic
+        self.statements = []
+        self.parameters = []
+
+    def __len__(self):
+        return len(self.statements)
+
+    def add(self, statement, parameters, check_rowcount):
+        """Add a statement once for each of a list of parameter sets."""
+
+        for params in parameters:
+            self.statements.append((statement, check_rowcount))
+            self.parameters.extend(params)
+
+    def compile(self):
+        """Return the compound statement and its positional parameters."""
+
+        total = len(self.statements)
+        lines = [self.atomic and "BEGIN ATOMIC" or "BEGIN NOT ATOMIC"]
+        if any(check for statement, check in self.statements):
+            lines.append("DECLARE %s INTEGER;" % _ROW_COUNT)
+        for i, (statement, check) in enumerate(self.statements):
+            lines.append(statement + ";")
+            if check:
+                lines.append("GET DIAGNOSTICS %s = ROW_COUNT;" % _ROW_COUNT)
+                lines.append("IF %s <> 1 THEN SIGNAL SQLSTATE '%s' "
+                             "SET MESSAGE_TEXT = 'statement %d of %d in "
+                             "compound batch did not affect exactly one "
+                             "row'; END IF;" % (
+                                _ROW_COUNT, STALE_ROW_SQLSTATE, i + 1, total))
+        lines.append("END")
+        return "\n".join(lines), tuple(self.parameters)
+
+    def execute(self, dbapi_connection):
+        statement, parameters = self.compile()
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(statement, parameters)
+        finally:
+            cursor.close()
@@ -0,0 +1,193 @@
+# +--------------------------------------------------------------------------+
+# |  Licensed Materials - Property of IBM                                    |
+# |                                                                          |
+# | (C) Copyright IBM Corporation 2008.                                      |
+# +--------------------------------------------------------------------------+
+# | This module complies with SQLAlchemy 0.8 and is                          |
+# | Licensed under the Apache License, Version 2.0 (the "License");          |
+# | you may not use this file except in compliance with the License.         |
+# | You may obtain a copy of the License at                                  |
+# | http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable |
+# | law or agreed to in writing, software distributed under the License is   |
+# | distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY |
+# | KIND, either express or implied. See the License for the specific        |
+# | language governing permissions and limitations under the License.        |
+# +--------------------------------------------------------------------------+
+# | Version: 0.3.x                                                           |
+# +--------------------------------------------------------------------------+
+"""DB2-specific DDL constructs.
+
+These are compiled by :class:`.DB2DDLCompiler` and are executed like any
+other DDL element::
+
+    from ibm_db_sa import Truncate
+
+    connection.execute(Truncate(some_table))
+
+"""
+from sqlalchemy.schema import _CreateDropBase
+
+
+class Truncate(_CreateDropBase):
+    """Represent a ``TRUNCATE TABLE ... IMMEDIATE`` statement.
+
+    Rows are removed without being logged individually and without
+    escalating row locks.  DB2 requires TRUNCATE to be the first statement
+    of a unit of work; it is run with autocommit like other DDL.
+
+    :param reuse_storage: render ``REUSE STORAGE``, keeping the storage
+      allocated to the table, instead of ``DROP STORAGE``.
+
+    :param restrict_when_delete_triggers: render
+      ``RESTRICT WHEN DELETE TRIGGERS`` so that the statement fails on a
+      table with delete triggers, instead of ``IGNORE DELETE TRIGGERS``.
+
+    """
+
+    __visit_name__ = "truncate"
+
+    def __init__(self, element, reuse_storage=False,
+                        restrict_when_delete_triggers=False,
+                        on=None, bind=None):
+        super(Truncate, self).__init__(element, on=on, bind=bind)
+        self.reuse_storage = reuse_storage
+        self.restrict_when_delete_triggers = restrict_when_delete_triggers
+
+
+class DetachPartition(_CreateDropBase):
+    """Represent an ``ALTER TABLE ... DETACH PARTITION ... INTO`` statement.
+
+    Detaching rolls a data partition out of a range-partitioned table
+    into a table of its own, which can then be archived or dropped,
+    without deleting its rows one by one.
+
+    :param element: the partitioned :class:`.Table`.
+
+    :param partition: name of the data partition to detach.
+
+    :param into: the :class:`.Table` or table name to create from the
+      partition's data.
+
+    """
+
+    __visit_name__ = "detach_partition"
+
+    def __init__(self, element, partition, into, on=None, bind=None):
+        super(DetachPartition, self).__init__(element, on=on, bind=bind)
+        self.partition = partition
+        self.into = into
+
+
+class DeclareGlobalTemporaryTable(_CreateDropBase):
+    """Represent a ``DECLARE GLOBAL TEMPORARY TABLE`` statement.
+
+    The :class:`.Table` should be in the ``SESSION`` schema.  A declared
+    temporary table is private to the connection which declares it and
+    is dropped when that connection is closed.  Constraints and indexes
+    of the table are not rendered.
+
+    :param on_commit_preserve_rows: render ``ON COMMIT PRESERVE ROWS``
+      rather than ``ON COMMIT DELETE ROWS``.
+
+    :param not_logged: render ``NOT LOGGED``, so that changes to the
+      table are not written to the transaction log.
+
+    :param with_replace: render ``WITH REPLACE``, replacing a temporary
+      table of the same name declared earlier on the connection.
+
+    """
+
+    __visit_name__ = "declare_global_temporary_table"
+
+    def __init__(self, element, on_commit_preserve_rows=True,
+                        not_logged=True, with_replace=True,
+                        on=None, bind=None):
+        super(DeclareGlobalTemporaryTable, self).__init__(
+                        element, on=on, bind=bind)
+        self.on_commit_preserve_rows = on_commit_preserve_rows
+        self.not_logged = not_logged
+        self.with_replace = with_replace
+
+
+class CreateMaterializedQueryTable(_CreateDropBase):
+    """Represent a ``CREATE TABLE ... AS (SELECT ...) DATA INITIALLY
+    DEFERRED`` statement creating a materialized query table (MQT).
+
+    The MQT holds the result of ``select``; with query optimization
+    enabled, DB2 may answer queries against the tables it is built from
+    with the MQT instead::
+
+        daily_totals = Table('daily_totals', metadata,
+                            Column('placed', Date), Column('total', Numeric),
+                            Column('orders', Integer))
+        connection.execute(CreateMaterializedQueryTable(daily_totals,
+                select([orders.c.placed, func.sum(orders.c.total),
+                        func.count()]).group_by(orders.c.placed)))
+        connection.execute(RefreshTable(daily_totals))
+
+    The table is created empty and in set integrity pending state;
+    :class:`.RefreshTable` populates a system maintained MQT.  DB2
+    routes queries to a ``REFRESH DEFERRED`` MQT only when the
+    ``CURRENT REFRESH AGE`` register is ``ANY``, which the
+    ``refresh_age`` execution option sets for a connection until it is
+    returned to the pool::
+
+        conn = engine.connect().execution_options(refresh_age='ANY')
+
+    :param element: the :class:`.Table` to create.  Its column names,
+      if any, are rendered as the MQT's column names, in order; column
+      types and constraints are taken from the query, not the
+      :class:`.Table`.
+
+    :param select: the :class:`.Select` the MQT is made of; bound
+      values are rendered inline.
+
+    :param refresh: ``'deferred'`` to refresh the MQT with
+      ``REFRESH TABLE``, or ``'immediate'`` to have DB2 maintain it as
+      the underlying tables change.
+
+    :param maintained_by: ``'system'``, or ``'user'`` for an MQT whose
+      rows are written by the application.  DB2 considers user
+      maintained MQTs for query routing only when ``CURRENT MAINTAINED
+      TABLE TYPES FOR OPTIMIZATION`` includes ``USER``.
+
+    :param enable_query_optimization: render ``ENABLE QUERY
+      OPTIMIZATION`` rather than ``DISABLE QUERY OPTIMIZATION``.
+
+    """
+
+    __visit_name__ = "create_materialized_query_table"
+
+    def __init__(self, element, select, refresh='deferred',
+                        maintained_by='system',
+                        enable_query_optimization=True, on=None, bind=None):
+        super(CreateMaterializedQueryTable, self).__init__(
+                        element, on=on, bind=bind)
+        if refresh not in ('deferred', 'immediate'):
+            raise ValueError("refresh must be 'deferred' or 'immediate'")
+        if maintained_by not in ('system', 'user'):
+            raise ValueError("maintained_by must be 'system' or 'user'")
+        if refresh == 'immediate' and maintained_by == 'user':
+            raise ValueError("a user maintained MQT can't be "
+                             "REFRESH IMMEDIATE")
+        self.select = select
+        self.refresh = refresh
+        self.maintained_by = maintained_by
+        self.enable_query_optimization = enable_query_optimization
+
+
+class RefreshTable(_CreateDropBase):
+    """Represent a ``REFRESH TABLE`` statement, recomputing the rows of
+    a materialized query table from its query.
+
+    :param incremental: render ``INCREMENTAL``, applying only the
+      changes made to the underlying tables since the last refresh, or,
+      if False, ``NOT INCREMENTAL``; by default DB2 decides.
+
+    """
+
+    __visit_name__ = "refresh_table"
+
+    def __init__(self, element, incremental=None, on=None, bind=None):
+        super(RefreshTable, self).__init__(element, on=on, bind=bind)
+        self.incremental = incremental
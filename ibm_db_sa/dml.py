@@ -0,0 +1,161 @@
+# +--------------------------------------------------------------------------+
+# |  Licensed Materials - Property of IBM                                    |
+# |                                                                          |
+# | (C) Copyright IBM Corporation 2008.                                      |
+# +--------------------------------------------------------------------------+
+# | This module complies with SQLAlchemy 0.8 and is                          |
+# | Licensed under the Apache License, Version 2.0 (the "License");          |
+# | you may not use this file except in compliance with the License.         |
+# | You may obtain a copy of the License at                                  |
+# | http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable |
+# | law or agreed to in writing, software distributed under the License is   |
+# | distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY |
+# | KIND, either express or implied. See the License for the specific        |
+# | language governing permissions and limitations under the License.        |
+# +--------------------------------------------------------------------------+
+# | Version: 0.3.x                                                           |
+# +--------------------------------------------------------------------------+
+"""DB2-specific DML constructs and helpers.
+
+"""
+from sqlalchemy import sql, types as sa_types
+from sqlalchemy.sql.expression import ClauseElement, ColumnElement, \
+    Executable, BindParameter, _literal_as_binds
+
+
+class DeleteChunk(Executable, ClauseElement):
+    """Represent a ``DELETE FROM (SELECT ... FETCH FIRST n ROWS ONLY)``
+    statement, deleting at most ``chunk_size`` rows matching
+    ``whereclause``.
+
+    See :func:`.chunked_delete` for purging a table in bounded batches.
+
+    """
+
+    __visit_name__ = "delete_chunk"
+
+    _execution_options = \
+        Executable._execution_options.union({'autocommit': True})
+    _returning = ()
+
+    def __init__(self, table, whereclause=None, chunk_size=10000):
+        self.table = table
+        self.whereclause = whereclause
+        self.chunk_size = chunk_size
+
+    def _select(self, columns):
+        select = sql.select(columns).select_from(self.table).\
+                    limit(self.chunk_size)
+        if self.whereclause is not None:
+            select = select.where(self.whereclause)
+        return select
+
+
+def chunked_delete(bind, table, whereclause=None, chunk_size=10000):
+    """Delete the rows of ``table`` matching ``whereclause`` in batches of
+    at most ``chunk_size`` rows, committing after each batch.
+
+    This keeps the amount of log space and the number of locks held at
+    any time bounded, at the expense of the purge as a whole not being
+    atomic.  ``bind`` is an :class:`.Engine` or a :class:`.Connection`
+    which isn't in a transaction.  Returns the number of rows deleted, or
+    None if the driver doesn't report row counts.
+
+    """
+    stmt = DeleteChunk(table, whereclause, chunk_size)
+    total = 0
+    conn = bind.connect()
+    try:
+        while True:
+            trans = conn.begin()
+            try:
+                deleted = conn.execute(stmt).rowcount
+                trans.commit()
+            except:
+                trans.rollback()
+                raise
+
+            if deleted >= 0 and total is not None:
+                total += deleted
+                if deleted < chunk_size:
+                    break
+            else:
+                # driver doesn't report a rowcount; check for leftovers
+                total = None
+                if conn.execute(stmt._select([sql.literal_column('1')]).
+                                    limit(1)).first() is None:
+                    break
+    finally:
+        conn.close()
+    return total
+
+
+def inoutparam(key, value, type_=None):
+    """Create an INOUT parameter for a :class:`.Call`, passing ``value``
+    in and returning the procedure's value in ``out_parameters``.
+
+    OUT parameters are created with SQLAlchemy's :func:`.outparam`.
+
+    """
+    return BindParameter(key, value, type_=type_, isoutparam=True)
+
+
+class Array(ColumnElement):
+    """Represent an ``ARRAY[...]`` constructor of bound values, passing a
+    list to an array-typed procedure parameter; a list or tuple given to
+    :class:`.Call` is converted to one.
+
+    """
+
+    __visit_name__ = "db2_array"
+
+    def __init__(self, values, type_=None):
+        self.clauses = [_literal_as_binds(value, type_=type_)
+                        for value in values]
+        self.type = sa_types.NullType()
+
+
+def _call_argument(argument):
+    if isinstance(argument, (list, tuple)):
+        return Array(argument)
+    return _literal_as_binds(argument)
+
+
+class Call(Executable, ClauseElement):
+    """Represent a ``CALL procedure(...)`` statement.
+
+    Arguments may be plain values, bound as IN parameters; SQL
+    expressions; :func:`.outparam` and :func:`.inoutparam` parameters;
+    and lists or tuples, passed as ``ARRAY[...]`` so that one call can
+    process a batch of keys::
+
+        result = conn.execute(Call('process_orders', [1, 2, 3],
+                                    outparam('processed', Integer),
+                                    schema='app'))
+        result.out_parameters['processed']
+        for row in result:
+            ...
+        while result.nextset():
+            for row in result:
+                ...
+
+    The result reads the procedure's result sets in turn; see
+    :class:`.CallResultProxy`.  OUT and INOUT parameters need a driver
+    with ``callproc()`` support, which is ibm_db, and are passed to it
+    as one parameter each, so they can't be combined with array or
+    expression arguments.
+
+    """
+
+    __visit_name__ = "call"
+
+    _execution_options = \
+        Executable._execution_options.union({'autocommit': True})
+
+    def __init__(self, name, *arguments, **kw):
+        self.name = name
+        self.schema = kw.pop('schema', None)
+        if kw:
+            raise TypeError("Unknown arguments: %s" % ", ".join(kw))
+        self.arguments = [_call_argument(argument)
+                            for argument in arguments]
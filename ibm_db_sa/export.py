@@ -0,0 +1,370 @@
+# +--------------------------------------------------------------------------+
+# |  Licensed Materials - Property of IBM                                    |
+# |                                                                          |
+# | (C) Copyright IBM Corporation 2008.                                      |
+# +--------------------------------------------------------------------------+
+# | This module complies with SQLAlchemy 0.8 and is                          |
+# | Licensed under the Apache License, Version 2.0 (the "License");          |
+# | you may not use this file except in compliance with the License.         |
+# | You may obtain a copy of the License at                                  |
+# | http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable |
+# | law or agreed to in writing, software distributed under the License is   |
+# | distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY |
+# | KIND, either express or implied. See the License for the specific        |
+# | language governing permissions and limitations under the License.        |
+# +--------------------------------------------------------------------------+
+# | Version: 0.3.x                                                           |
+# +--------------------------------------------------------------------------+
+"""Export of query results to Parquet, Arrow IPC and CSV files.
+
+:func:`export` runs a query and writes its rows to a file, or, split
+into partitions, to one file per partition in a directory, each
+partition read over its own pooled connection by a pool of threads or
+processes::
+
+    from ibm_db_sa.export import export
+
+    export(engine, orders, '/data/orders', format='parquet',
+           partition_column=orders.c.id, partitions=8)
+
+Rows are fetched from the DBAPI cursor in blocks of ``batch_size``,
+converted by the dialect's result processors a column at a time, and
+written as Arrow record batches; no per-row objects are built.  Column
+types map to Arrow types through the DB2 type names of
+``ischema_names``.  Parquet and Arrow output need ``pyarrow``; CSV
+output doesn't.
+
+"""
+import csv
+import multiprocessing
+import multiprocessing.pool
+import os
+
+from sqlalchemy import create_engine, func, types as sa_types
+from sqlalchemy import MetaData, Table
+from sqlalchemy.sql import expression
+
+from .base import ischema_names
+
+
+# extension of the files written for each format
+FORMATS = {'parquet': 'parquet', 'arrow': 'arrow', 'csv': 'csv'}
+
+
+def _decimal(pa, type_):
+    if type_.asdecimal and type_.precision:
+        return pa.decimal128(type_.precision, type_.scale or 0)
+    return pa.float64()
+
+
+def _string(pa, type_):
+    return pa.string()
+
+
+# Arrow type for each DB2 type name
+_ARROW_TYPES = {
+    'SMALLINT': lambda pa, type_: pa.int16(),
+    'INTEGER': lambda pa, type_: pa.int32(),
+    'BIGINT': lambda pa, type_: pa.int64(),
+    'DECIMAL': _decimal,
+    'NUMERIC': _decimal,
+    'REAL': lambda pa, type_: pa.float32(),
+    'DOUBLE': lambda pa, type_: pa.float64(),
+    'DATE': lambda pa, type_: pa.date32(),
+    'TIME': lambda pa, type_: pa.time64('us'),
+    'TIMESTAMP': lambda pa, type_: pa.timestamp('us'),
+    'DATETIME': lambda pa, type_: pa.timestamp('us'),
+    'CHAR': _string,
+    'CHARACTER': _string,
+    'VARCHAR': _string,
+    'LONGVARCHAR': _string,
+    'CLOB': _string,
+    'XML': _string,
+    'GRAPHIC': _string,
+    'VARGRAPHIC': _string,
+    'LONGVARGRAPHIC': _string,
+    'DBCLOB': _string,
+    'BLOB': lambda pa, type_: pa.binary(),
+    'BOOLEAN': lambda pa, type_: pa.bool_(),
+}
+
+# DB2 type names of the generic types, for types which aren't
+# subclasses of one in ischema_names
+_GENERIC_NAMES = {
+    sa_types.Boolean: 'BOOLEAN',
+    sa_types.SmallInteger: 'SMALLINT',
+    sa_types.BigInteger: 'BIGINT',
+    sa_types.Integer: 'INTEGER',
+    sa_types.Float: 'DOUBLE',
+    sa_types.Numeric: 'DECIMAL',
+    sa_types.DateTime: 'TIMESTAMP',
+    sa_types.Date: 'DATE',
+    sa_types.Time: 'TIME',
+    sa_types.LargeBinary: 'BLOB',
+    sa_types.String: 'VARCHAR',
+}
+
+_TYPE_NAMES = dict((cls, name) for name, cls in ischema_names.items())
+_TYPE_NAMES.update(_GENERIC_NAMES)
+
+
+def db2_type_name(type_):
+    """Return the DB2 type name of a type, as keyed in ``ischema_names``,
+    or None."""
+
+    for cls in type(type_).__mro__:
+        name = _TYPE_NAMES.get(cls)
+        if name is not None:
+            return name
+    return None
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet and Arrow export require pyarrow; "
+                          "CSV export doesn't")
+    return pyarrow
+
+
+def arrow_schema(columns):
+    """Return a pyarrow schema for a list of (name, type) pairs."""
+
+    pa = _import_pyarrow()
+    fields = []
+    for name, type_ in columns:
+        factory = _ARROW_TYPES.get(db2_type_name(type_), _string)
+        fields.append(pa.field(name, factory(pa, type_)))
+    return pa.schema(fields)
+
+
+class _CSVWriter(object):
+
+    def __init__(self, path, columns):
+        self._file = open(path, 'wb')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([_csv_value(name) for name, type_ in columns])
+
+    def write(self, columns):
+        self._writer.writerows(
+                    zip(*[[_csv_value(value) for value in column]
+                          for column in columns]))
+
+    def close(self):
+        self._file.close()
+
+
+def _csv_value(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+class _ArrowWriter(object):
+
+    def __init__(self, path, columns, format):
+        self._pa = pa = _import_pyarrow()
+        self._schema = arrow_schema(columns)
+        if format == 'parquet':
+            self._writer = pa.parquet.ParquetWriter(path, self._schema)
+        else:
+            self._writer = pa.RecordBatchFileWriter(path, self._schema)
+        self._parquet = format == 'parquet'
+
+    def write(self, columns):
+        pa = self._pa
+        batch = pa.RecordBatch.from_arrays(
+                    [pa.array(column, type=field.type)
+                        for column, field in zip(columns, self._schema)],
+                    names=self._schema.names)
+        if self._parquet:
+            self._writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+
+    def close(self):
+        self._writer.close()
+
+
+def _writer(path, columns, format):
+    if format == 'csv':
+        return _CSVWriter(path, columns)
+    return _ArrowWriter(path, columns, format)
+
+
+def _export_partition(engine, task):
+    """Run one partition's statement and write its rows; return the path
+    and the number of rows written."""
+
+    dialect = engine.dialect
+    columns = task['columns']
+    conn = engine.connect()
+    try:
+        result = conn.execute(task['statement'], task['parameters'])
+        cursor = result.cursor
+        processors = [
+                (index, type_.dialect_impl(dialect).result_processor(
+                                    dialect, description[1]))
+                for index, ((name, type_), description)
+                in enumerate(zip(columns, cursor.description))]
+        processors = [(index, processor) for index, processor in processors
+                        if processor is not None]
+
+        writer = _writer(task['path'], columns, task['format'])
+        rows_written = 0
+        try:
+            while True:
+                rows = cursor.fetchmany(task['batch_size'])
+                if not rows:
+                    break
+                block = [list(column) for column in zip(*rows)]
+                for index, processor in processors:
+                    block[index] = [processor(value)
+                                    for value in block[index]]
+                writer.write(block)
+                rows_written += len(rows)
+        finally:
+            writer.close()
+        result.close()
+    finally:
+        conn.close()
+    return task['path'], rows_written
+
+
+# one engine per worker process and URL
+_process_engines = {}
+
+
+def _export_partition_in_process(task):
+    key = str(task['url'])
+    engine = _process_engines.get(key)
+    if engine is None:
+        engine = _process_engines[key] = \
+                    create_engine(task['url'], pool_size=1)
+    return _export_partition(engine, task)
+
+
+def _selectable(bind, query, schema):
+    if isinstance(query, basestring):
+        query = Table(query, MetaData(), schema=schema, autoload=True,
+                        autoload_with=bind)
+    if isinstance(query, expression.FromClause) and \
+            not isinstance(query, expression.SelectBase):
+        query = query.select()
+    return query
+
+
+def _compile(dialect, statement):
+    compiled = statement.compile(dialect=dialect)
+    params = compiled.construct_params()
+    processors = compiled._bind_processors
+    parameters = []
+    for key in compiled.positiontup:
+        value = params[key]
+        processor = processors.get(key)
+        if processor is not None:
+            value = processor(value)
+        parameters.append(value)
+    return unicode(compiled), tuple(parameters)
+
+
+def export(bind, query, path, format='parquet', partition_column=None,
+                partitions=None, workers=None, processes=False,
+                batch_size=10000, schema=None):
+    """Write the rows of a query to Parquet, Arrow IPC or CSV files.
+
+    :param bind: the :class:`.Engine` to read from.
+
+    :param query: a :func:`.select`, a :class:`.Table`, or the name of a
+      table to reflect, in ``schema``.
+
+    :param path: the file to write; a directory to write one
+      ``part-NNNNN.<format>`` file per partition into when
+      ``partitions`` is given.
+
+    :param format: ``'parquet'``, ``'arrow'`` (Arrow IPC file format) or
+      ``'csv'``.
+
+    :param partition_column: an integer column of ``query``, or its
+      name; partition ``i`` of ``n`` holds the rows where
+      ``MOD(ABS(partition_column), n) = i``.  Rows where it is NULL are
+      written to one more partition, ``part-<n>``, unless the column is
+      declared NOT NULL.
+
+    :param partitions: the number of partitions.
+
+    :param workers: the number of partitions exported at once; by
+      default one per partition, up to the number of CPUs.
+
+    :param processes: use a process pool instead of a thread pool.
+      Each process creates its own engine from ``bind.url``, so this
+      suits engines which need no arguments beyond their URL.
+
+    :param batch_size: rows per fetch and per record batch.
+
+    Returns a list of ``(path, number of rows)`` tuples, one per file.
+
+    """
+    if format not in FORMATS:
+        raise ValueError("format must be one of %s" %
+                            ", ".join(sorted(FORMATS)))
+    if format != 'csv':
+        _import_pyarrow()
+
+    statement = _selectable(bind, query, schema)
+    columns = [(column.name, column.type) for column in statement.columns]
+
+    if partitions:
+        if isinstance(partition_column, basestring):
+            # the column selected, not the column of the select
+            partition_column = dict(
+                        (column.name, column)
+                        for column in statement.inner_columns).get(
+                                                    partition_column)
+        if partition_column is None:
+            raise ValueError("partitions require a partition_column "
+                             "of the query")
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        # DB2's MOD takes the sign of the dividend
+        criteria = [func.mod(func.abs(partition_column), partitions) == i
+                        for i in range(partitions)]
+        if getattr(partition_column, 'nullable', True):
+            criteria.append(partition_column == None)
+        statements = [
+                (statement.where(criterion),
+                 os.path.join(path, 'part-%05d.%s' % (i, FORMATS[format])))
+                for i, criterion in enumerate(criteria)]
+    else:
+        statements = [(statement, path)]
+
+    tasks = []
+    for partition, partition_path in statements:
+        sql, parameters = _compile(bind.dialect, partition)
+        tasks.append({
+            'url': bind.url,
+            'statement': sql,
+            'parameters': parameters,
+            'columns': columns,
+            'path': partition_path,
+            'format': format,
+            'batch_size': batch_size,
+        })
+
+    if len(tasks) == 1:
+        return [_export_partition(bind, tasks[0])]
+
+    workers = workers or min(len(tasks), multiprocessing.cpu_count())
+    if processes:
+        pool = multiprocessing.Pool(workers)
+        run = _export_partition_in_process
+    else:
+        pool = multiprocessing.pool.ThreadPool(workers)
+        run = lambda task: _export_partition(bind, task)
+    try:
+        return pool.map(run, tasks)
+    finally:
+        pool.close()
+        pool.join()
@@ -18,6 +18,7 @@
 # | Version: 0.3.x                                                           |
 # +--------------------------------------------------------------------------+
 
+from sqlalchemy import exc
 from .base import DB2ExecutionContext, DB2Dialect
 
 class DB2ExecutionContext_ibm_db(DB2ExecutionContext):
@@ -42,6 +43,35 @@ class DB2Dialect_ibm_db(DB2Dialect):
         import ibm_db_dbi as module
         return module
 
+    def initialize(self, connection):
+        # ibm_db releases built with unicode support take unicode
+        # statements as they are; sparing the encode on each execution
+        self.supports_unicode_statements = \
+                    self._accepts_unicode_statements(connection.connection)
+        super(DB2Dialect_ibm_db, self).initialize(connection)
+
+    def _accepts_unicode_statements(self, dbapi_connection):
+        cursor = dbapi_connection.cursor()
+        try:
+            try:
+                cursor.execute(u"SELECT 1 FROM SYSIBM.SYSDUMMY1")
+            except (TypeError, self.dbapi.Error):
+                return False
+            return True
+        finally:
+            cursor.close()
+
+    def _do_call(self, cursor, statement, parameters, context):
+        call = context.compiled.statement
+        if len(parameters) != len(call.arguments):
+            raise exc.InvalidRequestError(
+                    "A CALL with OUT or INOUT parameters takes one bound "
+                    "parameter per argument; array and expression "
+                    "arguments aren't supported with them")
+        values = cursor.callproc(context.compiled.call_name,
+                                 tuple(parameters))
+        self._process_out_parameters(context, values)
+
     def _get_server_version_info(self, connection):
         return connection.connection.server_info()
 
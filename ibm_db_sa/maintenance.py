@@ -0,0 +1,242 @@
+# +--------------------------------------------------------------------------+
+# |  Licensed Materials - Property of IBM                                    |
+# |                                                                          |
+# | (C) Copyright IBM Corporation 2008.                                      |
+# +--------------------------------------------------------------------------+
+# | This module complies with SQLAlchemy 0.8 and is                          |
+# | Licensed under the Apache License, Version 2.0 (the "License");          |
+# | you may not use this file except in compliance with the License.         |
+# | You may obtain a copy of the License at                                  |
+# | http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable |
+# | law or agreed to in writing, software distributed under the License is   |
+# | distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY |
+# | KIND, either express or implied. See the License for the specific        |
+# | language governing permissions and limitations under the License.        |
+# +--------------------------------------------------------------------------+
+# | Version: 0.3.x                                                           |
+# +--------------------------------------------------------------------------+
+"""RUNSTATS and REORG of tables after bulk writes.
+
+Enabled per engine with the ``runstats_rows`` argument to
+``create_engine()``: the number of rows written to a table by INSERT,
+UPDATE and DELETE statements through the dialect after which its
+statistics are collected again::
+
+    e = create_engine("db2+ibm_db://...", runstats_rows=100000,
+                      runstats_ratio=0.1, reorg_check=True)
+
+Rows are counted per DBAPI connection and added to the table's total
+when the unit of work commits; a ROLLBACK discards them.  When a total
+reaches ``runstats_rows``, and also ``runstats_ratio`` of the table's
+cardinality in the catalog if that is given, the table is maintained
+with::
+
+    CALL SYSPROC.ADMIN_CMD('RUNSTATS ON TABLE ... WITH DISTRIBUTION
+                            AND INDEXES ALL')
+
+With ``reorg_check=True`` the table is then checked with
+``SYSPROC.REORGCHK_TB_STATS``; if any of its formulas flag the table,
+it is reorganized with ``REORG TABLE`` and its statistics collected
+once more.
+
+Maintenance runs on the committing connection when it is returned to
+the pool, so that the COMMIT itself doesn't wait for it, or with
+``maintenance_async=True`` on a separate connection from the pool in a
+background thread.  Failures are reported as warnings; the writes
+themselves are already committed.
+
+"""
+import collections
+import threading
+
+from sqlalchemy import util
+
+from .compound import raw_connection
+
+
+RUNSTATS = "RUNSTATS ON TABLE %s WITH DISTRIBUTION AND INDEXES ALL"
+REORG = "REORG TABLE %s"
+
+_ADMIN_CMD = "CALL SYSPROC.ADMIN_CMD(?)"
+_REORGCHK = "CALL SYSPROC.REORGCHK_TB_STATS('T', ?)"
+_CARDINALITY = "SELECT CARD FROM SYSCAT.TABLES " \
+               "WHERE TABSCHEMA = ? AND TABNAME = ?"
+
+
+def _quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+class MaintenanceTracker(object):
+    """Counts the rows written per table, and runs RUNSTATS, and REORG
+    where needed, on tables past the thresholds.
+
+    Tables are identified by their (schema, name) as stored in the
+    catalog.
+
+    """
+
+    def __init__(self, runstats_rows, runstats_ratio=None,
+                        reorg_check=False, asynchronous=False):
+        self.runstats_rows = runstats_rows
+        self.runstats_ratio = runstats_ratio
+        self.reorg_check = reorg_check
+        self.asynchronous = asynchronous
+        self.runstats = self.reorgs = self.failures = 0
+        self._pending = {}
+        self._due = {}
+        self._written = collections.defaultdict(int)
+        self._threads = []
+        self._mutex = threading.Lock()
+
+    def record(self, connection, table, rows):
+        """Count rows written to a table in the current unit of work."""
+
+        pending = self._pending.setdefault(raw_connection(connection),
+                                           collections.defaultdict(int))
+        pending[table] += rows
+
+    def rollback(self, connection):
+        self._pending.pop(raw_connection(connection), None)
+
+    def close(self, connection):
+        self.rollback(connection)
+        self._due.pop(raw_connection(connection), None)
+
+    def commit(self, connection):
+        """Add the rows written in the unit of work just committed, and
+        maintain the tables past ``runstats_rows``: in the background, or
+        else when the connection is checked in."""
+
+        pending = self._pending.pop(raw_connection(connection), None)
+        if not pending:
+            return
+        self._mutex.acquire()
+        try:
+            due = []
+            for table, rows in pending.items():
+                self._written[table] += rows
+                if self._written[table] >= self.runstats_rows:
+                    due.append((table, self._written.pop(table)))
+        finally:
+            self._mutex.release()
+        if not due:
+            return
+
+        pool = getattr(connection, '_pool', None)
+        if self.asynchronous and pool is not None:
+            thread = threading.Thread(target=self._maintain_pooled,
+                                      args=(pool, due))
+            thread.daemon = True
+            self._mutex.acquire()
+            try:
+                self._threads = [t for t in self._threads if t.is_alive()]
+                self._threads.append(thread)
+            finally:
+                self._mutex.release()
+            thread.start()
+        else:
+            self._due.setdefault(raw_connection(connection), []).extend(due)
+
+    def checkin(self, dbapi_connection):
+        """Maintain the tables due after commits on a DBAPI connection
+        being returned to the pool."""
+
+        due = self._due.pop(dbapi_connection, None)
+        if due:
+            self.maintain(dbapi_connection, due)
+
+    def join(self, timeout=None):
+        """Wait for maintenance running in the background to finish."""
+
+        for thread in list(self._threads):
+            thread.join(timeout)
+
+    def _maintain_pooled(self, pool, due):
+        try:
+            connection = pool.connect()
+        except Exception, e:
+            self._count('failures')
+            util.warn("Maintenance of tables %s failed: %s" % (
+                        ", ".join("%s.%s" % table for table, rows in due), e))
+            return
+        try:
+            self.maintain(connection.connection, due)
+        finally:
+            connection.close()
+
+    def maintain(self, dbapi_connection, due):
+        """Run RUNSTATS, and REORG where needed, on a DBAPI connection
+        for each (table, rows written) pair; the work is committed."""
+
+        cursor = dbapi_connection.cursor()
+        try:
+            for (schema, name), rows in due:
+                try:
+                    if self._past_ratio(cursor, schema, name, rows):
+                        self._maintain_table(cursor, schema, name)
+                    else:
+                        # not yet; keep counting toward the ratio
+                        self._mutex.acquire()
+                        try:
+                            self._written[(schema, name)] += rows
+                        finally:
+                            self._mutex.release()
+                    dbapi_connection.commit()
+                except Exception, e:
+                    self._count('failures')
+                    dbapi_connection.rollback()
+                    util.warn("Maintenance of table %s.%s failed: %s" %
+                                    (schema, name, e))
+        finally:
+            cursor.close()
+
+    def _past_ratio(self, cursor, schema, name, rows):
+        if not self.runstats_ratio:
+            return True
+        cursor.execute(_CARDINALITY, (schema, name))
+        row = cursor.fetchone()
+        # -1: statistics were never collected
+        return row is None or row[0] is None or row[0] < 0 or \
+                    rows >= self.runstats_ratio * row[0]
+
+    def _maintain_table(self, cursor, schema, name):
+        table = "%s.%s" % (_quote(schema), _quote(name))
+        cursor.execute(_ADMIN_CMD, (RUNSTATS % table, ))
+        self._count('runstats')
+        if self.reorg_check and \
+                self._needs_reorg(cursor, "%s.%s" % (schema, name)):
+            cursor.execute(_ADMIN_CMD, (REORG % table, ))
+            self._count('reorgs')
+            cursor.execute(_ADMIN_CMD, (RUNSTATS % table, ))
+            self._count('runstats')
+
+    def _count(self, counter):
+        # counters are updated by background threads as well
+        self._mutex.acquire()
+        try:
+            setattr(self, counter, getattr(self, counter) + 1)
+        finally:
+            self._mutex.release()
+
+    def _needs_reorg(self, cursor, table):
+        # REORG is '-' or '*' per formula F1 to F3, '*' recommending
+        # reorganization; one row per data partition
+        cursor.execute(_REORGCHK, (table, ))
+        names = [d[0].upper() for d in cursor.description]
+        reorg = names.index('REORG')
+        return any('*' in (row[reorg] or '') for row in cursor.fetchall())
+
+    def stats(self):
+        """Return a dictionary of maintenance counters."""
+
+        self._mutex.acquire()
+        try:
+            return {
+                'runstats': self.runstats,
+                'reorgs': self.reorgs,
+                'failures': self.failures,
+                'pending_tables': len(self._written),
+            }
+        finally:
+            self._mutex.release()
@@ -18,21 +18,235 @@
 # | Version: 0.3.x                                                           |
 # +--------------------------------------------------------------------------+
 from sqlalchemy import util
+from sqlalchemy import types as sa_types
+import math
 import urllib
 from sqlalchemy.connectors.pyodbc import PyODBCConnector
 from .base import _SelectLastRowIDMixin, DB2ExecutionContext, DB2Dialect
+from . import reflection as ibm_reflection
 
 
 
 class DB2ExecutionContext_pyodbc(_SelectLastRowIDMixin, DB2ExecutionContext):
-    pass
 
-class DB2Dialect_pyodbc(PyODBCConnector, DB2Dialect):
+    # rows affected by all the batches of a fast executemany(); the
+    # cursor's rowcount is the last batch's
+    _batched_rowcount = None
+
+    @property
+    def rowcount(self):
+        if self._batched_rowcount is not None:
+            return self._batched_rowcount
+        return super(DB2ExecutionContext_pyodbc, self).rowcount
+
+    def pre_exec(self):
+        super(DB2ExecutionContext_pyodbc, self).pre_exec()
+        # DDL, and statements sent otherwise than as compiled, in a
+        # compound batch or through callproc(), are left to pyodbc
+        if self.dialect.use_setinputsizes and self.compiled is not None and \
+                not self.isddl and not self._compound_batch_size and \
+                not self._out_parameter_keys:
+            sizes = self.dialect._input_sizes(self.compiled)
+            if sizes:
+                self.cursor.setinputsizes(
+                        _sized_by_value(sizes, self.parameters))
+
+    def create_cursor(self):
+        timeout = self.execution_options.get('timeout')
+        if not timeout:
+            return super(DB2ExecutionContext_pyodbc, self).create_cursor()
+
+        # pyodbc sets the query timeout of a cursor from its
+        # connection's when creating it
+        dbapi_connection = self._dbapi_connection.connection
+        previous = dbapi_connection.timeout
+        dbapi_connection.timeout = max(1, int(math.ceil(float(timeout))))
+        self._native_timeout = True
+        try:
+            return super(DB2ExecutionContext_pyodbc, self).create_cursor()
+        finally:
+            dbapi_connection.timeout = previous
+
+
+def _bind_width(type_):
+    """Estimate the bytes pyodbc allocates per row for a parameter when
+    binding parameter arrays."""
+
+    if isinstance(type_, (sa_types.String, sa_types.LargeBinary)):
+        length = type_.length or 4000
+        if isinstance(type_, (sa_types.Unicode, sa_types.UnicodeText)):
+            return length * 2
+        return length
+    elif isinstance(type_, sa_types.Numeric):
+        return (type_.precision or 31) + 2
+    elif isinstance(type_, (sa_types.DateTime, sa_types.Time)):
+        return 32
+    else:
+        return 16
+
+
+# pyodbc SQL type constant and (column size, decimal digits), or a
+# function of the type returning them, for the types bound with
+# setinputsizes(); by SQLAlchemy type, most specific first.  Strings
+# are sized by the values bound (a column size of None here), as a
+# LIKE pattern or a concatenation needn't fit the column's length
+_input_size_types = [
+    (sa_types.Boolean, ('SQL_SMALLINT', 5, 0)),
+    (sa_types.SmallInteger, ('SQL_SMALLINT', 5, 0)),
+    (sa_types.BigInteger, ('SQL_BIGINT', 19, 0)),
+    (sa_types.Integer, ('SQL_INTEGER', 10, 0)),
+    (sa_types.Float, ('SQL_DOUBLE', 15, 0)),
+    (sa_types.Numeric, lambda type_: type_.precision is not None and
+                        type_.scale is not None and
+                        ('SQL_DECIMAL', type_.precision, type_.scale)),
+    (sa_types.DateTime, ('SQL_TYPE_TIMESTAMP', 26, 6)),
+    (sa_types.Date, ('SQL_TYPE_DATE', 10, 0)),
+    (sa_types.Time, ('SQL_TYPE_TIME', 8, 0)),
+    (sa_types.Unicode, lambda type_: type_.length and
+                        ('SQL_WVARCHAR', None, 0)),
+    (sa_types.String, lambda type_: type_.length and
+                        ('SQL_VARCHAR', None, 0)),
+]
+
+
+def _input_size(dbapi, type_):
+    """Return the setinputsizes() entry for a bound type, or None if
+    pyodbc should describe the parameter itself."""
+
+    for type_class, size in _input_size_types:
+        if isinstance(type_, type_class):
+            if callable(size):
+                size = size(type_)
+            if not size:
+                return None
+            return (getattr(dbapi, size[0]), size[1], size[2])
+    return None
+
+
+def _sized_by_value(sizes, parameters):
+    """Fill in the column size of the string parameters of
+    setinputsizes() entries from the longest value bound to each."""
+
+    if None not in [size[1] for size in sizes]:
+        return sizes
+    sized = []
+    for index, (sql_type, size, digits) in enumerate(sizes):
+        if size is None:
+            size = max([len(params[index]) for params in parameters
+                        if isinstance(params[index], basestring)] or [0])
+            size = max(size, 1)
+        sized.append((sql_type, size, digits))
+    return sized
+
+
+class _SetInputSizesMixin(object):
+    """Describe the parameters of compiled statements to pyodbc with
+    ``setinputsizes()`` (pyodbc 4.0.24 and later).
+
+    The descriptions are derived from the bound types once per compiled
+    statement, sparing pyodbc a SQLDescribeParam() call, or a guess from
+    the Python value, for every parameter of every execution.  Only used
+    when every parameter has a type with a fixed description: dates,
+    times, timestamps, integers, floats, DECIMAL with precision and
+    scale, and strings with a length, which are described by the length
+    of the values bound rather than the column's.  Enabled with
+    ``create_engine(..., use_setinputsizes=True)``.
+
+    """
+
+    def __init__(self, use_setinputsizes=False, **kw):
+        super(_SetInputSizesMixin, self).__init__(**kw)
+        self.use_setinputsizes = util.asbool(use_setinputsizes)
+
+    def initialize(self, connection):
+        super(_SetInputSizesMixin, self).initialize(connection)
+        if self.use_setinputsizes and self._dbapi_version() < (4, 0, 24):
+            util.warn("use_setinputsizes requires pyodbc 4.0.24 or "
+                        "later; parameters are described by pyodbc")
+            self.use_setinputsizes = False
+
+    def _input_sizes(self, compiled):
+        try:
+            return compiled._pyodbc_input_sizes
+        except AttributeError:
+            pass
+        sizes = None
+        if compiled.positiontup:
+            sizes = [_input_size(self.dbapi, compiled.binds[name].type)
+                     for name in compiled.positiontup]
+            if None in sizes:
+                sizes = None
+        compiled._pyodbc_input_sizes = sizes
+        return sizes
+
+
+class _FastExecutemanyMixin(object):
+    """Bind executemany() parameters as arrays, using pyodbc's
+    ``fast_executemany`` cursor attribute (pyodbc 4.0.19 and later).
+
+    Enabled with ``create_engine(..., fast_executemany=True)``.  pyodbc
+    sends a whole parameter array in one round trip, but allocates the
+    full declared width of every parameter for each row in it; parameter
+    sets are therefore sent in batches sized so that a batch takes
+    roughly ``executemany_buffer_size`` bytes, unless an explicit
+    ``executemany_batch_size`` is given.  The rowcount of the statement
+    is the total over the batches, or -1 if any batch reports none.
+
+    """
+
+    def __init__(self, fast_executemany=False, executemany_batch_size=None,
+                        executemany_buffer_size=8 * 1024 * 1024, **kw):
+        super(_FastExecutemanyMixin, self).__init__(**kw)
+        self.fast_executemany = util.asbool(fast_executemany)
+        self.executemany_batch_size = executemany_batch_size and \
+                                        int(executemany_batch_size)
+        self.executemany_buffer_size = int(executemany_buffer_size)
+
+    def initialize(self, connection):
+        super(_FastExecutemanyMixin, self).initialize(connection)
+        if self.fast_executemany and self._dbapi_version() < (4, 0, 19):
+            util.warn("fast_executemany requires pyodbc 4.0.19 or "
+                        "later; using row-at-a-time executemany")
+            self.fast_executemany = False
+
+    def _executemany_batch_size(self, context):
+        if self.executemany_batch_size:
+            return self.executemany_batch_size
+        compiled = context is not None and context.compiled
+        if not compiled:
+            return None
+        width = sum(_bind_width(compiled.binds[name].type)
+                        for name in compiled.positiontup or compiled.binds)
+        return max(1, self.executemany_buffer_size // max(width, 1))
+
+    def do_executemany(self, cursor, statement, parameters, context=None):
+        if not self.fast_executemany:
+            super(_FastExecutemanyMixin, self).do_executemany(
+                                cursor, statement, parameters, context)
+            return
+
+        cursor.fast_executemany = True
+        size = self._executemany_batch_size(context) or \
+                    max(len(parameters), 1)
+        rowcount = 0
+        for start in range(0, len(parameters), size):
+            super(_FastExecutemanyMixin, self).do_executemany(
+                                cursor, statement,
+                                parameters[start:start + size], context)
+            if cursor.rowcount < 0:
+                rowcount = -1
+            elif rowcount >= 0:
+                rowcount += cursor.rowcount
+        if context is not None and len(parameters) > size:
+            context._batched_rowcount = rowcount
+
+
+class DB2Dialect_pyodbc(_SetInputSizesMixin, _FastExecutemanyMixin,
+                            PyODBCConnector, DB2Dialect):
 
     supports_unicode_statements = False
     supports_native_decimal = True
     supports_char_length = True
-    supports_native_decimal = False
 
     execution_ctx_cls = DB2ExecutionContext_pyodbc
 
@@ -92,15 +306,17 @@ class DB2Dialect_pyodbc(PyODBCConnector, DB2Dialect):
                 connectors.extend(['%s=%s' % (k, v) for k, v in keys.iteritems()])
         return [[";".join(connectors)], connect_args]
 
-class AS400Dialect_pyodbc(PyODBCConnector, DB2Dialect):
+class AS400Dialect_pyodbc(_SetInputSizesMixin, _FastExecutemanyMixin,
+                            PyODBCConnector, DB2Dialect):
 
     supports_unicode_statements = False
     supports_sane_rowcount = False
     supports_sane_multi_rowcount = False
     supports_native_decimal = True
     supports_char_length = True
-    supports_native_decimal = False
 
-    pyodbc_driver_name = "IBM DB2 ODBC DRIVER"
+    execution_ctx_cls = DB2ExecutionContext_pyodbc
 
+    pyodbc_driver_name = "IBM DB2 ODBC DRIVER"
 
+    _reflector_cls = ibm_reflection.AS400Reflector
@@ -1,8 +1,11 @@
 from sqlalchemy import types as sa_types
-from sqlalchemy import sql, util
+from sqlalchemy import sql, util, exc
 from sqlalchemy import Table, MetaData, Column
 from sqlalchemy.engine import reflection
+from sqlalchemy.engine.base import Connection
+from sqlalchemy.util import topological
 import re
+import weakref
 
 
 
@@ -14,16 +17,39 @@ class CoerceUnicode(sa_types.TypeDecorator):
             value = value.decode(dialect.encoding)
         return value
 
+    def bind_processor(self, dialect):
+        if dialect.supports_unicode_binds:
+            return super(CoerceUnicode, self).bind_processor(dialect)
+
+        # the driver takes encoded strings, which is what catalog names
+        # from denormalize_name() already are; don't decode them only to
+        # encode them again
+        encoding = dialect.encoding
+        def process(value):
+            if isinstance(value, unicode):
+                return value.encode(encoding)
+            return value
+        return process
+
+def _statistic(value):
+    # the catalog has -1 where statistics were never collected
+    if value is None or value < 0:
+        return None
+    return int(value)
+
 class BaseReflector(object):
     def __init__(self, dialect):
         self.dialect = dialect
         self.ischema_names = dialect.ischema_names
         self.identifier_preparer = dialect.identifier_preparer
+        # foreign key lookups per reflection pass; see
+        # _foreign_key_cache()
+        self._foreign_key_caches = weakref.WeakKeyDictionary()
 
     def normalize_name(self, name):
         if isinstance(name, str):
             name = name.decode(self.dialect.encoding)
-        elif name != None:
+        if name != None:
             return name.lower() if name.upper() == name and \
                not self.identifier_preparer._requires_quotes(name.lower()) \
                else name
@@ -53,6 +79,283 @@ class BaseReflector(object):
     def default_schema_name(self):
         return self.dialect.default_schema_name
 
+    @property
+    def _server_version(self):
+        # ibm_db reports (DBMS_NAME, DBMS_VER), e.g.
+        # ('DB2/LINUXX8664', '10.05.0005'); pyodbc a tuple of integers
+        info = self.dialect.server_version_info or ()
+        if info and isinstance(info[-1], basestring):
+            return tuple(int(v) for v in re.findall(r"\d+", info[-1]))
+        return tuple(info)
+
+    def get_table_options(self, connection, table_name, schema=None, **kw):
+        return {}
+
+    def get_sequence_options(self, connection, sequence_name, schema=None,
+                                                                    **kw):
+        """Return the ``start`` and ``increment`` of a sequence, and its
+        ``db2_cache`` and ``db2_order`` options.
+
+        :class:`.Sequence` takes no dialect keyword arguments on this
+        SQLAlchemy version; the ``db2_*`` options are set on its ``info``
+        dictionary once it is constructed::
+
+            options = dialect.get_sequence_options(conn, 'order_seq')
+            seq = Sequence('order_seq', start=options.pop('start'),
+                           increment=options.pop('increment'))
+            seq.info.update(options)
+
+        """
+        return {}
+
+    def _identity_info(self, start, increment, cache, order):
+        # dialect options of an identity column or sequence, as
+        # understood by DB2DDLCompiler
+        return {
+            'db2_start': int(start),
+            'db2_increment': int(increment),
+            'db2_cache': cache or False,
+            'db2_order': order == 'Y'
+        }
+
+    def _foreign_key_query(self, current_schema, table_name=None):
+        """Return a query for foreign key columns in a schema, or in one
+        table of it.
+
+        Rows are (constraint name, table name, column name, referred
+        schema, referred table, referred column), ordered by table,
+        constraint and key position.
+
+        """
+        raise NotImplementedError()
+
+    def _foreign_keys_by_table(self, rows, schema):
+        fkeys = {}
+        for conname, tabname, colname, refschema, reftable, refcol in rows:
+            table_fkeys = fkeys.setdefault(
+                                self.normalize_name(tabname), util.OrderedDict())
+            if conname not in table_fkeys:
+                referred_schema = self.normalize_name(refschema)
+
+                # if no schema specified and referred schema here is the
+                # default, then set to None
+                if schema is None and \
+                    referred_schema == self.default_schema_name:
+                    referred_schema = None
+
+                table_fkeys[conname] = {
+                    'name': self.normalize_name(conname),
+                    'constrained_columns': [],
+                    'referred_schema': referred_schema,
+                    'referred_table': self.normalize_name(reftable),
+                    'referred_columns': []}
+            fkey = table_fkeys[conname]
+            fkey['constrained_columns'].append(self.normalize_name(colname))
+            fkey['referred_columns'].append(self.normalize_name(refcol))
+        return dict((tabname, list(table_fkeys.values()))
+                    for tabname, table_fkeys in fkeys.items())
+
+    @reflection.cache
+    def get_foreign_key_graph(self, connection, schema=None, **kw):
+        """Return the foreign keys of every table in a schema.
+
+        The result is a dictionary of table name to a list of foreign key
+        records as returned by :meth:`.get_foreign_keys`, loaded with a
+        single catalog query.
+
+        """
+        current_schema = self.denormalize_name(
+                                schema or self.default_schema_name)
+        return self._foreign_keys_by_table(
+                    connection.execute(self._foreign_key_query(current_schema)),
+                    schema)
+
+    def _foreign_key_cache(self, connection, info_cache):
+        # MetaData.reflect() inspects each table with a new Inspector, but
+        # all on the Connection it opens for the call, so lookups made
+        # through a Connection are counted per Connection object rather
+        # than per Inspector; a pooled DBAPI connection outlives any one
+        # reflection pass.  See forget_foreign_keys()
+        if isinstance(connection, Connection):
+            return self._foreign_key_caches.setdefault(connection, {})
+        return info_cache
+
+    def forget_foreign_keys(self, connection):
+        """Discard the foreign keys looked up on a Connection, as after
+        DDL."""
+
+        self._foreign_key_caches.pop(connection, None)
+
+    @reflection.cache
+    def get_foreign_keys(self, connection, table_name, schema=None, **kw):
+        cache = self._foreign_key_cache(connection, kw.get('info_cache'))
+        if cache is not None:
+            # the first table looked up gets its own query; once a second
+            # table of the same schema is asked for, all further lookups
+            # are served from the schema-wide graph
+            lookups_key = ('_fk_lookups', schema)
+            lookups = cache[lookups_key] = cache.get(lookups_key, 0) + 1
+            if lookups > 1:
+                graph_key = ('_fk_graph', schema)
+                if graph_key not in cache:
+                    cache[graph_key] = self.get_foreign_key_graph(
+                                                    connection, schema)
+                return cache[graph_key].get(table_name, [])
+
+        current_schema = self.denormalize_name(
+                                schema or self.default_schema_name)
+        query = self._foreign_key_query(current_schema,
+                                    self.denormalize_name(table_name))
+        return self._foreign_keys_by_table(
+                    connection.execute(query), schema).get(table_name, [])
+
+    def _table_statistics_query(self, current_schema, table_name=None):
+        """Return a query for the statistics of the tables in a schema, or
+        of one table of it.
+
+        Rows are (table name, row count, pages, statistics time).
+
+        """
+        raise NotImplementedError()
+
+    def _index_statistics_query(self, current_schema):
+        """Return a query for the statistics of the indexes in a schema.
+
+        Rows are (table name, index name, distinct keys, leaf pages,
+        levels, cluster ratio, statistics time).
+
+        """
+        raise NotImplementedError()
+
+    def _table_statistics(self, rows):
+        return dict((self.normalize_name(tabname), {
+                        'row_count': _statistic(card),
+                        'pages': _statistic(pages),
+                        'stats_time': stats_time})
+                    for tabname, card, pages, stats_time in rows)
+
+    @reflection.cache
+    def get_table_statistics(self, connection, schema=None, **kw):
+        """Return the catalog statistics of every table in a schema.
+
+        The result is a dictionary of table name to a dictionary of
+        ``row_count``, ``pages`` and ``stats_time``, loaded with a single
+        catalog query.  Values are as of the last statistics collection
+        (RUNSTATS on DB2), and None where the catalog has none.
+
+        """
+        current_schema = self.denormalize_name(
+                                schema or self.default_schema_name)
+        return self._table_statistics(connection.execute(
+                    self._table_statistics_query(current_schema)))
+
+    @reflection.cache
+    def get_index_statistics(self, connection, schema=None, **kw):
+        """Return the catalog statistics of every index in a schema.
+
+        The result is a dictionary of table name to a list of dictionaries
+        of ``name``, ``distinct_keys``, ``leaf_pages``, ``levels``,
+        ``cluster_ratio`` and ``stats_time``, loaded with a single catalog
+        query; values the catalog doesn't have are None.
+
+        """
+        current_schema = self.denormalize_name(
+                                schema or self.default_schema_name)
+        indexes = {}
+        for r in connection.execute(
+                        self._index_statistics_query(current_schema)):
+            indexes.setdefault(self.normalize_name(r[0]), []).append({
+                        'name': self.normalize_name(r[1]),
+                        'distinct_keys': _statistic(r[2]),
+                        'leaf_pages': _statistic(r[3]),
+                        'levels': _statistic(r[4]),
+                        'cluster_ratio': _statistic(r[5]),
+                        'stats_time': r[6]})
+        return indexes
+
+    def get_approximate_row_count(self, connection, table_name, schema=None,
+                                                                    **kw):
+        """Return the row count of a table as of its last statistics
+        collection, or None if there are no statistics; this reads the
+        catalog rather than the table."""
+
+        current_schema = self.denormalize_name(
+                                schema or self.default_schema_name)
+        query = self._table_statistics_query(current_schema,
+                                    self.denormalize_name(table_name))
+        statistics = self._table_statistics(
+                    connection.execute(query)).get(table_name)
+        if statistics is None:
+            raise exc.NoSuchTableError(table_name)
+        return statistics['row_count']
+
+    def _materialized_query_table_query(self, current_schema):
+        """Return a query for the materialized query tables of a schema.
+
+        Rows are (table name, refresh type, maintenance type, last refresh
+        time, definition), with refresh type ``'D'`` (deferred) or ``'I'``
+        (immediate) and maintenance type ``'S'`` (system) or ``'U'``
+        (user).
+
+        """
+        raise NotImplementedError()
+
+    @reflection.cache
+    def get_materialized_query_tables(self, connection, schema=None, **kw):
+        """Return the materialized query tables of a schema.
+
+        The result is a dictionary of table name to a dictionary of
+        ``definition`` (the ``CREATE TABLE`` statement, as stored in the
+        catalog), ``refresh`` (``'deferred'`` or ``'immediate'``),
+        ``maintained_by`` (``'system'`` or ``'user'``) and
+        ``refresh_time``, loaded with a single catalog query.
+
+        """
+        current_schema = self.denormalize_name(
+                                schema or self.default_schema_name)
+        refresh_types = {'D': 'deferred', 'I': 'immediate'}
+        maintenance_types = {'S': 'system', 'U': 'user'}
+        return dict((self.normalize_name(tabname), {
+                        'definition': text,
+                        'refresh': refresh_types.get(refresh),
+                        'maintained_by': maintenance_types.get(maintenance),
+                        'refresh_time': refresh_time})
+                    for tabname, refresh, maintenance, refresh_time, text
+                    in connection.execute(
+                        self._materialized_query_table_query(current_schema)))
+
+    def get_materialized_query_table_names(self, connection, schema=None,
+                                                                    **kw):
+        return sorted(self.get_materialized_query_tables(
+                                connection, schema, **kw))
+
+    @reflection.cache
+    def get_sorted_table_names(self, connection, schema=None, **kw):
+        """Return the table names of a schema, ordered so that each table
+        follows the tables it refers to by foreign key.
+
+        Foreign keys into other schemas and self-referential foreign keys
+        are disregarded.  Raises CircularDependencyError if the tables
+        can't be ordered.
+
+        """
+        table_names = self.get_table_names(connection, schema, **kw)
+        graph = self.get_foreign_key_graph(connection, schema, **kw)
+        tables = set(table_names)
+        dependencies = set()
+        for tabname, fkeys in graph.items():
+            for fkey in fkeys:
+                referred_table = fkey['referred_table']
+                if referred_table != tabname and \
+                        referred_table in tables and \
+                        fkey['referred_schema'] == (schema or None):
+                    dependencies.add((referred_table, tabname))
+
+        sorted_names = []
+        for subset in topological.sort_as_subsets(dependencies, table_names):
+            sorted_names.extend(sorted(subset))
+        return sorted_names
+
 class DB2Reflector(BaseReflector):
     ischema = MetaData()
 
@@ -72,27 +375,81 @@ class DB2Reflector(BaseReflector):
       Column("OWNERTYPE", CoerceUnicode, key="ownertype"),
       Column("TYPE", CoerceUnicode, key="type"),
       Column("STATUS", CoerceUnicode, key="status"),
+      Column("TBSPACE", CoerceUnicode, key="tbspace"),
+      Column("INDEX_TBSPACE", CoerceUnicode, key="index_tbspace"),
+      Column("LONG_TBSPACE", CoerceUnicode, key="long_tbspace"),
+      Column("PARTITION_MODE", CoerceUnicode, key="partition_mode"),
+      Column("COMPRESSION", CoerceUnicode, key="compression"),
+      Column("ROWCOMPMODE", CoerceUnicode, key="rowcompmode"),
+      Column("TABLEORG", CoerceUnicode, key="tableorg"),
+      Column("CARD", sa_types.BigInteger, key="card"),
+      Column("NPAGES", sa_types.BigInteger, key="npages"),
+      Column("STATS_TIME", sa_types.DateTime, key="stats_time"),
+      Column("REFRESH", CoerceUnicode, key="refresh"),
+      Column("REFRESH_TIME", sa_types.DateTime, key="refresh_time"),
+      Column("PROPERTY", CoerceUnicode, key="property"),
+      schema="SYSCAT")
+
+    sys_datapartitionexpression = Table("DATAPARTITIONEXPRESSION", ischema,
+      Column("TABSCHEMA", CoerceUnicode, key="tabschema"),
+      Column("TABNAME", CoerceUnicode, key="tabname"),
+      Column("DATAPARTITIONKEYSEQ", sa_types.Integer, key="keyseq"),
+      Column("DATAPARTITIONEXPRESSION", CoerceUnicode, key="expression"),
+      schema="SYSCAT")
+
+    sys_datapartitions = Table("DATAPARTITIONS", ischema,
+      Column("TABSCHEMA", CoerceUnicode, key="tabschema"),
+      Column("TABNAME", CoerceUnicode, key="tabname"),
+      Column("DATAPARTITIONNAME", CoerceUnicode, key="partname"),
+      Column("SEQNO", sa_types.Integer, key="seqno"),
+      Column("LOWVALUE", CoerceUnicode, key="lowvalue"),
+      Column("LOWINCLUSIVE", CoerceUnicode, key="lowinclusive"),
+      Column("HIGHVALUE", CoerceUnicode, key="highvalue"),
+      Column("HIGHINCLUSIVE", CoerceUnicode, key="highinclusive"),
       schema="SYSCAT")
 
     sys_indexes = Table("INDEXES", ischema,
       Column("TABSCHEMA", CoerceUnicode, key="tabschema"),
       Column("TABNAME", CoerceUnicode, key="tabname"),
+      Column("INDSCHEMA", CoerceUnicode, key="indschema"),
       Column("INDNAME", CoerceUnicode, key="indname"),
       Column("COLNAMES", CoerceUnicode, key="colnames"),
       Column("UNIQUERULE", CoerceUnicode, key="uniquerule"),
+      Column("INDEXTYPE", CoerceUnicode, key="indextype"),
+      Column("PCTFREE", sa_types.Integer, key="pctfree"),
+      Column("REVERSE_SCANS", CoerceUnicode, key="reverse_scans"),
+      Column("COMPRESSION", CoerceUnicode, key="compression"),
+      Column("FULLKEYCARD", sa_types.BigInteger, key="fullkeycard"),
+      Column("NLEAF", sa_types.BigInteger, key="nleaf"),
+      Column("NLEVELS", sa_types.SmallInteger, key="nlevels"),
+      Column("CLUSTERRATIO", sa_types.SmallInteger, key="clusterratio"),
+      Column("STATS_TIME", sa_types.DateTime, key="stats_time"),
       schema="SYSCAT")
 
-    sys_foreignkeys = Table("SQLFOREIGNKEYS", ischema,
-      Column("FK_NAME", CoerceUnicode, key="fkname"),
-      Column("FKTABLE_SCHEM", CoerceUnicode, key="fktabschema"),
-      Column("FKTABLE_NAME", CoerceUnicode, key="fktabname"),
-      Column("FKCOLUMN_NAME", CoerceUnicode, key="fkcolname"),
-      Column("PK_NAME", CoerceUnicode, key="pkname"),
-      Column("PKTABLE_SCHEM", CoerceUnicode, key="pktabschema"),
-      Column("PKTABLE_NAME", CoerceUnicode, key="pktabname"),
-      Column("PKCOLUMN_NAME", CoerceUnicode, key="pkcolname"),
-      Column("KEY_SEQ", sa_types.Integer, key="colno"),
-      schema="SYSIBM")
+    sys_indexcoluse = Table("INDEXCOLUSE", ischema,
+      Column("INDSCHEMA", CoerceUnicode, key="indschema"),
+      Column("INDNAME", CoerceUnicode, key="indname"),
+      Column("COLNAME", CoerceUnicode, key="colname"),
+      Column("COLSEQ", sa_types.Integer, key="colseq"),
+      Column("COLORDER", CoerceUnicode, key="colorder"),
+      schema="SYSCAT")
+
+    sys_references = Table("REFERENCES", ischema,
+      Column("CONSTNAME", CoerceUnicode, key="constname"),
+      Column("TABSCHEMA", CoerceUnicode, key="tabschema"),
+      Column("TABNAME", CoerceUnicode, key="tabname"),
+      Column("REFKEYNAME", CoerceUnicode, key="refkeyname"),
+      Column("REFTABSCHEMA", CoerceUnicode, key="reftabschema"),
+      Column("REFTABNAME", CoerceUnicode, key="reftabname"),
+      schema="SYSCAT")
+
+    sys_keycoluse = Table("KEYCOLUSE", ischema,
+      Column("CONSTNAME", CoerceUnicode, key="constname"),
+      Column("TABSCHEMA", CoerceUnicode, key="tabschema"),
+      Column("TABNAME", CoerceUnicode, key="tabname"),
+      Column("COLNAME", CoerceUnicode, key="colname"),
+      Column("COLSEQ", sa_types.Integer, key="colseq"),
+      schema="SYSCAT")
 
     sys_columns = Table("COLUMNS", ischema,
       Column("TABSCHEMA", CoerceUnicode, key="tabschema"),
@@ -104,6 +461,19 @@ class DB2Reflector(BaseReflector):
       Column("SCALE", sa_types.Integer, key="scale"),
       Column("DEFAULT", CoerceUnicode, key="defaultval"),
       Column("NULLS", CoerceUnicode, key="nullable"),
+      Column("PARTKEYSEQ", sa_types.Integer, key="partkeyseq"),
+      Column("IDENTITY", CoerceUnicode, key="identity"),
+      Column("GENERATED", CoerceUnicode, key="generated"),
+      schema="SYSCAT")
+
+    sys_colidentattributes = Table("COLIDENTATTRIBUTES", ischema,
+      Column("TABSCHEMA", CoerceUnicode, key="tabschema"),
+      Column("TABNAME", CoerceUnicode, key="tabname"),
+      Column("COLNAME", CoerceUnicode, key="colname"),
+      Column("START", sa_types.Numeric(31, 0), key="start"),
+      Column("INCREMENT", sa_types.Numeric(31, 0), key="increment"),
+      Column("CACHE", sa_types.Integer, key="cache"),
+      Column("ORDER", CoerceUnicode, key="order"),
       schema="SYSCAT")
 
     sys_views = Table("VIEWS", ischema,
@@ -115,6 +485,10 @@ class DB2Reflector(BaseReflector):
     sys_sequences = Table("SEQUENCES", ischema,
       Column("SEQSCHEMA", CoerceUnicode, key="seqschema"),
       Column("SEQNAME", CoerceUnicode, key="seqname"),
+      Column("START", sa_types.Numeric(31, 0), key="start"),
+      Column("INCREMENT", sa_types.Numeric(31, 0), key="increment"),
+      Column("CACHE", sa_types.Integer, key="cache"),
+      Column("ORDER", CoerceUnicode, key="order"),
       schema="SYSCAT")
 
     def has_table(self, connection, table_name, schema=None):
@@ -142,6 +516,27 @@ class DB2Reflector(BaseReflector):
         c = connection.execute(s)
         return c.first() is not None
 
+    @reflection.cache
+    def get_sequence_options(self, connection, sequence_name, schema=None,
+                                                                    **kw):
+        current_schema = self.denormalize_name(schema or self.default_schema_name)
+        sequence_name = self.denormalize_name(sequence_name)
+        sysseq = self.sys_sequences
+        query = sql.select([sysseq.c.start, sysseq.c.increment,
+                            sysseq.c.cache, sysseq.c.order],
+              sql.and_(
+                  sysseq.c.seqschema == current_schema,
+                  sysseq.c.seqname == sequence_name
+                )
+            )
+        row = connection.execute(query).first()
+        if row is None:
+            return {}
+        options = self._identity_info(*row)
+        options['start'] = options.pop('db2_start')
+        options['increment'] = options.pop('db2_increment')
+        return options
+
     def get_schema_names(self, connection, **kw):
         sysschema = self.sys_schemas
         query = sql.select([sysschema.c.schemaname],
@@ -164,9 +559,16 @@ class DB2Reflector(BaseReflector):
     @reflection.cache
     def get_view_names(self, connection, schema=None, **kw):
         current_schema = self.denormalize_name(schema or self.default_schema_name)
+        systbl = self.sys_tables
 
+        # SYSCAT.VIEWS lists materialized query tables as well
         query = sql.select([self.sys_views.c.viewname],
-            self.sys_views.c.viewschema == current_schema,
+            sql.and_(
+                self.sys_views.c.viewschema == current_schema,
+                systbl.c.tabschema == self.sys_views.c.viewschema,
+                systbl.c.tabname == self.sys_views.c.viewname,
+                systbl.c.type == 'V'
+            ),
             order_by=[self.sys_views.c.viewname]
           )
         return [self.normalize_name(r[0]) for r in connection.execute(query)]
@@ -182,6 +584,94 @@ class DB2Reflector(BaseReflector):
           )
         return connection.execute(query).scalar()
 
+    @reflection.cache
+    def get_table_options(self, connection, table_name, schema=None, **kw):
+        current_schema = self.denormalize_name(schema or self.default_schema_name)
+        table_name = self.denormalize_name(table_name)
+        systbl = self.sys_tables
+        sysexpr = self.sys_datapartitionexpression
+        server_version = self._server_version
+
+        # the number of range partitioning key columns comes along, so
+        # that only partitioned tables take further queries
+        partition_keys = sql.select([sql.func.count(sysexpr.c.keyseq)],
+              sql.and_(
+                  sysexpr.c.tabschema == systbl.c.tabschema,
+                  sysexpr.c.tabname == systbl.c.tabname
+                )
+            ).as_scalar()
+        columns = [systbl.c.tbspace, systbl.c.index_tbspace,
+                   systbl.c.long_tbspace, systbl.c.partition_mode,
+                   systbl.c.compression, partition_keys]
+        # ROWCOMPMODE is new in DB2 10.1, TABLEORG in 10.5
+        if server_version >= (10, 1):
+            columns.append(systbl.c.rowcompmode)
+        if server_version >= (10, 5):
+            columns.append(systbl.c.tableorg)
+        query = sql.select(columns,
+              sql.and_(
+                  systbl.c.tabschema == current_schema,
+                  systbl.c.tabname == table_name
+                )
+            )
+        row = connection.execute(query).first()
+        if row is None:
+            return {}
+
+        options = {}
+        for key, value in (('db2_tablespace', row[0]),
+                           ('db2_index_tablespace', row[1]),
+                           ('db2_long_tablespace', row[2])):
+            if value:
+                options[key] = self.normalize_name(value.strip())
+
+        if row[4] in ('R', 'B'):
+            if server_version >= (10, 1) and row[6] == 'A':
+                options['db2_compress'] = 'adaptive'
+            else:
+                options['db2_compress'] = 'static'
+        if server_version >= (10, 5) and row[7] == 'C':
+            options['db2_organize_by'] = 'column'
+
+        if row[3] == 'H':
+            syscols = self.sys_columns
+            query = sql.select([syscols.c.colname],
+                  sql.and_(
+                      syscols.c.tabschema == current_schema,
+                      syscols.c.tabname == table_name,
+                      syscols.c.partkeyseq > 0
+                    ),
+                  order_by=[syscols.c.partkeyseq]
+                )
+            options['db2_distribute_by'] = [self.normalize_name(r[0])
+                                    for r in connection.execute(query)]
+
+        if row[5]:
+            query = sql.select([sysexpr.c.expression],
+                  sql.and_(
+                      sysexpr.c.tabschema == current_schema,
+                      sysexpr.c.tabname == table_name
+                    ),
+                  order_by=[sysexpr.c.keyseq]
+                )
+            options['db2_partition_by'] = [self.normalize_name(r[0].strip())
+                                    for r in connection.execute(query)]
+            sysparts = self.sys_datapartitions
+            query = sql.select([sysparts.c.partname, sysparts.c.lowvalue,
+                                sysparts.c.highvalue, sysparts.c.highinclusive,
+                                sysparts.c.lowinclusive],
+                  sql.and_(
+                      sysparts.c.tabschema == current_schema,
+                      sysparts.c.tabname == table_name
+                    ),
+                  order_by=[sysparts.c.seqno]
+                )
+            options['db2_partitions'] = [
+                        (self.normalize_name(r[0]), r[1], r[2],
+                            r[3] == 'N', r[4] == 'N')
+                        for r in connection.execute(query)]
+        return options
+
     @reflection.cache
     def get_columns(self, connection, table_name, schema=None, **kw):
         current_schema = self.denormalize_name(schema or self.default_schema_name)
@@ -190,15 +680,32 @@ class DB2Reflector(BaseReflector):
 
         query = sql.select([syscols.c.colname, syscols.c.typename,
                             syscols.c.defaultval, syscols.c.nullable,
-                            syscols.c.length, syscols.c.scale],
+                            syscols.c.length, syscols.c.scale,
+                            syscols.c.identity, syscols.c.generated],
               sql.and_(
                   syscols.c.tabschema == current_schema,
                   syscols.c.tabname == table_name
                 ),
               order_by=[syscols.c.colno]
             )
+        rows = connection.execute(query).fetchall()
+
+        identity = {}
+        if any(r[6] == 'Y' for r in rows):
+            sysident = self.sys_colidentattributes
+            query = sql.select([sysident.c.colname, sysident.c.start,
+                                sysident.c.increment, sysident.c.cache,
+                                sysident.c.order],
+                  sql.and_(
+                      sysident.c.tabschema == current_schema,
+                      sysident.c.tabname == table_name
+                    )
+                )
+            for r in connection.execute(query):
+                identity[r[0]] = self._identity_info(*r[1:])
+
         sa_columns = []
-        for r in connection.execute(query):
+        for r in rows:
             coltype = r[1].upper()
             if coltype in ['DECIMAL', 'NUMERIC']:
                 coltype = self.ischema_names.get(coltype)(int(r[4]), int(r[5]))
@@ -213,13 +720,19 @@ class DB2Reflector(BaseReflector):
                             (coltype, r[0]))
                     coltype = coltype = sa_types.NULLTYPE
 
-            sa_columns.append({
+            column = {
                     'name': self.normalize_name(r[0]),
                     'type': coltype,
                     'nullable': r[3] == 'Y',
                     'default': r[2],
                     'autoincrement': r[2] is None
-                })
+                }
+            if r[0] in identity:
+                info = identity[r[0]]
+                info['db2_generated_always'] = r[7] == 'A'
+                column['autoincrement'] = True
+                column['info'] = info
+            sa_columns.append(column)
         return sa_columns
 
     @reflection.cache
@@ -242,68 +755,113 @@ class DB2Reflector(BaseReflector):
             pk_columns.extend(cols)
         return [self.normalize_name(col) for col in pk_columns]
 
-    @reflection.cache
-    def get_foreign_keys(self, connection, table_name, schema=None, **kw):
-        current_schema = self.denormalize_name(schema or self.default_schema_name)
-        table_name = self.denormalize_name(table_name)
-        sysfkeys = self.sys_foreignkeys
-        query = sql.select([sysfkeys.c.fkname, sysfkeys.c.fktabschema, \
-                            sysfkeys.c.fktabname, sysfkeys.c.fkcolname, \
-                            sysfkeys.c.pkname, sysfkeys.c.pktabschema, \
-                            sysfkeys.c.pktabname, sysfkeys.c.pkcolname],
+    def _foreign_key_query(self, current_schema, table_name=None):
+        sysrefs = self.sys_references
+        fkcols = self.sys_keycoluse.alias("fkcols")
+        pkcols = self.sys_keycoluse.alias("pkcols")
+        query = sql.select([sysrefs.c.constname, sysrefs.c.tabname,
+                            fkcols.c.colname, sysrefs.c.reftabschema,
+                            sysrefs.c.reftabname, pkcols.c.colname],
             sql.and_(
-              sysfkeys.c.fktabschema == current_schema,
-              sysfkeys.c.fktabname == table_name
+              fkcols.c.constname == sysrefs.c.constname,
+              fkcols.c.tabschema == sysrefs.c.tabschema,
+              fkcols.c.tabname == sysrefs.c.tabname,
+              pkcols.c.constname == sysrefs.c.refkeyname,
+              pkcols.c.tabschema == sysrefs.c.reftabschema,
+              pkcols.c.tabname == sysrefs.c.reftabname,
+              pkcols.c.colseq == fkcols.c.colseq,
+              sysrefs.c.tabschema == current_schema
             ),
-            order_by=[sysfkeys.c.colno]
+            order_by=[sysrefs.c.tabname, sysrefs.c.constname,
+                      fkcols.c.colseq]
           )
+        if table_name is not None:
+            query = query.where(sysrefs.c.tabname == table_name)
+        return query
 
-        fschema = {}
-        for r in connection.execute(query):
-            if not fschema.has_key(r[0]):
-                referred_schema = self.normalize_name(r[5])
-
-                # if no schema specified and referred schema here is the
-                # default, then set to None
-                if schema is None and \
-                    referred_schema == self.default_schema_name:
-                    referred_schema = None
-
-                fschema[r[0]] = {
-                    'name': self.normalize_name(r[0]),
-                  'constrained_columns': [self.normalize_name(r[3])],
-                  'referred_schema': referred_schema,
-                  'referred_table': self.normalize_name(r[6]),
-                  'referred_columns': [self.normalize_name(r[7])]}
-            else:
-                fschema[r[0]]['constrained_columns'].append(self.normalize_name(r[3]))
-                fschema[r[0]]['referred_columns'].append(self.normalize_name(r[7]))
-        return [value for key, value in fschema.iteritems()]
+    def _table_statistics_query(self, current_schema, table_name=None):
+        systbl = self.sys_tables
+        query = sql.select([systbl.c.tabname, systbl.c.card,
+                            systbl.c.npages, systbl.c.stats_time],
+                    sql.and_(systbl.c.tabschema == current_schema,
+                             systbl.c.type.in_(['T', 'S'])))
+        if table_name is not None:
+            query = query.where(systbl.c.tabname == table_name)
+        return query
+
+    def _index_statistics_query(self, current_schema):
+        sysidx = self.sys_indexes
+        return sql.select([sysidx.c.tabname, sysidx.c.indname,
+                           sysidx.c.fullkeycard, sysidx.c.nleaf,
+                           sysidx.c.nlevels, sysidx.c.clusterratio,
+                           sysidx.c.stats_time],
+                    sysidx.c.tabschema == current_schema,
+                    order_by=[sysidx.c.tabname, sysidx.c.indname])
 
+    def _materialized_query_table_query(self, current_schema):
+        systbl = self.sys_tables
+        sysviews = self.sys_views
+        # the first character of PROPERTY is 'Y' for a user maintained MQT
+        maintenance = sql.case(
+                    [(systbl.c.property.like('Y%'),
+                      sql.literal_column("'U'"))],
+                    else_=sql.literal_column("'S'"))
+        return sql.select([systbl.c.tabname, systbl.c.refresh, maintenance,
+                           systbl.c.refresh_time, sysviews.c.text],
+                    sql.and_(systbl.c.tabschema == current_schema,
+                             systbl.c.type == 'S'),
+                    from_obj=[systbl.outerjoin(sysviews, sql.and_(
+                                sysviews.c.viewschema == systbl.c.tabschema,
+                                sysviews.c.viewname == systbl.c.tabname))],
+                    order_by=[systbl.c.tabname])
 
     @reflection.cache
     def get_indexes(self, connection, table_name, schema=None, **kw):
         current_schema = self.denormalize_name(schema or self.default_schema_name)
         table_name = self.denormalize_name(table_name)
         sysidx = self.sys_indexes
-        query = sql.select([sysidx.c.indname, sysidx.c.colnames, sysidx.c.uniquerule],
+        syscoluse = self.sys_indexcoluse
+        query = sql.select([sysidx.c.indname, sysidx.c.uniquerule,
+                            sysidx.c.indextype, sysidx.c.pctfree,
+                            sysidx.c.reverse_scans, sysidx.c.compression,
+                            syscoluse.c.colname, syscoluse.c.colorder],
             sql.and_(
               sysidx.c.tabschema == current_schema,
-              sysidx.c.tabname == table_name
+              sysidx.c.tabname == table_name,
+              sysidx.c.uniquerule != 'P',
+              syscoluse.c.indschema == sysidx.c.indschema,
+              syscoluse.c.indname == sysidx.c.indname
             ),
-            order_by=[sysidx.c.tabname]
+            order_by=[sysidx.c.indname, syscoluse.c.colseq]
           )
-        indexes = []
-        col_finder = re.compile("(\w+)")
+        indexes = util.OrderedDict()
         for r in connection.execute(query):
-            if r[2] != 'P':
-                indexes.append({
+            index = indexes.get(r[0])
+            if index is None:
+                options = {
+                        'db2_cluster': r[2] == 'CLUS',
+                        'db2_allow_reverse_scans': r[4] == 'Y',
+                        'db2_compress': r[5] == 'Y'
+                    }
+                if r[3] is not None and r[3] >= 0:
+                    options['db2_pctfree'] = r[3]
+                index = indexes[r[0]] = {
                         'name': self.normalize_name(r[0]),
-                        'column_names': [self.normalize_name(col)
-                                        for col in col_finder.findall(r[1])],
-                        'unique': r[2] == 'U'
-                    })
-        return indexes
+                        'column_names': [],
+                        'unique': r[1] == 'U',
+                        'column_sorting': {},
+                        'dialect_options': options
+                    }
+            colname = self.normalize_name(r[6])
+            if r[7] == 'I':
+                # INCLUDE column; stored in the index leaf pages only
+                index['dialect_options'].setdefault(
+                                        'db2_include', []).append(colname)
+            else:
+                index['column_names'].append(colname)
+                if r[7] == 'D':
+                    index['column_sorting'][colname] = ('desc',)
+        return list(indexes.values())
 
 class AS400Reflector(BaseReflector):
 
@@ -317,6 +875,10 @@ class AS400Reflector(BaseReflector):
       Column("TABLE_SCHEMA", CoerceUnicode, key="tabschema"),
       Column("TABLE_NAME", CoerceUnicode, key="tabname"),
       Column("TABLE_TYPE", CoerceUnicode, key="tabtype"),
+      Column("MAINTENANCE", CoerceUnicode, key="maintenance"),
+      Column("REFRESH", CoerceUnicode, key="refresh"),
+      Column("REFRESH_TIME", sa_types.DateTime, key="refresh_time"),
+      Column("MQT_DEFINITION", CoerceUnicode, key="mqt_definition"),
       schema="QSYS2")
 
     sys_table_constraints = Table("SYSCST", ischema,
@@ -366,17 +928,12 @@ class AS400Reflector(BaseReflector):
       Column("ORDERING", CoerceUnicode, key="ordering"),
       schema="QSYS2")
 
-    sys_foreignkeys = Table("SQLFOREIGNKEYS", ischema,
-      Column("FK_NAME", CoerceUnicode, key="fkname"),
-      Column("FKTABLE_SCHEM", CoerceUnicode, key="fktabschema"),
-      Column("FKTABLE_NAME", CoerceUnicode, key="fktabname"),
-      Column("FKCOLUMN_NAME", CoerceUnicode, key="fkcolname"),
-      Column("PK_NAME", CoerceUnicode, key="pkname"),
-      Column("PKTABLE_SCHEM", CoerceUnicode, key="pktabschema"),
-      Column("PKTABLE_NAME", CoerceUnicode, key="pktabname"),
-      Column("PKCOLUMN_NAME", CoerceUnicode, key="pkcolname"),
-      Column("KEY_SEQ", sa_types.Integer, key="colno"),
-      schema="SYSIBM")
+    sys_ref_constraints = Table("SYSREFCST", ischema,
+      Column("CONSTRAINT_SCHEMA", CoerceUnicode, key="conschema"),
+      Column("CONSTRAINT_NAME", CoerceUnicode, key="conname"),
+      Column("UNIQUE_CONSTRAINT_SCHEMA", CoerceUnicode, key="uniqueschema"),
+      Column("UNIQUE_CONSTRAINT_NAME", CoerceUnicode, key="uniquename"),
+      schema="QSYS2")
 
     sys_views = Table("SYSVIEWS", ischema,
       Column("TABLE_SCHEMA", CoerceUnicode, key="viewschema"),
@@ -389,6 +946,18 @@ class AS400Reflector(BaseReflector):
       Column("SEQUENCE_NAME", CoerceUnicode, key="seqname"),
       schema="QSYS2")
 
+    sys_table_stats = Table("SYSTABLESTAT", ischema,
+      Column("TABLE_SCHEMA", CoerceUnicode, key="tabschema"),
+      Column("TABLE_NAME", CoerceUnicode, key="tabname"),
+      Column("NUMBER_ROWS", sa_types.BigInteger, key="number_rows"),
+      schema="QSYS2")
+
+    sys_index_stats = Table("SYSINDEXSTAT", ischema,
+      Column("INDEX_SCHEMA", CoerceUnicode, key="indschema"),
+      Column("INDEX_NAME", CoerceUnicode, key="indname"),
+      Column("NUMBER_KEYS", sa_types.BigInteger, key="number_keys"),
+      schema="QSYS2")
+
     def has_table(self, connection, table_name, schema=None):
         current_schema = self.denormalize_name(
                                 schema or self.default_schema_name)
@@ -525,36 +1094,59 @@ class AS400Reflector(BaseReflector):
         return [self.normalize_name(key[0])
                     for key in connection.execute(query)]
 
-    @reflection.cache
-    def get_foreign_keys(self, connection, table_name, schema=None, **kw):
-        current_schema = self.denormalize_name(
-                                    schema or self.default_schema_name)
-        table_name = self.denormalize_name(table_name)
-        sysfkeys = self.sys_foreignkeys
-        query = sql.select([sysfkeys.c.fkname, sysfkeys.c.fktabschema, \
-                                sysfkeys.c.fktabname, sysfkeys.c.fkcolname, \
-                                sysfkeys.c.pkname, sysfkeys.c.pktabschema, \
-                                sysfkeys.c.pktabname, sysfkeys.c.pkcolname],
+    def _foreign_key_query(self, current_schema, table_name=None):
+        sysrefs = self.sys_ref_constraints
+        fkcols = self.sys_key_constraints.alias("fkcols")
+        pkcols = self.sys_key_constraints.alias("pkcols")
+        query = sql.select([sysrefs.c.conname, fkcols.c.tabname,
+                            fkcols.c.colname, pkcols.c.tabschema,
+                            pkcols.c.tabname, pkcols.c.colname],
                 sql.and_(
-                    sysfkeys.c.fktabschema == current_schema,
-                    sysfkeys.c.fktabname == table_name
+                    fkcols.c.conschema == sysrefs.c.conschema,
+                    fkcols.c.conname == sysrefs.c.conname,
+                    pkcols.c.conschema == sysrefs.c.uniqueschema,
+                    pkcols.c.conname == sysrefs.c.uniquename,
+                    pkcols.c.colno == fkcols.c.colno,
+                    fkcols.c.tabschema == current_schema
                 ),
-                order_by=[sysfkeys.c.colno]
+                order_by=[fkcols.c.tabname, sysrefs.c.conname,
+                          fkcols.c.colno]
             )
-        fschema = {}
-        for r in connection.execute(query):
-            if not fschema.has_key(r[0]):
-                fschema[r[0]] = {'name': self.normalize_name(r[0]),
-                            'constrained_columns': [self.normalize_name(r[3])],
-                            'referred_schema': self.normalize_name(r[5]),
-                            'referred_table': self.normalize_name(r[6]),
-                            'referred_columns': [self.normalize_name(r[7])]}
-            else:
-                fschema[r[0]]['constrained_columns'].append(
-                                                    self.normalize_name(r[3]))
-                fschema[r[0]]['referred_columns'].append(
-                                                    self.normalize_name(r[7]))
-        return [value for key, value in fschema.iteritems()]
+        if table_name is not None:
+            query = query.where(fkcols.c.tabname == table_name)
+        return query
+
+    # row counts are maintained by the system, there is no collection
+    # time; only the key count of a unique index gives its distinct keys
+    def _table_statistics_query(self, current_schema, table_name=None):
+        stats = self.sys_table_stats
+        query = sql.select([stats.c.tabname, stats.c.number_rows,
+                            sql.null(), sql.null()],
+                    stats.c.tabschema == current_schema)
+        if table_name is not None:
+            query = query.where(stats.c.tabname == table_name)
+        return query
+
+    def _materialized_query_table_query(self, current_schema):
+        systbl = self.sys_tables
+        return sql.select([systbl.c.tabname, systbl.c.refresh,
+                           systbl.c.maintenance, systbl.c.refresh_time,
+                           systbl.c.mqt_definition],
+                    sql.and_(systbl.c.tabschema == current_schema,
+                             systbl.c.tabtype == 'M'),
+                    order_by=[systbl.c.tabname])
+
+    def _index_statistics_query(self, current_schema):
+        sysidx = self.sys_indexes
+        stats = self.sys_index_stats
+        return sql.select([sysidx.c.tabname, sysidx.c.indname,
+                           sql.case([(sysidx.c.uniquerule == 'Y',
+                                      stats.c.number_keys)]),
+                           sql.null(), sql.null(), sql.null(), sql.null()],
+                    sql.and_(sysidx.c.tabschema == current_schema,
+                             stats.c.indschema == sysidx.c.indschema,
+                             stats.c.indname == sysidx.c.indname),
+                    order_by=[sysidx.c.tabname, sysidx.c.indname])
 
     # Retrieves a list of index names for a given schema
     @reflection.cache
@@ -0,0 +1,316 @@
+# +--------------------------------------------------------------------------+
+# |  Licensed Materials - Property of IBM                                    |
+# |                                                                          |
+# | (C) Copyright IBM Corporation 2008.                                      |
+# +--------------------------------------------------------------------------+
+# | This module complies with SQLAlchemy 0.8 and is                          |
+# | Licensed under the Apache License, Version 2.0 (the "License");          |
+# | you may not use this file except in compliance with the License.         |
+# | You may obtain a copy of the License at                                  |
+# | http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable |
+# | law or agreed to in writing, software distributed under the License is   |
+# | distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY |
+# | KIND, either express or implied. See the License for the specific        |
+# | language governing permissions and limitations under the License.        |
+# +--------------------------------------------------------------------------+
+# | Version: 0.3.x                                                           |
+# +--------------------------------------------------------------------------+
+"""Alternate ResultProxy implementations used by the DB2 execution context.
+
+"""
+import collections
+import Queue
+import sys
+import threading
+
+from sqlalchemy.engine.result import ResultProxy
+
+
+def _field_name(key):
+    try:
+        return str(key)
+    except UnicodeError:
+        # not a legal attribute name; namedtuple(rename=True)
+        # will substitute a positional name
+        return '_'
+
+
+def compact_row_class(keys):
+    """Return a namedtuple class with one field per result column.
+
+    Column names which aren't valid Python identifiers, or which
+    repeat, are given positional names such as ``_3``.
+
+    """
+    return collections.namedtuple('CompactRow',
+                        [_field_name(key) for key in keys], rename=True)
+
+
+class CompactRowResultProxy(ResultProxy):
+    """ResultProxy returning rows as plain namedtuples.
+
+    Used when the ``compact_rows`` execution option is set.  Raw rows are
+    fetched ``block_size`` at a time; result processors are applied to
+    a whole block one column at a time, after which each row is stored
+    as a single tuple with no per-row proxy object.  Rows support
+    positional and attribute access, but not lookup by string key or
+    by :class:`.Column`.
+
+    """
+
+    block_size = 1000
+
+    def __init__(self, context, block_size=None):
+        if block_size:
+            self.block_size = block_size
+        self._buffer = collections.deque()
+        super(CompactRowResultProxy, self).__init__(context)
+
+    def _init_metadata(self):
+        super(CompactRowResultProxy, self)._init_metadata()
+        if self._metadata is not None:
+            self._row_cls = compact_row_class(self._metadata.keys)
+            self._column_processors = [
+                        (index, processor) for index, processor
+                        in enumerate(self._metadata._processors)
+                        if processor is not None]
+
+    def _process_block(self, rows):
+        if not rows:
+            return []
+        if self._column_processors:
+            columns = [list(column) for column in zip(*rows)]
+            for index, processor in self._column_processors:
+                columns[index] = [processor(value)
+                                    for value in columns[index]]
+            rows = zip(*columns)
+        new, row_cls = tuple.__new__, self._row_cls
+        return [new(row_cls, row) for row in rows]
+
+    def _fill_buffer(self, size):
+        block = self._process_block(self.cursor.fetchmany(size))
+        self._buffer.extend(block)
+        return len(block)
+
+    def process_rows(self, rows):
+        # rows are processed as blocks when they're fetched
+        return rows
+
+    def _fetchone_impl(self):
+        if not self._buffer and not self._fill_buffer(self.block_size):
+            return None
+        return self._buffer.popleft()
+
+    def _fetchmany_impl(self, size=None):
+        if size is None:
+            size = self.block_size
+        while len(self._buffer) < size:
+            if not self._fill_buffer(max(size - len(self._buffer),
+                                        self.block_size)):
+                break
+        buffer = self._buffer
+        return [buffer.popleft() for i in range(min(size, len(buffer)))]
+
+    def _fetchall_impl(self):
+        rows = list(self._buffer)
+        self._buffer.clear()
+        while self._fill_buffer(self.block_size):
+            rows.extend(self._buffer)
+            self._buffer.clear()
+        return rows
+
+
+class _FetchError(object):
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+def _fetch_blocks(cursor, block_size, blocks, stop):
+    # runs in the fetcher's thread; it holds no reference to the
+    # BlockFetcher, so that an abandoned fetcher can be collected
+    try:
+        while not stop.is_set():
+            rows = cursor.fetchmany(block_size)
+            blocks.put(rows)
+            if not rows:
+                return
+    except Exception:
+        blocks.put(_FetchError(sys.exc_info()))
+
+
+class BlockFetcher(object):
+    """Fetches blocks of raw rows from a cursor in a background thread.
+
+    Up to ``queue_depth`` blocks are held ready, so that the database
+    round trip for the next block overlaps with the processing of the
+    current one.  The cursor must not be used by anything else until
+    :meth:`stop` is called or the rows are exhausted.
+
+    """
+
+    def __init__(self, cursor, block_size, queue_depth=2):
+        self._blocks = Queue.Queue(queue_depth)
+        self._stop = threading.Event()
+        self._done = False
+        self._thread = threading.Thread(target=_fetch_blocks,
+                        args=(cursor, block_size, self._blocks, self._stop))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def next_block(self):
+        """Return the next block of rows; an empty list at the end."""
+
+        if self._done:
+            return []
+        block = self._blocks.get()
+        if isinstance(block, _FetchError):
+            self._done = True
+            exc_info = block.exc_info
+            raise exc_info[0], exc_info[1], exc_info[2]
+        if not block:
+            self._done = True
+        return block
+
+    def stop(self):
+        """Stop fetching and wait for the thread to finish."""
+
+        if not self._thread.is_alive():
+            return
+        self._stop.set()
+        # unblock a put() into a full queue
+        while True:
+            try:
+                self._blocks.get_nowait()
+            except Queue.Empty:
+                break
+        self._thread.join()
+        self._done = True
+
+    def __del__(self):
+        self.stop()
+
+
+class PrefetchResultProxy(ResultProxy):
+    """ResultProxy which fetches the next blocks of rows in the
+    background while the current block is consumed.
+
+    Used when the ``prefetch_rows`` execution option is set; see
+    :class:`.BlockFetcher`.  Other statements must not be run on the
+    connection until the result is exhausted or closed.
+
+    """
+
+    block_size = 1000
+
+    def __init__(self, context, block_size=None, queue_depth=2):
+        if block_size:
+            self.block_size = block_size
+        self._queue_depth = queue_depth
+        self._buffer = collections.deque()
+        self._fetcher = None
+        super(PrefetchResultProxy, self).__init__(context)
+
+    def _init_metadata(self):
+        super(PrefetchResultProxy, self)._init_metadata()
+        if self._metadata is not None:
+            self._fetcher = BlockFetcher(self.cursor, self.block_size,
+                                            self._queue_depth)
+
+    def _fill_buffer(self):
+        if self._fetcher is None:
+            self._non_result()
+        block = self._fetcher.next_block()
+        self._buffer.extend(block)
+        return len(block)
+
+    def _fetchone_impl(self):
+        if not self._buffer and not self._fill_buffer():
+            return None
+        return self._buffer.popleft()
+
+    def _fetchmany_impl(self, size=None):
+        if size is None:
+            size = self.block_size
+        while len(self._buffer) < size:
+            if not self._fill_buffer():
+                break
+        buffer = self._buffer
+        return [buffer.popleft() for i in range(min(size, len(buffer)))]
+
+    def _fetchall_impl(self):
+        rows = list(self._buffer)
+        self._buffer.clear()
+        while self._fill_buffer():
+            rows.extend(self._buffer)
+            self._buffer.clear()
+        return rows
+
+    def close(self, _autoclose_connection=True):
+        # the thread must be done with the cursor before it's closed
+        if self._fetcher is not None:
+            self._fetcher.stop()
+        super(PrefetchResultProxy, self).close(_autoclose_connection)
+
+
+class CallResultProxy(ResultProxy):
+    """ResultProxy for a ``CALL`` statement, reading the result sets the
+    procedure returns one after another.
+
+    Rows are fetched from the current result set as usual; when it is
+    exhausted the cursor is kept open if the procedure returned another,
+    and :meth:`nextset` moves to it.  :meth:`result_sets` iterates over
+    them all, never holding more than the DBAPI's own buffer of rows.
+    OUT and INOUT parameter values are in ``out_parameters``.
+
+    """
+
+    _in_fetch = False
+    _next_set_pending = False
+
+    def nextset(self):
+        """Move to the next result set; return False if there are no
+        more, in which case the result is closed."""
+
+        if self._next_set_pending:
+            self._next_set_pending = False
+        elif self.closed or not self.cursor.nextset():
+            self.close()
+            return False
+        self._init_metadata()
+        return True
+
+    def result_sets(self):
+        """Yield this result once for each result set, positioned on it."""
+
+        if self._metadata is None:
+            return
+        while True:
+            yield self
+            if not self.nextset():
+                return
+
+    def close(self, _autoclose_connection=True):
+        if self._in_fetch and not self.closed and self.cursor.nextset():
+            # the current result set is exhausted, but not the cursor
+            self._next_set_pending = True
+            return
+        super(CallResultProxy, self).close(_autoclose_connection)
+
+    def _fetch(self, method, empty, *args):
+        if self._next_set_pending:
+            # the cursor has already moved on to the next result set
+            return empty
+        self._in_fetch = True
+        try:
+            return method(self, *args)
+        finally:
+            self._in_fetch = False
+
+    def fetchone(self):
+        return self._fetch(ResultProxy.fetchone, None)
+
+    def fetchmany(self, size=None):
+        return self._fetch(ResultProxy.fetchmany, [], size)
+
+    def fetchall(self):
+        return self._fetch(ResultProxy.fetchall, [])
@@ -0,0 +1,337 @@
+# +--------------------------------------------------------------------------+
+# |  Licensed Materials - Property of IBM                                    |
+# |                                                                          |
+# | (C) Copyright IBM Corporation 2008.                                      |
+# +--------------------------------------------------------------------------+
+# | This module complies with SQLAlchemy 0.8 and is                          |
+# | Licensed under the Apache License, Version 2.0 (the "License");          |
+# | you may not use this file except in compliance with the License.         |
+# | You may obtain a copy of the License at                                  |
+# | http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable |
+# | law or agreed to in writing, software distributed under the License is   |
+# | distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY |
+# | KIND, either express or implied. See the License for the specific        |
+# | language governing permissions and limitations under the License.        |
+# +--------------------------------------------------------------------------+
+# | Version: 0.3.x                                                           |
+# +--------------------------------------------------------------------------+
+"""Routing of read-only statements to HADR standby databases.
+
+With reads on standby enabled, HADR standby databases can answer
+queries, taking load off the primary.  A :class:`.RoutingEngine` sends
+read-only statements to a pool of standby engines, in turn, and
+everything else to the primary::
+
+    router = RoutingEngine(
+                create_engine("db2+ibm_db://user:pass@primary:50000/SAMPLE"),
+                [create_engine("db2+ibm_db://user:pass@standby1:50000/SAMPLE"),
+                 create_engine("db2+ibm_db://user:pass@standby2:50000/SAMPLE")],
+                max_staleness=30)
+
+    conn = router.connect()
+    rows = conn.execute(select([orders])).fetchall()    # a standby
+    trans = conn.begin()
+    conn.execute(select([orders])).fetchall()           # the primary
+    conn.execute(orders.update().values(shipped=True))  # the primary
+    trans.commit()
+
+A statement is read-only when it is a SELECT (or a SELECT, WITH or
+VALUES string) without FOR UPDATE, and without a data-change table
+reference such as ``FINAL TABLE (INSERT ...)``; strings naming INSERT,
+UPDATE, DELETE, MERGE or TRUNCATE anywhere are taken as writes.  While
+a transaction begun with :meth:`.RoutingConnection.begin` is open, every
+statement of that :class:`.RoutingConnection` goes to the primary, so
+that reads see the transaction's changes and its locks.
+
+With ``max_staleness``, a standby is only used while its log replay is
+no more than that many seconds behind the primary, as reported by
+``MON_GET_HADR``; the delay is checked again every
+``staleness_interval`` seconds.  A statement which a standby rejects
+(SQL1773N, SQL1776N), or which fails because the standby connection
+was lost, is run again on the primary.  :meth:`.RoutingEngine.stats`
+reports the statements, errors, fallbacks and latency of each target.
+
+"""
+import re
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.sql import expression
+
+
+_READ_ONLY = re.compile(r'\s*(?:SELECT|WITH|VALUES)\b', re.I)
+
+# FOR UPDATE, and data-change statements in a common table expression
+# or data-change table reference
+_WRITES = re.compile(r'\b(?:INSERT|UPDATE|DELETE|MERGE|TRUNCATE)\b', re.I)
+
+# "not supported on a read-enabled HADR standby database" and "cannot
+# be issued on an HADR standby database"
+_STANDBY_REJECTED = ('SQL1773N', 'SQL1776N')
+
+_REPLAY_DELAY = "SELECT TIMESTAMPDIFF(2, CHAR(" \
+                    "PRIMARY_LOG_TIME - STANDBY_REPLAY_LOG_TIME)) " \
+                "FROM TABLE(MON_GET_HADR(NULL)) AS T"
+
+
+def is_read_only(statement):
+    """Return True if ``statement`` can be answered by a standby."""
+
+    if isinstance(statement, expression.TextClause):
+        statement = statement.text
+    if isinstance(statement, basestring):
+        return bool(_READ_ONLY.match(statement)) and \
+                    not _WRITES.search(statement)
+    elif isinstance(statement, expression.SelectBase):
+        return not statement.for_update
+    return False
+
+
+def _rejected_by_standby(error):
+    if getattr(error, 'connection_invalidated', False):
+        return True
+    message = str(error.orig)
+    for code in _STANDBY_REJECTED:
+        if code in message:
+            return True
+    return False
+
+
+class _Target(object):
+    """An engine the router sends statements to, with its counters."""
+
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.statements = self.errors = self.fallbacks = 0
+        self.total_time = self.max_time = 0.0
+        self.replay_delay = None
+        self.checked = None
+
+    def record(self, elapsed):
+        self.statements += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+
+    def stats(self):
+        return {
+            'statements': self.statements,
+            'errors': self.errors,
+            'fallbacks': self.fallbacks,
+            'mean_time': self.statements and
+                            self.total_time / self.statements or 0.0,
+            'max_time': self.max_time,
+            'replay_delay': self.replay_delay,
+        }
+
+
+class RoutingEngine(object):
+    """Sends read-only statements to HADR standby engines and all others
+    to the primary engine.
+
+    """
+
+    def __init__(self, primary, standbys, max_staleness=None,
+                        staleness_interval=5.0):
+        self.primary = _Target('primary', primary)
+        self.standbys = [_Target('standby%d' % (i + 1), engine)
+                            for i, engine in enumerate(standbys)]
+        self.max_staleness = max_staleness
+        self.staleness_interval = staleness_interval
+        self._next = 0
+        self._mutex = threading.Lock()
+
+    def connect(self):
+        """Return a :class:`.RoutingConnection`."""
+
+        return RoutingConnection(self)
+
+    def execute(self, object, *multiparams, **params):
+        """Execute a statement connectionless, on a standby if it is
+        read-only."""
+
+        if is_read_only(object):
+            return self._execute_read(self.primary.engine.execute,
+                                        object, multiparams, params)
+        return self._execute_primary(self.primary.engine.execute,
+                                        object, multiparams, params)
+
+    def scalar(self, object, *multiparams, **params):
+        return self.execute(object, *multiparams, **params).scalar()
+
+    def stats(self):
+        """Return counters and latency, in seconds, per target name."""
+
+        self._mutex.acquire()
+        try:
+            return dict((target.name, target.stats())
+                        for target in [self.primary] + self.standbys)
+        finally:
+            self._mutex.release()
+
+    def dispose(self):
+        for target in [self.primary] + self.standbys:
+            target.engine.dispose()
+
+    def _standby(self):
+        """Return the next standby fresh enough to use, or None."""
+
+        self._mutex.acquire()
+        try:
+            first = self._next
+        finally:
+            self._mutex.release()
+
+        count = len(self.standbys)
+        for i in range(count):
+            index = (first + i) % count
+            target = self.standbys[index]
+            if self._fresh(target):
+                self._mutex.acquire()
+                try:
+                    self._next = (index + 1) % count
+                finally:
+                    self._mutex.release()
+                return target
+        return None
+
+    def _fresh(self, target):
+        now = time.time()
+        self._mutex.acquire()
+        try:
+            probe = target.checked is None or \
+                        now - target.checked >= self.staleness_interval
+            if probe:
+                # taken by this thread; others go on with the delay
+                # known so far until the probe returns
+                target.checked = now
+                if self.max_staleness is None:
+                    # nothing to measure; this only ends the wait of a
+                    # standby set aside by _mark_unusable()
+                    target.replay_delay = 0
+                    probe = False
+        finally:
+            self._mutex.release()
+
+        if probe:
+            # a round trip, or a connect timeout to a lost standby;
+            # not to be waited for by every other routed statement
+            delay = self._replay_delay(target)
+            self._mutex.acquire()
+            try:
+                if delay is None:
+                    target.errors += 1
+                target.replay_delay = delay
+            finally:
+                self._mutex.release()
+
+        delay = target.replay_delay
+        return delay is not None and \
+                    (self.max_staleness is None or
+                        delay <= self.max_staleness)
+
+    def _replay_delay(self, target):
+        try:
+            delay = target.engine.scalar(_REPLAY_DELAY)
+        except exc.DBAPIError:
+            return None
+        # a database which isn't an HADR standby reports no rows
+        return delay or 0
+
+    def _mark_unusable(self, target):
+        target.checked, target.replay_delay = time.time(), None
+
+    def _execute_read(self, execute_primary, object, multiparams, params):
+        target = self._standby()
+        if target is None:
+            return self._execute_primary(execute_primary,
+                                            object, multiparams, params)
+        start = time.time()
+        try:
+            result = target.engine.execute(object, *multiparams, **params)
+        except exc.DBAPIError, e:
+            if not _rejected_by_standby(e):
+                raise
+            self._mutex.acquire()
+            try:
+                target.errors += 1
+                target.fallbacks += 1
+                if getattr(e, 'connection_invalidated', False):
+                    self._mark_unusable(target)
+            finally:
+                self._mutex.release()
+            return self._execute_primary(execute_primary,
+                                            object, multiparams, params)
+        self._record(target, time.time() - start)
+        return result
+
+    def _execute_primary(self, execute, object, multiparams, params):
+        start = time.time()
+        try:
+            result = execute(object, *multiparams, **params)
+        except exc.DBAPIError:
+            self._mutex.acquire()
+            try:
+                self.primary.errors += 1
+            finally:
+                self._mutex.release()
+            raise
+        self._record(self.primary, time.time() - start)
+        return result
+
+    def _record(self, target, elapsed):
+        self._mutex.acquire()
+        try:
+            target.record(elapsed)
+        finally:
+            self._mutex.release()
+
+
+class RoutingConnection(object):
+    """Routes the statements of one unit of work.
+
+    A connection to the primary is checked out when first needed and
+    held until :meth:`close`; reads on a standby use a pooled standby
+    connection for the life of their result.
+
+    """
+
+    def __init__(self, router):
+        self.router = router
+        self._primary = None
+
+    @property
+    def primary(self):
+        """The :class:`.Connection` to the primary."""
+
+        if self._primary is None:
+            self._primary = self.router.primary.engine.connect()
+        return self._primary
+
+    def begin(self):
+        """Begin a transaction on the primary."""
+
+        return self.primary.begin()
+
+    def in_transaction(self):
+        return self._primary is not None and self._primary.in_transaction()
+
+    def execute(self, object, *multiparams, **params):
+        if is_read_only(object) and not self.in_transaction():
+            return self.router._execute_read(self._execute_primary,
+                                        object, multiparams, params)
+        return self.router._execute_primary(self._execute_primary,
+                                        object, multiparams, params)
+
+    def scalar(self, object, *multiparams, **params):
+        return self.execute(object, *multiparams, **params).scalar()
+
+    def close(self):
+        if self._primary is not None:
+            self._primary.close()
+            self._primary = None
+
+    def _execute_primary(self, object, *multiparams, **params):
+        return self.primary.execute(object, *multiparams, **params)
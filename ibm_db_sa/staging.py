@@ -0,0 +1,128 @@
+# +--------------------------------------------------------------------------+
+# |  Licensed Materials - Property of IBM                                    |
+# |                                                                          |
+# | (C) Copyright IBM Corporation 2008.                                      |
+# +--------------------------------------------------------------------------+
+# | This module complies with SQLAlchemy 0.8 and is                          |
+# | Licensed under the Apache License, Version 2.0 (the "License");          |
+# | you may not use this file except in compliance with the License.         |
+# | You may obtain a copy of the License at                                  |
+# | http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable |
+# | law or agreed to in writing, software distributed under the License is   |
+# | distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY |
+# | KIND, either express or implied. See the License for the specific        |
+# | language governing permissions and limitations under the License.        |
+# +--------------------------------------------------------------------------+
+# | Version: 0.3.x                                                           |
+# +--------------------------------------------------------------------------+
+"""Staging of client-side rows in declared global temporary tables.
+
+Joining a large set of keys held by the application is faster through a
+temporary table than through long IN lists or many chunked queries::
+
+    from ibm_db_sa import stage_rows
+
+    keys = stage_rows(conn, 'order_keys',
+                    [Column('order_id', Integer)],
+                    [(order_id,) for order_id in order_ids])
+    result = conn.execute(
+                select([orders]).select_from(
+                    orders.join(keys, orders.c.id == keys.c.order_id)))
+
+A declared temporary table belongs to the DBAPI connection it was
+declared on, so the :class:`.Connection` must be kept until the table
+is no longer used.  Tables are dropped when the connection is returned
+to the pool, and by the server when the connection is closed.
+
+"""
+import itertools
+
+from sqlalchemy import Table, MetaData, Column
+from sqlalchemy.schema import DropTable
+
+from .ddl import DeclareGlobalTemporaryTable
+
+
+# key of the connection record info dictionary holding the DROP
+# statements of the tables staged on a connection
+_STAGED_TABLES = 'ibm_db_sa_staged_tables'
+
+
+def checkin(dialect, dbapi_connection, info):
+    """Drop the tables staged on a connection returned to the pool; see
+    :meth:`.DB2Dialect._on_checkin`."""
+
+    statements = info.pop(_STAGED_TABLES, None)
+    if not statements:
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for statement in statements.values():
+            try:
+                cursor.execute(statement)
+            except dialect.dbapi.Error:
+                # already dropped, or gone with a rolled back
+                # unit of work
+                pass
+        dialect.do_commit(dbapi_connection)
+    finally:
+        cursor.close()
+
+
+def _staging_column(column):
+    # only name and type carry over; defaults, identity and
+    # constraints of the original table don't apply
+    return Column(column.name, column.type, key=column.key,
+                    nullable=column.nullable, autoincrement=False)
+
+
+def stage_table(connection, name, columns, **kw):
+    """Declare an empty temporary table ``SESSION.<name>`` with copies of
+    the given :class:`.Column` objects, and return it as a :class:`.Table`.
+
+    Keyword arguments are passed to :class:`.DeclareGlobalTemporaryTable`;
+    by default rows are kept across commits, changes are not logged and
+    a table of the same name declared earlier on the connection is
+    replaced.  The table is dropped when ``connection`` is returned to
+    the pool.
+
+    """
+    table = Table(name, MetaData(),
+                    *[_staging_column(column) for column in columns],
+                    schema='SESSION')
+    connection.execute(DeclareGlobalTemporaryTable(table, **kw))
+
+    # run on the DBAPI cursor at checkin, so encoded here as the
+    # execution context would
+    dialect = connection.dialect
+    statement = unicode(DropTable(table).compile(dialect=dialect)).strip()
+    if not dialect.supports_unicode_statements:
+        statement = dialect._encoder(statement)[0]
+    connection.connection.info.setdefault(_STAGED_TABLES, {})[
+                    table.fullname] = statement
+    return table
+
+
+def stage_rows(connection, name, columns, rows, batch_size=10000, **kw):
+    """Declare a temporary table as :func:`.stage_table` does and fill it
+    with ``rows``.
+
+    ``rows`` is an iterable of tuples, in the order of ``columns``, or of
+    dictionaries keyed on column keys.  They are inserted with
+    ``executemany()`` in batches of ``batch_size``, which uses the
+    driver's array insert where the dialect has one enabled, such as
+    ``fast_executemany`` with pyodbc.
+
+    """
+    table = stage_table(connection, name, columns, **kw)
+    keys = [column.key for column in table.columns]
+    insert = table.insert()
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        if not isinstance(batch[0], dict):
+            batch = [dict(zip(keys, row)) for row in batch]
+        connection.execute(insert, batch)
+    return table
@@ -0,0 +1,214 @@
+# +--------------------------------------------------------------------------+
+# |  Licensed Materials - Property of IBM                                    |
+# |                                                                          |
+# | (C) Copyright IBM Corporation 2008.                                      |
+# +--------------------------------------------------------------------------+
+# | This module complies with SQLAlchemy 0.8 and is                          |
+# | Licensed under the Apache License, Version 2.0 (the "License");          |
+# | you may not use this file except in compliance with the License.         |
+# | You may obtain a copy of the License at                                  |
+# | http://www.apache.org/licenses/LICENSE-2.0 Unless required by applicable |
+# | law or agreed to in writing, software distributed under the License is   |
+# | distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY |
+# | KIND, either express or implied. See the License for the specific        |
+# | language governing permissions and limitations under the License.        |
+# +--------------------------------------------------------------------------+
+# | Version: 0.3.x                                                           |
+# +--------------------------------------------------------------------------+
+"""Time limits on statements, and CURRENT LOCK TIMEOUT per connection.
+
+A statement run with the ``timeout`` execution option (seconds) is
+stopped if it hasn't finished executing by then::
+
+    result = conn.execution_options(timeout=30).execute(report_query)
+
+Where the driver has a query timeout, which is pyodbc, it is used,
+rounded up to whole seconds.
+Otherwise the dialect's :class:`.Watchdog`, one thread shared by all
+connections, cancels the statement at its deadline: with the cursor's
+``cancel()`` if the driver has one, else by calling
+``WLM_CANCEL_ACTIVITY`` on a connection of the watchdog's own, made
+outside the pool, for the activity of the statement's application
+handle (``MON_GET_ACTIVITY``, DB2 10.5 and
+later).  The statement then fails with the driver's error, SQL0952N or
+SQL4725N; the connection itself stays usable, and is rolled back as
+usual when returned to the pool.  The limit covers the execution of the
+statement, not the fetching of its rows.
+
+The ``lock_timeout`` execution option sets the ``CURRENT LOCK TIMEOUT``
+special register of the connection: seconds to wait for a lock, -1 to
+wait indefinitely, or None for the database's ``LOCKTIMEOUT``.  It is
+set before the first statement run with the option, stays in effect on
+that connection, and is reset when the connection goes back to the
+pool::
+
+    conn = engine.connect().execution_options(lock_timeout=5)
+
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from sqlalchemy import util
+
+
+_APPLICATION_HANDLE = "SELECT MON_GET_APPLICATION_HANDLE() " \
+                      "FROM SYSIBM.SYSDUMMY1"
+_ACTIVITIES = "SELECT UOW_ID, ACTIVITY_ID " \
+              "FROM TABLE(MON_GET_ACTIVITY(?, -2)) AS ACTIVITY"
+_CANCEL_ACTIVITY = "CALL WLM_CANCEL_ACTIVITY(?, ?, ?)"
+
+# keys of the pool's per-connection info dictionary
+APPLICATION_HANDLE_KEY = 'db2_application_handle'
+LOCK_TIMEOUT_KEY = 'db2_lock_timeout'
+
+
+def application_handle(dbapi_connection):
+    """Return the application handle of a DBAPI connection."""
+
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(_APPLICATION_HANDLE)
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def cancel_activity(dbapi_connection, handle):
+    """Cancel the activities of an application handle with
+    ``WLM_CANCEL_ACTIVITY``, from another connection."""
+
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(_ACTIVITIES, (handle, ))
+        for uow_id, activity_id in cursor.fetchall():
+            cursor.execute(_CANCEL_ACTIVITY, (handle, uow_id, activity_id))
+        dbapi_connection.commit()
+    finally:
+        cursor.close()
+
+
+def set_lock_timeout(dbapi_connection, seconds):
+    """Set ``CURRENT LOCK TIMEOUT``; None sets it to NULL."""
+
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SET CURRENT LOCK TIMEOUT %s" % (
+                        "NULL" if seconds is None else int(seconds)))
+    finally:
+        cursor.close()
+
+
+class _Watch(object):
+    __slots__ = ('deadline', 'cancel', 'firing', 'cancelled', 'done')
+
+    def __init__(self, deadline, cancel):
+        self.deadline = deadline
+        self.cancel = cancel
+        self.firing = self.cancelled = False
+        self.done = threading.Event()
+
+
+class Watchdog(object):
+    """A thread calling the cancel function of each watched statement
+    still running at its deadline.
+
+    The thread is started on the first :meth:`watch`.
+
+    """
+
+    def __init__(self):
+        self.cancelled = 0
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._connection = None
+
+    def watch(self, seconds, cancel):
+        """Call ``cancel()`` in ``seconds`` unless :meth:`unwatch` is
+        called first; return the watch to pass to it."""
+
+        watch = _Watch(time.time() + seconds, cancel)
+        self._condition.acquire()
+        try:
+            heapq.heappush(self._heap,
+                            (watch.deadline, next(self._counter), watch))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+        finally:
+            self._condition.release()
+        return watch
+
+    def unwatch(self, watch):
+        """Stop watching; if the cancel function is running, wait for it
+        to return.  Return True if the statement was cancelled."""
+
+        self._condition.acquire()
+        try:
+            watch.cancel = None
+            firing = watch.firing
+        finally:
+            self._condition.release()
+        if firing:
+            watch.done.wait()
+        return watch.cancelled
+
+    def cancel_activity(self, connect, handle):
+        """Cancel the activities of an application handle, from the
+        watchdog thread.
+
+        The watchdog's own DBAPI connection is used, made with
+        ``connect()`` when first needed; checking out a pooled connection
+        could wait on the very statements to be cancelled.
+
+        """
+        if self._connection is None:
+            self._connection = connect()
+        try:
+            cancel_activity(self._connection, handle)
+        except Exception:
+            connection, self._connection = self._connection, None
+            try:
+                connection.close()
+            except Exception:
+                pass
+            raise
+
+    def _next_due(self):
+        # the next watch past its deadline, waiting for one as needed
+        self._condition.acquire()
+        try:
+            while True:
+                while self._heap and self._heap[0][2].cancel is None:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                watch = heapq.heappop(self._heap)[2]
+                watch.firing = True
+                return watch, watch.cancel
+        finally:
+            self._condition.release()
+
+    def _run(self):
+        while True:
+            watch, cancel = self._next_due()
+            try:
+                try:
+                    cancel()
+                    watch.cancelled = True
+                    self.cancelled += 1
+                except Exception, e:
+                    util.warn("Cancelling a statement past its timeout "
+                              "failed: %s" % e)
+            finally:
+                watch.done.set()
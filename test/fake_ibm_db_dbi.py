@@ -0,0 +1,1037 @@
+"""An in-process stand-in for the ibm_db_dbi module.
+
+Statements run against an in-memory sqlite database in which the schemas
+``SYSCAT``, ``SYSIBM``, ``QSYS2``, ``SESSION`` and the current schema
+are attached databases.  The catalog tables are created from the
+reflectors' own definitions, and :meth:`.Database.add_table` fills them
+in from a :class:`.Table` the way DB2 would after ``CREATE TABLE``::
+
+    db = Database(server_version='10.05.0005')
+    db.add_table(some_table)
+    engine = create_engine("db2+ibm_db://", module=DBAPI(db))
+
+The handful of DB2-only constructs the dialect emits (``FETCH FIRST``,
+``NEXTVAL FOR``, ``IDENTITY_VAL_LOCAL()``, ``CURRENT_SCHEMA``,
+``CURRENT_USER``, ``TRUNCATE``, deletes from a fullselect and declared
+temporary tables) are rewritten before they reach sqlite.
+Every call which would be a round trip to a real server is counted in
+:attr:`.Database.round_trips`, and delayed by :attr:`.Database.latency`
+seconds.  Transactions aren't emulated: each statement is committed as
+it runs.
+
+"""
+import ast
+import datetime
+import decimal
+import itertools
+import re
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import types as sa_types
+from sqlalchemy.schema import CreateTable, ForeignKeyConstraint
+from sqlalchemy.dialects.sqlite.base import SQLiteDialect
+
+from ibm_db_sa import base as ibm_base
+from ibm_db_sa import reflection as ibm_reflection
+
+
+apilevel = '2.0'
+threadsafety = 1
+paramstyle = 'qmark'
+
+
+class Warning(Exception):
+    pass
+
+
+class Error(Exception):
+    pass
+
+
+class InterfaceError(Error):
+    pass
+
+
+class DatabaseError(Error):
+    pass
+
+
+class DataError(DatabaseError):
+    pass
+
+
+class OperationalError(DatabaseError):
+    pass
+
+
+class IntegrityError(DatabaseError):
+    pass
+
+
+class InternalError(DatabaseError):
+    pass
+
+
+class ProgrammingError(DatabaseError):
+    pass
+
+
+class NotSupportedError(DatabaseError):
+    pass
+
+
+_EXCEPTIONS = [Warning, Error, InterfaceError, DatabaseError, DataError,
+               OperationalError, IntegrityError, InternalError,
+               ProgrammingError, NotSupportedError]
+
+_CATALOG_SCHEMAS = ('SYSCAT', 'SYSIBM', 'QSYS2', 'SESSION')
+
+# DB2 type names as they appear in SYSCAT.COLUMNS.TYPENAME
+_TYPENAMES = {
+    'INT': 'INTEGER',
+    'CHAR': 'CHARACTER',
+    'NUMERIC': 'DECIMAL',
+    'FLOAT': 'DOUBLE',
+    'LONG VARCHAR': 'LONGVARCHAR',
+    'LONG VARGRAPHIC': 'LONGVARGRAPHIC',
+}
+
+_FETCH_FIRST = re.compile(r'FETCH\s+FIRST\s+(\d+)\s+ROWS?\s+ONLY', re.I)
+_NEXTVAL = re.compile(
+        r'NEXTVAL\s+FOR\s+((?:"[^"]+"|\w+)(?:\s*\.\s*(?:"[^"]+"|\w+))?)', re.I)
+_IDENTITY_VAL_LOCAL = re.compile(r'IDENTITY_VAL_LOCAL\s*\(\s*\)', re.I)
+_CURRENT_SCHEMA = re.compile(r'\bCURRENT[_ ]SCHEMA\b', re.I)
+_CURRENT_USER = re.compile(r'\bCURRENT[_ ]USER\b', re.I)
+_DECLARE_TEMP = re.compile(
+        r'^\s*DECLARE\s+GLOBAL\s+TEMPORARY\s+TABLE\s+([^\s(]+)\s*'
+        r'(\(.*\))\s*ON\s+COMMIT\s.*$', re.I | re.S)
+_COMPOUND = re.compile(r'^\s*BEGIN\s+(NOT\s+)?ATOMIC\s*\n(.*)\nEND\s*$',
+        re.I | re.S)
+_ROW_COUNT_CHECK = re.compile(
+        r"IF \w+ <> 1 THEN SIGNAL SQLSTATE '(\w+)' "
+        r"SET MESSAGE_TEXT = '([^']*)'", re.I)
+_FOR_UPDATE = re.compile(r'\s+FOR\s+(?:UPDATE|READ\s+ONLY)\b.*$', re.I | re.S)
+_QUERY = re.compile(r'\s*(?:SELECT|WITH|VALUES)\b', re.I)
+_MON_GET_HADR = re.compile(r'^.*\bMON_GET_HADR\b.*$', re.I | re.S)
+_RUNSTATS = re.compile(r'^RUNSTATS\s+ON\s+TABLE\s+(\S+)', re.I)
+_REORG = re.compile(r'^REORG\s+TABLE\s+(\S+)', re.I)
+_APPLICATION_HANDLE = re.compile(r'\bMON_GET_APPLICATION_HANDLE\s*\(\s*\)',
+        re.I)
+_MON_GET_ACTIVITY = re.compile(r'\bMON_GET_ACTIVITY\s*\(', re.I)
+_SET_LOCK_TIMEOUT = re.compile(
+        r'^\s*SET\s+CURRENT\s+LOCK\s+TIMEOUT\s*=?\s*(\S+)\s*$', re.I)
+_SET_REFRESH_AGE = re.compile(
+        r'^\s*SET\s+CURRENT\s+REFRESH\s+AGE\s*=?\s*(\S+)\s*$', re.I)
+_CREATE_MQT = re.compile(
+        r'^\s*CREATE\s+TABLE\s+(\S+?)\s*(?:\(([^()]*)\)\s*)?AS\s*\((.*)\)'
+        r'\s*DATA\s+INITIALLY\s+DEFERRED\s+REFRESH\s+(\w+)(.*)$', re.I | re.S)
+_MAINTAINED_BY = re.compile(r'\bMAINTAINED\s+BY\s+(\w+)', re.I)
+_REFRESH_TABLE = re.compile(r'^\s*REFRESH\s+TABLE\s+(\S+)', re.I)
+_TRUNCATE = re.compile(r'^\s*TRUNCATE\s+TABLE\s+(\S+)\s.*\bIMMEDIATE\s*$',
+        re.I | re.S)
+_DELETE_CHUNK = re.compile(
+        r'^\s*DELETE\s+FROM\s+\(\s*SELECT\s.*?\sFROM\s+(\S+)(.*)\)\s*$',
+        re.I | re.S)
+_CALL = re.compile(r'^\s*CALL\s+((?:"[^"]+"|\w+)(?:\s*\.\s*(?:"[^"]+"|\w+))?)'
+                   r'\s*\((.*)\)\s*$', re.I | re.S)
+
+
+def _identifier(name):
+    # DB2 folds unquoted identifiers to upper case
+    name = name.strip()
+    if name.startswith('"'):
+        return name.strip('"')
+    return name.upper()
+
+
+def _qualified_name(name, default_schema):
+    parts = [_identifier(part) for part in name.split('.')]
+    if len(parts) == 1:
+        parts.insert(0, _identifier(default_schema))
+    return tuple(parts)
+
+
+def _split_arguments(text):
+    # split on the commas outside of brackets and parentheses
+    arguments, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            arguments.append(text[start:i].strip())
+            start = i + 1
+    if text.strip():
+        arguments.append(text[start:].strip())
+    return arguments
+
+
+def _quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def _parameter(value):
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    elif isinstance(value, decimal.Decimal):
+        return str(value)
+    elif isinstance(value, bool):
+        return int(value)
+    elif isinstance(value, datetime.time):
+        return value.isoformat()
+    return value
+
+
+def _mod(x, y):
+    # DB2's MOD takes the sign of the dividend, unlike Python's %
+    if x is None or y is None:
+        return None
+    result = abs(x) % abs(y)
+    if x < 0:
+        return -result
+    return result
+
+
+def _convert_time(value):
+    return datetime.datetime.strptime(value.split('.')[0], '%H:%M:%S').time()
+
+
+class Database(object):
+    """The state shared by all connections of a :class:`.DBAPI`.
+
+    :param schema: the current schema reported to the dialect.
+
+    :param server_version: the DBMS_VER string returned by
+      ``server_info()``; reflection of some table options depends on it.
+
+    :param latency: seconds to sleep on every round trip.
+
+    :param fetch_latency: seconds to sleep on every ``fetchmany()`` and
+      ``fetchall()``, as a driver fetching a block of rows over the
+      network would; these aren't counted as round trips.
+
+    :param standby: act as an HADR standby with reads on standby
+      enabled; statements other than queries, and queries drawing
+      sequence values, fail with SQL1773N.
+
+    :param replay_delay: seconds the standby's log replay is behind the
+      primary, as reported by ``MON_GET_HADR``.
+
+    """
+
+    def __init__(self, schema='DB2INST1', server_version='10.05.0005',
+                        dbms_name='DB2/LINUXX8664', latency=0,
+                        fetch_latency=0, standby=False, replay_delay=0):
+        self.schema = schema
+        self.server_version = server_version
+        self.dbms_name = dbms_name
+        self.latency = latency
+        self.fetch_latency = fetch_latency
+        self.standby = standby
+        self.replay_delay = replay_delay
+        self.round_trips = 0
+        self.statements = []
+        self.input_sizes = []
+        self._sequences = {}
+        self._procedures = {}
+        self._handles = itertools.count(1)
+        self._running = {}
+        self.reorg_flags = {}
+        self.reorged = []
+        self._mqts = {}
+        self._mutex = threading.RLock()
+
+        sqlite3.register_converter('TIME', _convert_time)
+        # catalog TIMESTAMP columns, as declared by the sqlite dialect
+        sqlite3.register_converter('DATETIME', sqlite3.converters['TIMESTAMP'])
+        self._sqlite = sqlite3.connect(':memory:', check_same_thread=False,
+                                        isolation_level=None,
+                                        detect_types=sqlite3.PARSE_DECLTYPES)
+        self._sqlite.create_function('nextval', 1, self._next_value)
+        self._sqlite.create_function('mod', 2, _mod)
+        for schema in _CATALOG_SCHEMAS:
+            self._sqlite.execute("ATTACH DATABASE ':memory:' AS %s" %
+                                        _quote(schema))
+
+        sqlite_dialect = SQLiteDialect()
+        for reflector in (ibm_reflection.DB2Reflector,
+                          ibm_reflection.AS400Reflector):
+            for table in reflector.ischema.sorted_tables:
+                self._sqlite.execute(unicode(
+                        CreateTable(table).compile(dialect=sqlite_dialect)))
+        self._sqlite.execute('CREATE TABLE "SYSIBM"."SYSDUMMY1" '
+                             '("IBMREQD" CHAR(1))')
+        self._sqlite.execute('INSERT INTO "SYSIBM"."SYSDUMMY1" VALUES (\'Y\')')
+
+        self._schemas = set()
+        for schema in _CATALOG_SCHEMAS + (self.schema, ):
+            self._attach(schema)
+
+        self.add_procedure('ADMIN_CMD', self._admin_cmd, schema='SYSPROC')
+        self.add_procedure('REORGCHK_TB_STATS', self._reorgchk_tb_stats,
+                                schema='SYSPROC')
+        self.add_procedure('WLM_CANCEL_ACTIVITY', self._wlm_cancel_activity,
+                                schema='SYSPROC')
+        self._builtins = {('DBMS_ALERT', 'SLEEP'): self._sleep}
+
+    def reset_counters(self):
+        """Reset :attr:`round_trips` and the statement log."""
+
+        self.round_trips = 0
+        del self.statements[:]
+        del self.input_sizes[:]
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _attach(self, schema):
+        if schema not in self._schemas:
+            if schema not in _CATALOG_SCHEMAS:
+                self._sqlite.execute("ATTACH DATABASE ':memory:' AS %s" %
+                                        _quote(schema))
+            self._schemas.add(schema)
+            if schema != 'QSYS2':
+                self._catalog_insert(
+                        ibm_reflection.DB2Reflector.sys_schemas,
+                        schemaname=schema)
+            if schema != 'SYSCAT':
+                self._catalog_insert(
+                        ibm_reflection.AS400Reflector.sys_schemas,
+                        schemaname=schema)
+
+    def _catalog_insert(self, catalog_table, **values):
+        columns = [catalog_table.c[key] for key in values]
+        self._sqlite.execute("INSERT INTO %s.%s (%s) VALUES (%s)" % (
+                        _quote(catalog_table.schema),
+                        _quote(catalog_table.name),
+                        ", ".join(_quote(c.name) for c in columns),
+                        ", ".join("?" for c in columns)),
+                    [_parameter(values[c.key]) for c in columns])
+
+    def _next_value(self, name):
+        sequence = self._sequences[name]
+        value = sequence['next']
+        sequence['next'] += sequence['increment']
+        return value
+
+    def add_sequence(self, name, start=1, increment=1, schema=None):
+        """Create a sequence as ``CREATE SEQUENCE`` would."""
+
+        schema = schema or self.schema
+        name = _identifier(name)
+        self._sequences[name] = {'next': start, 'increment': increment}
+        self._catalog_insert(ibm_reflection.DB2Reflector.sys_sequences,
+                        seqschema=schema, seqname=name, start=start,
+                        increment=increment, cache=20, order='N')
+        self._catalog_insert(ibm_reflection.AS400Reflector.sys_sequences,
+                        seqschema=schema, seqname=name)
+
+    def add_procedure(self, name, function, schema=None):
+        """Create a stored procedure run by ``CALL`` and ``callproc()``.
+
+        ``function`` is called with the list of argument values, an
+        ``ARRAY[...]`` argument being a list and an OUT argument None;
+        it sets OUT values by assigning to the list and returns the
+        result sets, each a pair of column names and rows.
+
+        """
+        self._procedures[_qualified_name(name, schema or self.schema)] = \
+                    function
+
+    def _execute_call(self, cursor, match, parameters):
+        parameters = iter(parameters)
+        arguments = []
+        for argument in _split_arguments(match.group(2)):
+            if argument == '?':
+                arguments.append(next(parameters))
+            elif argument.upper().startswith('ARRAY['):
+                arguments.append([next(parameters)
+                                    for i in range(argument.count('?'))])
+            else:
+                arguments.append(ast.literal_eval(argument))
+        name = _qualified_name(match.group(1), self.schema)
+        if '.' not in match.group(1) and name not in self._procedures:
+            # unqualified routines are found in SYSPROC as well
+            name = ('SYSPROC', name[1])
+        if name in self._builtins:
+            result_sets = self._builtins[name](cursor, arguments)
+        elif name in self._procedures:
+            result_sets = self._procedures[name](arguments)
+        else:
+            raise ProgrammingError("SQL0440N No authorized routine named "
+                                   "%s [%s]" % (match.group(1),
+                                                match.group(0)))
+        result_sets = list(result_sets or ())
+        cursor._call_arguments = arguments
+        cursor._result_sets = result_sets
+        cursor.rowcount = -1
+        cursor.nextset()
+
+    def _admin_cmd(self, arguments):
+        # RUNSTATS and REORG TABLE only; tables REORG'ed are listed in
+        # reorged, and their reorg_flags cleared
+        runstats = _RUNSTATS.match(arguments[0])
+        reorg = _REORG.match(arguments[0])
+        if runstats is not None:
+            schema, name = _qualified_name(runstats.group(1), self.schema)
+            self.runstats('"%s"' % name, '"%s"' % schema)
+        elif reorg is not None:
+            table = _qualified_name(reorg.group(1), self.schema)
+            self.reorged.append(table)
+            self.reorg_flags.pop(table, None)
+        else:
+            raise ProgrammingError("SQL0104N ADMIN_CMD command not "
+                                   "supported: %s" % arguments[0])
+
+    def _sleep(self, cursor, arguments):
+        # DBMS_ALERT.SLEEP, with the mutex released while sleeping; ends
+        # early with SQL0952N on WLM_CANCEL_ACTIVITY or the cursor's
+        # timeout
+        connection = cursor.connection
+        seconds = arguments[0]
+        if cursor.timeout:
+            seconds = min(seconds, cursor.timeout)
+        connection._interrupt.clear()
+        self._running[connection.application_handle] = connection
+        self._mutex.release()
+        try:
+            interrupted = connection._interrupt.wait(seconds)
+        finally:
+            self._mutex.acquire()
+            del self._running[connection.application_handle]
+        if interrupted or seconds < arguments[0]:
+            raise OperationalError("SQL0952N  Processing was cancelled due "
+                                   "to an interrupt.  SQLSTATE=57014")
+
+    def _wlm_cancel_activity(self, arguments):
+        connection = self._running.get(arguments[0])
+        if connection is None:
+            raise ProgrammingError("SQL4702N  The activity identified by "
+                                   "application handle %s does not exist."
+                                   % arguments[0])
+        connection._interrupt.set()
+
+    def _execute_activities(self, cursor, parameters):
+        # MON_GET_ACTIVITY: one row of UOW_ID, ACTIVITY_ID for the
+        # statement an application handle is running, if any
+        cursor.description = (('uow_id', None, None, None, None, None, None),
+                              ('activity_id', None, None, None, None, None,
+                                None))
+        cursor._rows = parameters[0] in self._running and [(1, 1)] or []
+        cursor.rowcount = -1
+
+    def _reorgchk_tb_stats(self, arguments):
+        # reorg_flags maps (schema, table) to the REORG column, '---'
+        # if absent
+        table = _qualified_name(arguments[1], self.schema)
+        return [(['table_schema', 'table_name', 'reorg'],
+                 [table + (self.reorg_flags.get(table, '---'), )])]
+
+    def add_view(self, name, definition, schema=None):
+        """Create a view from the text of a SELECT statement."""
+
+        schema = schema or self.schema
+        self._attach(schema)
+        name = _identifier(name)
+        self._sqlite.execute("CREATE VIEW %s.%s AS %s" % (
+                        _quote(schema), _quote(name), definition))
+        text = "CREATE VIEW %s AS %s" % (name, definition)
+        self._catalog_insert(ibm_reflection.DB2Reflector.sys_tables,
+                        tabschema=schema, tabname=name, type='V',
+                        status='N')
+        self._catalog_insert(ibm_reflection.DB2Reflector.sys_views,
+                        viewschema=schema, viewname=name, text=text)
+        self._catalog_insert(ibm_reflection.AS400Reflector.sys_tables,
+                        tabschema=schema, tabname=name, tabtype='V')
+        self._catalog_insert(ibm_reflection.AS400Reflector.sys_views,
+                        viewschema=schema, viewname=name, text=text)
+
+    def _create_mqt(self, connection, match):
+        # CREATE TABLE ... AS (...) DATA INITIALLY DEFERRED: an empty
+        # table, with the query kept for REFRESH TABLE; refresh isn't
+        # immediate whatever the statement says
+        schema, name = _qualified_name(match.group(1), self.schema)
+        self._attach(schema)
+        query = self._translate(connection, match.group(3))
+        if match.group(2):
+            query = "WITH q (%s) AS (%s) SELECT * FROM q" % (
+                        ", ".join(_quote(_identifier(column)) for column
+                                    in match.group(2).split(',')),
+                        query)
+        else:
+            query = "SELECT * FROM (%s)" % query
+        self._sqlite.execute("CREATE TABLE %s.%s AS %s LIMIT 0" % (
+                        _quote(schema), _quote(name), query))
+        self._mqts[(schema, name)] = query
+
+        refresh = match.group(4)[0].upper()
+        maintained = _MAINTAINED_BY.search(match.group(5))
+        user = maintained is not None and \
+                    maintained.group(1).upper() == 'USER'
+        text = match.group(0).strip()
+        db2, as400 = ibm_reflection.DB2Reflector, ibm_reflection.AS400Reflector
+        self._catalog_insert(db2.sys_tables, tabschema=schema, tabname=name,
+                        owner=self.schema, ownertype='U', type='S',
+                        status='C', tbspace='USERSPACE1', card=-1,
+                        npages=-1, refresh=refresh,
+                        property=user and 'Y' or ' ')
+        self._catalog_insert(db2.sys_views, viewschema=schema,
+                        viewname=name, text=text)
+        self._catalog_insert(as400.sys_tables, tabschema=schema,
+                        tabname=name, tabtype='M', refresh=refresh,
+                        maintenance=user and 'U' or 'S',
+                        mqt_definition=text)
+
+    def _refresh_table(self, match):
+        schema, name = _qualified_name(match.group(1), self.schema)
+        table = "%s.%s" % (_quote(schema), _quote(name))
+        self._sqlite.execute("DELETE FROM %s" % table)
+        self._sqlite.execute("INSERT INTO %s %s" % (
+                        table, self._mqts[(schema, name)]))
+        now = datetime.datetime.now()
+        for catalog_table in (ibm_reflection.DB2Reflector.sys_tables,
+                              ibm_reflection.AS400Reflector.sys_tables):
+            self._catalog_update(catalog_table,
+                        dict(tabschema=schema, tabname=name),
+                        refresh_time=now)
+
+    def add_table(self, table):
+        """Create a table, and its catalog entries, from a :class:`.Table`.
+
+        Columns, the primary key, foreign keys and indexes are entered in
+        both the ``SYSCAT`` and the ``QSYS2`` catalog.  A table in a schema
+        other than the current one attaches that schema.
+
+        """
+        schema = _identifier(table.schema) if table.schema else self.schema
+        self._attach(schema)
+        name = _identifier(table.name)
+        dialect = ibm_base.DB2Dialect()
+        db2, as400 = ibm_reflection.DB2Reflector, ibm_reflection.AS400Reflector
+
+        # the table itself; the declared types drive sqlite's conversion
+        # of DATE, TIME and TIMESTAMP values
+        column_ddl = []
+        for column in table.columns:
+            typename = self._typename(dialect, column.type)[0]
+            column_ddl.append("%s %s" % (_quote(_identifier(column.name)),
+                                         typename))
+        pk_columns = [_identifier(c.name) for c in table.primary_key]
+        if pk_columns:
+            column_ddl.append("PRIMARY KEY (%s)" %
+                                ", ".join(_quote(c) for c in pk_columns))
+        self._sqlite.execute("CREATE TABLE %s.%s (%s)" % (
+                        _quote(schema), _quote(name), ", ".join(column_ddl)))
+
+        self._catalog_insert(db2.sys_tables, tabschema=schema, tabname=name,
+                        owner=self.schema, ownertype='U', type='T',
+                        status='N', tbspace='USERSPACE1',
+                        partition_mode=' ', compression='N',
+                        rowcompmode=' ', tableorg='R', card=-1, npages=-1)
+        self._catalog_insert(as400.sys_tables, tabschema=schema,
+                        tabname=name, tabtype='T')
+        self._catalog_insert(as400.sys_table_stats, tabschema=schema,
+                        tabname=name, number_rows=0)
+
+        identity = table._autoincrement_column
+        for colno, column in enumerate(table.columns):
+            colname = _identifier(column.name)
+            typename, length, scale = self._typename(dialect, column.type)
+            default = column.server_default is not None and \
+                        getattr(column.server_default, 'arg', None) or None
+            if default is not None and not isinstance(default, basestring):
+                default = unicode(default)
+            nullable = column.nullable and not column.primary_key
+            self._catalog_insert(db2.sys_columns, tabschema=schema,
+                        tabname=name, colname=colname, colno=colno,
+                        typename=typename, length=length, scale=scale,
+                        defaultval=default, nullable=nullable and 'Y' or 'N',
+                        partkeyseq=0,
+                        identity=column is identity and 'Y' or 'N',
+                        generated=column is identity and 'D' or ' ')
+            self._catalog_insert(as400.sys_columns, tabschema=schema,
+                        tabname=name, colname=colname, colno=colno + 1,
+                        typename=typename, length=length, scale=scale,
+                        nullable=nullable and 'Y' or 'N',
+                        defaultval=default,
+                        hasdef=default is not None and 'Y' or 'N')
+            if column is identity:
+                self._catalog_insert(db2.sys_colidentattributes,
+                        tabschema=schema, tabname=name, colname=colname,
+                        start=1, increment=1, cache=20, order='N')
+
+        if pk_columns:
+            self._add_key(schema, name, 'P',
+                        table.primary_key.name or 'SQL_PK_%s' % name,
+                        pk_columns)
+        for index in table.indexes:
+            self._add_key(schema, name, index.unique and 'U' or 'D',
+                        _identifier(index.name),
+                        [_identifier(c.name) for c in index.columns])
+        for constraint in table.constraints:
+            if isinstance(constraint, ForeignKeyConstraint):
+                self._add_foreign_key(schema, name, constraint)
+
+    def _typename(self, dialect, type_):
+        type_ = type_.dialect_impl(dialect)
+        if isinstance(type_, sa_types.NullType):
+            return 'VARCHAR', 0, 0
+        spec = dialect.type_compiler.process(type_)
+        m = re.match(r'([A-Z ]+?)\s*(?:\((\d+)\w*(?:,\s*(\d+))?\))?$', spec)
+        typename = _TYPENAMES.get(m.group(1), m.group(1))
+        return typename, int(m.group(2) or 0), int(m.group(3) or 0)
+
+    def add_range_partitions(self, table_name, expressions, partitions,
+                                                        schema=None):
+        """Enter the range partitioning of a table in the catalog, as
+        ``PARTITION BY RANGE`` would: the partitioning key
+        ``expressions``, and ``partitions`` of (name, low value, high
+        value, low bound inclusive, high bound inclusive)."""
+
+        schema = schema or self.schema
+        name = _identifier(table_name)
+        db2 = ibm_reflection.DB2Reflector
+        for keyseq, expression in enumerate(expressions):
+            self._catalog_insert(db2.sys_datapartitionexpression,
+                        tabschema=schema, tabname=name, keyseq=keyseq + 1,
+                        expression=expression)
+        for seqno, (partname, low, high, low_inclusive, high_inclusive) \
+                in enumerate(partitions):
+            self._catalog_insert(db2.sys_datapartitions,
+                        tabschema=schema, tabname=name, partname=partname,
+                        seqno=seqno, lowvalue=low, highvalue=high,
+                        lowinclusive=low_inclusive and 'Y' or 'N',
+                        highinclusive=high_inclusive and 'Y' or 'N')
+
+    def runstats(self, table_name, schema=None):
+        """Collect the statistics of a table and its indexes, as
+        ``RUNSTATS ... AND INDEXES ALL`` would; ``QSYS2`` statistics,
+        which IBM i keeps current, are updated as well."""
+
+        schema = _identifier(schema) if schema else self.schema
+        table_name = _identifier(table_name)
+        db2, as400 = ibm_reflection.DB2Reflector, ibm_reflection.AS400Reflector
+        self._mutex.acquire()
+        try:
+            qualified = "%s.%s" % (_quote(schema), _quote(table_name))
+            card = self._sqlite.execute(
+                        "SELECT COUNT(*) FROM %s" % qualified).fetchone()[0]
+            now = datetime.datetime.now()
+            self._catalog_update(db2.sys_tables,
+                        dict(tabschema=schema, tabname=table_name),
+                        card=card, npages=-(-card // 100), stats_time=now)
+            self._catalog_update(as400.sys_table_stats,
+                        dict(tabschema=schema, tabname=table_name),
+                        number_rows=card)
+            indexes = self._sqlite.execute(
+                        'SELECT "INDNAME", "COLNAMES" FROM "SYSCAT"."INDEXES" '
+                        'WHERE "TABSCHEMA" = ? AND "TABNAME" = ?',
+                        (schema, table_name)).fetchall()
+            for indname, colnames in indexes:
+                columns = ", ".join(_quote(c)
+                                    for c in colnames.split('+')[1:])
+                keys = self._sqlite.execute(
+                        "SELECT COUNT(*) FROM (SELECT DISTINCT %s FROM %s)" %
+                        (columns, qualified)).fetchone()[0]
+                self._catalog_update(db2.sys_indexes,
+                        dict(indschema=schema, indname=indname),
+                        fullkeycard=keys, nleaf=-(-card // 200),
+                        nlevels=card and 2 or 1, clusterratio=100,
+                        stats_time=now)
+                self._catalog_update(as400.sys_index_stats,
+                        dict(indschema=schema, indname=indname),
+                        number_keys=card)
+        finally:
+            self._mutex.release()
+
+    def _catalog_update(self, catalog_table, where, **values):
+        columns = [catalog_table.c[key] for key in values]
+        conditions = [catalog_table.c[key] for key in where]
+        self._sqlite.execute("UPDATE %s.%s SET %s WHERE %s" % (
+                        _quote(catalog_table.schema),
+                        _quote(catalog_table.name),
+                        ", ".join("%s = ?" % _quote(c.name) for c in columns),
+                        " AND ".join("%s = ?" % _quote(c.name)
+                                        for c in conditions)),
+                    [_parameter(values[c.key]) for c in columns] +
+                    [_parameter(where[c.key]) for c in conditions])
+
+    def _add_key(self, schema, table_name, uniquerule, name, columns):
+        db2, as400 = ibm_reflection.DB2Reflector, ibm_reflection.AS400Reflector
+        name = _identifier(name)
+        self._catalog_insert(db2.sys_indexes, tabschema=schema,
+                        tabname=table_name, indschema=schema, indname=name,
+                        colnames=''.join('+' + c for c in columns),
+                        uniquerule=uniquerule, indextype='REG', pctfree=-1,
+                        reverse_scans='Y', compression='N', fullkeycard=-1,
+                        nleaf=-1, nlevels=-1, clusterratio=-1)
+        for colseq, colname in enumerate(columns):
+            self._catalog_insert(db2.sys_indexcoluse, indschema=schema,
+                        indname=name, colname=colname, colseq=colseq + 1,
+                        colorder='A')
+        if uniquerule != 'P':
+            # a primary key isn't listed in QSYS2.SYSINDEXES
+            self._catalog_insert(as400.sys_indexes, tabschema=schema,
+                        tabname=table_name, indschema=schema, indname=name,
+                        uniquerule=uniquerule == 'U' and 'Y' or 'N')
+            self._catalog_insert(as400.sys_index_stats, indschema=schema,
+                        indname=name, number_keys=0)
+            for colseq, colname in enumerate(columns):
+                self._catalog_insert(as400.sys_keys, indschema=schema,
+                        indname=name, colname=colname, colno=colseq + 1,
+                        ordering='A')
+        else:
+            self._catalog_insert(as400.sys_table_constraints,
+                        conschema=schema, conname=name,
+                        contype='PRIMARY KEY', tabschema=schema,
+                        tabname=table_name, tabtype='T')
+            self._add_key_columns(schema, table_name, name, columns)
+
+    def _add_key_columns(self, schema, table_name, name, columns):
+        db2, as400 = ibm_reflection.DB2Reflector, ibm_reflection.AS400Reflector
+        for colseq, colname in enumerate(columns):
+            self._catalog_insert(db2.sys_keycoluse, constname=name,
+                        tabschema=schema, tabname=table_name,
+                        colname=colname, colseq=colseq + 1)
+            self._catalog_insert(as400.sys_key_constraints, conschema=schema,
+                        conname=name, tabschema=schema, tabname=table_name,
+                        colname=colname, colno=colseq + 1)
+
+    def _add_foreign_key(self, schema, table_name, fk):
+        db2, as400 = ibm_reflection.DB2Reflector, ibm_reflection.AS400Reflector
+        referred = fk.elements[0].column.table
+        ref_schema = _identifier(referred.schema) if referred.schema \
+                            else self.schema
+        ref_name = _identifier(referred.name)
+        ref_key = _identifier(referred.primary_key.name or
+                                    'SQL_PK_%s' % ref_name)
+        columns = [_identifier(element.parent.name)
+                        for element in fk.elements]
+        name = _identifier(fk.name or
+                        'SQL_FK_%s_%s' % (table_name, '_'.join(columns)))
+        self._catalog_insert(db2.sys_references, constname=name,
+                        tabschema=schema, tabname=table_name,
+                        refkeyname=ref_key, reftabschema=ref_schema,
+                        reftabname=ref_name)
+        self._catalog_insert(as400.sys_table_constraints, conschema=schema,
+                        conname=name, contype='FOREIGN KEY',
+                        tabschema=schema, tabname=table_name, tabtype='T')
+        self._catalog_insert(as400.sys_ref_constraints, conschema=schema,
+                        conname=name, uniqueschema=ref_schema,
+                        uniquename=ref_key)
+        self._add_key_columns(schema, table_name, name, columns)
+
+    def _execute_compound(self, connection, match, parameters):
+        # runs compound SQL as written by ibm_db_sa.compound: one
+        # statement per line, with optional rowcount checks.  ATOMIC
+        # isn't emulated; statements before a failure are left in the
+        # transaction
+        parameters = list(parameters)
+        for line in match.group(2).split('\n'):
+            line = line.strip().rstrip(';')
+            check = _ROW_COUNT_CHECK.match(line)
+            if check is not None:
+                if rowcount != 1:
+                    raise ProgrammingError("SQLSTATE=%s %s" % check.groups())
+            elif line.upper().startswith('GET DIAGNOSTICS'):
+                rowcount = last.rowcount
+            elif line and not line.upper().startswith('DECLARE'):
+                count = line.count('?')
+                last = self._sqlite.execute(self._translate(connection, line),
+                                            parameters[:count])
+                del parameters[:count]
+
+    def _translate(self, connection, statement):
+        if self.standby and (not _QUERY.match(statement) or
+                                _NEXTVAL.search(statement)):
+            raise ProgrammingError(
+                    "SQL1773N  The statement or command requires "
+                    "functionality that is not supported on a read-enabled "
+                    "HADR standby database.  Reason code = \"1\".")
+
+        m = _DECLARE_TEMP.match(statement)
+        if m is not None:
+            self._sqlite.execute("DROP TABLE IF EXISTS %s" % m.group(1))
+            return "CREATE TABLE %s %s" % (m.group(1), m.group(2))
+        m = _TRUNCATE.match(statement)
+        if m is not None:
+            return "DELETE FROM %s" % m.group(1)
+        m = _DELETE_CHUNK.match(statement)
+        if m is not None:
+            # SQLite can't delete through a fullselect; go by rowid
+            statement = "DELETE FROM %s WHERE rowid IN (SELECT rowid " \
+                        "FROM %s%s)" % (m.group(1), m.group(1), m.group(2))
+
+        statement = _MON_GET_HADR.sub(
+                self.standby and 'SELECT %d' % self.replay_delay or
+                        'SELECT 0 WHERE 0', statement)
+        statement = _FOR_UPDATE.sub('', statement)
+        statement = _FETCH_FIRST.sub(r'LIMIT \1', statement)
+        statement = _NEXTVAL.sub(
+                lambda m: "nextval('%s')" % _identifier(
+                                        m.group(1).split('.')[-1]),
+                statement)
+        statement = _CURRENT_SCHEMA.sub("'%s'" % self.schema, statement)
+        # connected as the owner of the default schema
+        statement = _CURRENT_USER.sub("'%s'" % self.schema, statement)
+        statement = _APPLICATION_HANDLE.sub(
+                str(connection.application_handle), statement)
+        identity = connection._last_identity_val
+        statement = _IDENTITY_VAL_LOCAL.sub(
+                identity is None and 'NULL' or str(int(identity)), statement)
+        return statement
+
+    def _execute(self, connection, cursor, statement, seq_of_parameters,
+                                                        many=False):
+        if isinstance(statement, str):
+            statement = statement.decode('utf-8')
+        seq_of_parameters = [[_parameter(value) for value in parameters]
+                                for parameters in seq_of_parameters]
+
+        self._mutex.acquire()
+        try:
+            self._round_trip()
+            self.statements.append((statement, seq_of_parameters if many
+                                        else seq_of_parameters[0]))
+            cursor._result_sets = []
+            call = _CALL.match(statement)
+            if call is not None:
+                self._execute_call(cursor, call, seq_of_parameters[0])
+                return
+            if _MON_GET_ACTIVITY.search(statement):
+                self._execute_activities(cursor, seq_of_parameters[0])
+                return
+            lock_timeout = _SET_LOCK_TIMEOUT.match(statement)
+            if lock_timeout is not None:
+                value = lock_timeout.group(1).upper()
+                connection.lock_timeout = value != 'NULL' and int(value) or None
+                cursor.description = None
+                cursor._rows = []
+                return
+            refresh_age = _SET_REFRESH_AGE.match(statement)
+            if refresh_age is not None:
+                value = refresh_age.group(1).upper()
+                connection.refresh_age = value == 'ANY' and value or \
+                                            int(value)
+                cursor.description = None
+                cursor._rows = []
+                return
+            create_mqt = _CREATE_MQT.match(statement)
+            refresh_table = _REFRESH_TABLE.match(statement)
+            if create_mqt is not None or refresh_table is not None:
+                try:
+                    if create_mqt is not None:
+                        self._create_mqt(connection, create_mqt)
+                    else:
+                        self._refresh_table(refresh_table)
+                except sqlite3.Error, e:
+                    raise ProgrammingError("%s [%s]" % (e, statement))
+                cursor.description = None
+                cursor._rows = []
+                cursor.rowcount = -1
+                return
+            sqlite_cursor = self._sqlite.cursor()
+            try:
+                compound = _COMPOUND.match(statement)
+                translated = self._translate(connection, statement)
+                if compound is not None:
+                    self._execute_compound(connection, compound,
+                                            seq_of_parameters[0])
+                elif many:
+                    sqlite_cursor.executemany(translated, seq_of_parameters)
+                else:
+                    sqlite_cursor.execute(translated, seq_of_parameters[0])
+            except sqlite3.IntegrityError, e:
+                raise IntegrityError(str(e))
+            except (sqlite3.OperationalError, sqlite3.ProgrammingError), e:
+                raise ProgrammingError("%s [%s]" % (e, statement))
+            except sqlite3.Error, e:
+                raise DatabaseError(str(e))
+
+            if sqlite_cursor.description is not None:
+                # ibm_db_dbi reports column names in lower case
+                cursor.description = tuple(
+                        (d[0].lower(), ) + tuple(d[1:])
+                        for d in sqlite_cursor.description)
+                cursor._rows = [tuple(row) for row in sqlite_cursor.fetchall()]
+                cursor.rowcount = -1
+            else:
+                cursor.description = None
+                cursor._rows = []
+                cursor.rowcount = sqlite_cursor.rowcount
+            if statement.lstrip()[0:6].upper() == 'INSERT':
+                connection._last_identity_val = \
+                cursor.last_identity_val = sqlite_cursor.lastrowid
+            sqlite_cursor.close()
+        finally:
+            self._mutex.release()
+
+
+class Cursor(object):
+    """A DBAPI cursor; rows are fetched in full when a statement runs."""
+
+    arraysize = 1
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+        self.last_identity_val = None
+        self.timeout = connection.timeout
+        self._rows = []
+        self._result_sets = []
+        self._call_arguments = []
+
+    def execute(self, operation, parameters=()):
+        self.connection._check()
+        self.connection.database._execute(self.connection, self, operation,
+                                            [parameters or ()])
+        return True
+
+    def executemany(self, operation, seq_of_parameters):
+        self.connection._check()
+        self.connection.database._execute(self.connection, self, operation,
+                                            list(seq_of_parameters), many=True)
+        return True
+
+    def fetchone(self):
+        if not self._rows:
+            return None
+        return self._rows.pop(0)
+
+    def fetchmany(self, size=None):
+        self._fetch_wait()
+        size = size or self.arraysize
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        self._fetch_wait()
+        rows, self._rows = self._rows, []
+        return rows
+
+    def _fetch_wait(self):
+        if self.connection.database.fetch_latency:
+            time.sleep(self.connection.database.fetch_latency)
+
+    def callproc(self, procname, parameters=()):
+        self.execute("CALL %s(%s)" % (procname,
+                            ", ".join("?" for p in parameters)), parameters)
+        return tuple(self._call_arguments)
+
+    def nextset(self):
+        if not self._result_sets:
+            self.description = None
+            self._rows = []
+            return None
+        names, rows = self._result_sets.pop(0)
+        self.description = tuple((name.lower(), None, None, None, None,
+                                  None, None) for name in names)
+        self._rows = [tuple(row) for row in rows]
+        return True
+
+    def setinputsizes(self, sizes):
+        self.connection.database.input_sizes.append(list(sizes))
+
+    def setoutputsize(self, size, column=None):
+        pass
+
+    def close(self):
+        self._rows = []
+
+
+class Connection(object):
+
+    def __init__(self, database):
+        self.database = database
+        self.closed = False
+        self.application_handle = next(database._handles)
+        # CURRENT LOCK TIMEOUT; None for the database's LOCKTIMEOUT
+        self.lock_timeout = None
+        # query timeout in seconds of the cursors created, as in pyodbc
+        self.timeout = 0
+        # CURRENT REFRESH AGE; 0 or 'ANY'
+        self.refresh_age = 0
+        self._last_identity_val = None
+        self._interrupt = threading.Event()
+
+    def _check(self):
+        if self.closed:
+            raise ProgrammingError("Connection is not active")
+
+    def cursor(self):
+        self._check()
+        return Cursor(self)
+
+    def commit(self):
+        self._check()
+        self.database._round_trip()
+
+    def rollback(self):
+        self._check()
+        self.database._round_trip()
+
+    def close(self):
+        self.closed = True
+
+    def server_info(self):
+        return (self.database.dbms_name, self.database.server_version)
+
+    def get_current_schema(self):
+        return self.database.schema
+
+    # pyodbc
+    def getinfo(self, infotype):
+        if infotype == DBAPI.SQL_DRIVER_NAME:
+            return 'libdb2o.so'
+        elif infotype == DBAPI.SQL_DBMS_VER:
+            return self.database.server_version
+        return None
+
+
+class DBAPI(object):
+    """The module object passed to ``create_engine(..., module=...)``.
+
+    Each :meth:`connect` call is one round trip and returns a connection
+    to the same :class:`.Database`.  The pyodbc ``getinfo()`` codes and
+    ``version`` are provided as well, so that the pyodbc dialects can be
+    pointed at the same database.
+
+    """
+
+    apilevel = apilevel
+    threadsafety = threadsafety
+    paramstyle = paramstyle
+
+    # pyodbc
+    version = '4.0.30'
+    SQL_DRIVER_NAME = 6
+    SQL_DRIVER_VER = 7
+    SQL_DBMS_VER = 18
+    SQL_DECIMAL = 3
+    SQL_INTEGER = 4
+    SQL_SMALLINT = 5
+    SQL_DOUBLE = 8
+    SQL_VARCHAR = 12
+    SQL_TYPE_DATE = 91
+    SQL_TYPE_TIME = 92
+    SQL_TYPE_TIMESTAMP = 93
+    SQL_BIGINT = -5
+    SQL_WVARCHAR = -9
+
+    def __init__(self, database=None):
+        self.database = database or Database()
+
+    def connect(self, *args, **kw):
+        self.database._round_trip()
+        return Connection(self.database)
+
+
+for _exc in _EXCEPTIONS:
+    setattr(DBAPI, _exc.__name__, _exc)
+del _exc
@@ -0,0 +1,1415 @@
+"""Reflection and execution against the in-process stand-in DBAPI.
+
+These tests don't need a DB2 server; see fake_ibm_db_dbi.py.
+
+"""
+import csv
+import datetime
+import decimal
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from sqlalchemy import exc, event, create_engine, MetaData, Table, Column, \
+    Integer, String, Date, DateTime, Boolean, Numeric, ForeignKey, Index, \
+    select, outparam, func, type_coerce
+from sqlalchemy.dialects import registry
+from sqlalchemy.engine import reflection
+from sqlalchemy.orm import mapper, clear_mappers, Session
+from sqlalchemy.schema import DDL, Sequence, CreateSequence, CreateTable, \
+    CreateIndex
+from sqlalchemy.sql import table, column
+from sqlalchemy.testing import fixtures, eq_, assert_raises, \
+    emits_warning, AssertsCompiledSQL
+
+from ibm_db_sa import compound as ibm_compound
+from ibm_db_sa.ibm_db import DB2Dialect_ibm_db
+from ibm_db_sa.ddl import CreateMaterializedQueryTable, RefreshTable, \
+    Truncate, DetachPartition
+from ibm_db_sa.dml import Call, inoutparam, DeleteChunk, chunked_delete
+from ibm_db_sa.export import export, db2_type_name
+from ibm_db_sa.routing import RoutingEngine, is_read_only
+
+from .fake_ibm_db_dbi import Database, DBAPI
+
+registry.register("db2.ibm_db", "ibm_db_sa.ibm_db", "DB2Dialect_ibm_db")
+registry.register("db2.pyodbc400", "ibm_db_sa.pyodbc", "AS400Dialect_pyodbc")
+
+
+def _schema(metadata):
+    parent = Table('parent', metadata,
+                Column('id', Integer, primary_key=True),
+                Column('name', String(30), nullable=False),
+                Column('created', DateTime))
+    child = Table('child', metadata,
+                Column('id', Integer, primary_key=True),
+                Column('parent_id', Integer, ForeignKey('parent.id')),
+                Column('amount', Numeric(10, 2)),
+                Index('ix_child_parent_id', 'parent_id'))
+    return parent, child
+
+
+class FakeDBAPITestBase(fixtures.TestBase):
+
+    url = "db2+ibm_db://"
+
+    def setup(self):
+        self.db = Database()
+        self.parent, self.child = _schema(MetaData())
+        self.db.add_table(self.parent)
+        self.db.add_table(self.child)
+        self.engine = create_engine(self.url, module=DBAPI(self.db))
+
+
+class ReflectionTest(FakeDBAPITestBase):
+
+    # row count of a table never analyzed
+    no_statistics = None
+    # distinct keys of ix_child_parent_id after runstats
+    non_unique_distinct_keys = 4
+    # catalog table of the foreign key query
+    references = 'REFERENCES'
+
+    def test_table_names(self):
+        insp = reflection.Inspector.from_engine(self.engine)
+        eq_(insp.get_table_names(), ['child', 'parent'])
+
+    def test_sorted_table_names(self):
+        conn = self.engine.connect()
+        eq_(self.engine.dialect.get_sorted_table_names(conn),
+            ['parent', 'child'])
+
+    def test_columns(self):
+        insp = reflection.Inspector.from_engine(self.engine)
+        columns = insp.get_columns('parent')
+        eq_([c['name'] for c in columns], ['id', 'name', 'created'])
+        eq_([c['nullable'] for c in columns], [False, False, True])
+        eq_(columns[1]['type'].length, 30)
+        eq_(columns[0]['info']['db2_cache'], 20)
+
+    def test_primary_key(self):
+        insp = reflection.Inspector.from_engine(self.engine)
+        eq_(insp.get_pk_constraint('child')['constrained_columns'], ['id'])
+
+    def test_foreign_keys_default_schema(self):
+        insp = reflection.Inspector.from_engine(self.engine)
+        fkeys = insp.get_foreign_keys('child')
+        eq_(len(fkeys), 1)
+        eq_(fkeys[0]['constrained_columns'], ['parent_id'])
+        eq_(fkeys[0]['referred_table'], 'parent')
+        eq_(fkeys[0]['referred_columns'], ['id'])
+        # the driver reports the current schema as a byte string;
+        # it must still be recognized as the default schema
+        eq_(fkeys[0]['referred_schema'], None)
+
+    def test_indexes(self):
+        insp = reflection.Inspector.from_engine(self.engine)
+        indexes = insp.get_indexes('child')
+        eq_([(i['name'], i['column_names'], i['unique']) for i in indexes],
+            [('ix_child_parent_id', ['parent_id'], False)])
+
+    def test_autoload(self):
+        table = Table('child', MetaData(), autoload=True,
+                        autoload_with=self.engine)
+        eq_(table.c.keys(), ['id', 'parent_id', 'amount'])
+        eq_(list(table.c.parent_id.foreign_keys)[0].target_fullname,
+            'parent.id')
+
+    def test_foreign_key_graph_round_trips(self):
+        insp = reflection.Inspector.from_engine(self.engine.connect())
+        insp.get_foreign_keys('child')
+        self.db.reset_counters()
+        insp.get_foreign_keys('parent')
+        insp.get_foreign_keys('child')
+        # one query for the schema-wide graph serves both lookups
+        eq_(self.db.round_trips, 1)
+
+    def test_reflect_foreign_key_queries(self):
+        for name in ('grandchild', 'other'):
+            self.db.add_table(Table(name, MetaData(),
+                        Column('id', Integer, primary_key=True),
+                        Column('child_id', Integer,
+                                ForeignKey(self.child.c.id))))
+        self.db.reset_counters()
+        metadata = MetaData()
+        metadata.reflect(bind=self.engine)
+        eq_(sorted(metadata.tables),
+            ['child', 'grandchild', 'other', 'parent'])
+        # the first table's own query, then the schema-wide graph
+        eq_(len([s for s, p in self.db.statements
+                    if self.references in s]), 2)
+
+    def test_reflect_foreign_keys_per_call(self):
+        # the pooled DBAPI connection, and a Connection, outlive a
+        # MetaData.reflect() call; foreign keys created in between, as
+        # through another connection, are seen by the next call
+        conn = self.engine.connect()
+        for i, bind in enumerate((self.engine, conn)):
+            metadata = MetaData()
+            metadata.reflect(bind=bind)
+            name = 'late_%d' % i
+            self.db.add_table(Table(name, MetaData(),
+                        Column('id', Integer, primary_key=True),
+                        Column('child_id', Integer,
+                                ForeignKey(self.child.c.id))))
+            metadata = MetaData()
+            metadata.reflect(bind=bind)
+            eq_([fk.target_fullname
+                    for fk in metadata.tables[name].c.child_id.foreign_keys],
+                ['child.id'])
+
+    def test_sorted_table_names_inspector(self):
+        insp = reflection.Inspector.from_engine(self.engine)
+        eq_(insp.get_table_names(order_by='foreign_key'),
+            ['parent', 'child'])
+
+    def test_table_statistics(self):
+        conn = self.engine.connect()
+        conn.execute(self.parent.insert(), [{'name': str(i)}
+                                                for i in range(250)])
+        self.db.runstats('parent')
+        statistics = self.engine.dialect.get_table_statistics(conn)
+        eq_(sorted(statistics), ['child', 'parent'])
+        eq_(statistics['parent']['row_count'], 250)
+        assert isinstance(statistics['parent']['stats_time'],
+                          (datetime.datetime, type(None)))
+        eq_(statistics['child']['row_count'], self.no_statistics)
+
+    def test_index_statistics(self):
+        conn = self.engine.connect()
+        conn.execute(self.parent.insert(), [{'name': str(i)}
+                                                for i in range(10)])
+        conn.execute(self.child.insert(), [{'parent_id': i % 4 + 1}
+                                                for i in range(10)])
+        self.db.runstats('child')
+        statistics = self.engine.dialect.get_index_statistics(conn)
+        index = [i for i in statistics['child']
+                    if i['name'] == 'ix_child_parent_id'][0]
+        eq_(index['distinct_keys'], self.non_unique_distinct_keys)
+
+    def test_approximate_row_count(self):
+        conn = self.engine.connect()
+        conn.execute(self.parent.insert(), [{'name': str(i)}
+                                                for i in range(5)])
+        self.db.runstats('parent')
+        conn.execute(self.parent.insert(), {'name': 'after runstats'})
+        self.db.reset_counters()
+        eq_(self.engine.dialect.get_approximate_row_count(conn, 'parent'), 5)
+        eq_(self.db.statements[0][0].count('COUNT'), 0)
+        assert_raises(exc.NoSuchTableError,
+                      self.engine.dialect.get_approximate_row_count,
+                      conn, 'nonexistent')
+
+
+class AS400ReflectionTest(ReflectionTest):
+
+    url = "db2+pyodbc400://"
+
+    # IBM i keeps row counts current, and only reports distinct keys
+    # for unique indexes
+    no_statistics = 0
+    non_unique_distinct_keys = None
+    references = 'SYSREFCST'
+
+    def test_columns(self):
+        insp = reflection.Inspector.from_engine(self.engine)
+        columns = insp.get_columns('parent')
+        eq_(sorted(c['name'] for c in columns), ['created', 'id', 'name'])
+
+    def test_autoload(self):
+        table = Table('child', MetaData(), autoload=True,
+                        autoload_with=self.engine)
+        # QSYS2 columns are reflected in name order
+        eq_(table.c.keys(), ['amount', 'id', 'parent_id'])
+        eq_(list(table.c.parent_id.foreign_keys)[0].target_fullname,
+            'parent.id')
+
+
+class TableOptionsTest(FakeDBAPITestBase):
+
+    def test_options(self):
+        insp = reflection.Inspector.from_engine(self.engine)
+        insp.get_table_names()
+        self.db.reset_counters()
+        eq_(insp.get_table_options('parent'),
+            {'db2_tablespace': 'userspace1'})
+        # one catalog query for a table which isn't partitioned
+        eq_(len(self.db.statements), 1)
+
+    def test_range_partitions(self):
+        self.db.add_range_partitions('parent', ['ID'], [
+                    ('P1', 'MINVALUE', '100', True, False),
+                    ('P2', '100', '200', False, True)])
+        insp = reflection.Inspector.from_engine(self.engine)
+        options = insp.get_table_options('parent')
+        eq_(options['db2_partition_by'], ['id'])
+        eq_(options['db2_partitions'],
+            [('p1', 'MINVALUE', '100', True, False),
+             ('p2', '100', '200', False, True)])
+        table = Table('t', MetaData(), Column('id', Integer),
+                      db2_partition_by=['id'],
+                      db2_partitions=options['db2_partitions'])
+        eq_(str(CreateTable(table).compile(dialect=self.engine.dialect)),
+            "\nCREATE TABLE t (\n\tid INT\n)"
+            "\nPARTITION BY RANGE (id) "
+            "(PARTITION p1 STARTING (MINVALUE) ENDING (100) EXCLUSIVE, "
+            "PARTITION p2 STARTING (100) EXCLUSIVE ENDING (200))\n\n")
+
+
+class ExecutionTest(FakeDBAPITestBase):
+
+    def test_insert_lastrowid(self):
+        conn = self.engine.connect()
+        result = conn.execute(self.parent.insert(), name='a',
+                        created=datetime.datetime(2013, 1, 26, 12, 30))
+        eq_(result.inserted_primary_key, [1])
+        result = conn.execute(self.parent.insert(), name='b')
+        eq_(result.inserted_primary_key, [2])
+        eq_(conn.execute(select([self.parent]).order_by(self.parent.c.id)).
+                fetchall(),
+            [(1, 'a', datetime.datetime(2013, 1, 26, 12, 30)),
+             (2, 'b', None)])
+
+    def test_limit(self):
+        conn = self.engine.connect()
+        conn.execute(self.parent.insert(), [{'name': str(i)}
+                                                for i in range(5)])
+        eq_(len(conn.execute(select([self.parent]).limit(2)).fetchall()), 2)
+
+    def test_sequence(self):
+        self.db.add_sequence('order_seq', start=100, increment=10)
+        conn = self.engine.connect()
+        stmt = "SELECT NEXTVAL FOR order_seq FROM SYSIBM.SYSDUMMY1"
+        eq_([conn.scalar(stmt), conn.scalar(stmt)], [100, 110])
+
+    def test_sequence_blocks(self):
+        self.db.add_sequence('order_seq', start=100, increment=10)
+        engine = create_engine(self.url, module=DBAPI(self.db),
+                               sequence_block_size=5)
+        conn = engine.connect()
+        try:
+            self.db.reset_counters()
+            seq = Sequence('order_seq')
+            eq_([conn.execute(seq) for i in range(7)],
+                [100 + 10 * i for i in range(7)])
+        finally:
+            conn.close()
+        # two blocks of five values, one statement each
+        eq_(len([s for s, p in self.db.statements if 'NEXTVAL' in s]), 2)
+
+    def _orders(self):
+        orders = Table('orders', MetaData(),
+                    Column('id', Integer, Sequence('order_seq'),
+                           primary_key=True),
+                    Column('name', String(30)))
+        self.db.add_table(orders)
+        self.db.add_sequence('order_seq', start=100, increment=10)
+        return orders
+
+    def test_sequence_blocks_insert(self):
+        orders = self._orders()
+        engine = create_engine(self.url, module=DBAPI(self.db),
+                               sequence_block_size=5)
+        result = engine.execute(orders.insert(), name='a')
+        eq_(result.inserted_primary_key, [100])
+        engine.execute(orders.insert(), [{'name': str(i)} for i in range(6)])
+        eq_(engine.execute(select([orders.c.id]).order_by(orders.c.id)).
+                fetchall(),
+            [(100 + 10 * i, ) for i in range(7)])
+        # the values are bound, not drawn by the INSERT
+        eq_(len([s for s, p in self.db.statements if 'NEXTVAL' in s]), 2)
+
+    def test_sequence_blocks_flush(self):
+        orders = self._orders()
+
+        class Order(object):
+            def __init__(self, name):
+                self.name = name
+        mapper(Order, orders)
+        try:
+            engine = create_engine(self.url, module=DBAPI(self.db),
+                                   sequence_block_size=5)
+            session = Session(bind=engine)
+            objects = [Order(str(i)) for i in range(7)]
+            session.add_all(objects)
+            session.commit()
+            eq_([o.id for o in objects], [100 + 10 * i for i in range(7)])
+            eq_(len([s for s, p in self.db.statements if 'NEXTVAL' in s]), 2)
+            session.close()
+        finally:
+            clear_mappers()
+
+    def test_sequence_insert_inline(self):
+        orders = self._orders()
+        self.engine.execute(orders.insert(), [{'name': 'a'}, {'name': 'b'}])
+        eq_(self.engine.execute(select([orders.c.id]).order_by(orders.c.id)).
+                fetchall(),
+            [(100, ), (110, )])
+        insert = [s for s, p in self.db.statements
+                        if s.startswith('INSERT INTO orders')]
+        eq_(insert, ['INSERT INTO orders (id, name) '
+                     'VALUES (NEXTVAL FOR order_seq, ?)'])
+
+    def test_in_list_buckets(self):
+        engine = create_engine(self.url, module=DBAPI(self.db),
+                               in_list_buckets=True)
+        engine.execute(self.parent.insert(), [{'name': str(i)}
+                                                for i in range(5)])
+        eq_(engine.execute(select([self.parent.c.name]).
+                    where(self.parent.c.id.in_([1, 2, 3])).
+                    order_by(self.parent.c.id)).fetchall(),
+            [('0', ), ('1', ), ('2', )])
+        eq_(self.db.statements[-1][1], [1, 2, 3, 3])
+
+    def test_decimal_result_type(self):
+        # the type the driver fetches DECIMAL values as is looked up on
+        # the first connect, unless given with native_decimal
+        for kw, result_type in (({}, float),
+                                ({'native_decimal': False}, float),
+                                ({'native_decimal': True}, decimal.Decimal)):
+            self.db.reset_counters()
+            engine = create_engine(self.url, module=DBAPI(self.db), **kw)
+            engine.execute(self.child.insert(), amount=decimal.Decimal('12.34'))
+            eq_(engine.dialect._decimal_result_type, result_type)
+            eq_(engine.dialect.supports_native_decimal,
+                result_type is decimal.Decimal)
+            eq_(len([s for s, p in self.db.statements
+                        if 'CAST(1.5 AS DECIMAL' in s]), int(not kw))
+        eq_(engine.scalar(select([type_coerce(self.child.c.amount,
+                                    Numeric(10, 2, asdecimal=False))])),
+            12.34)
+
+    def test_chunked_delete(self):
+        self.engine.execute(self.parent.insert(), [{'name': str(i)}
+                                                    for i in range(7)])
+        self.db.reset_counters()
+        eq_(chunked_delete(self.engine, self.parent,
+                           self.parent.c.id > 2, chunk_size=2), 5)
+        # 2 + 2 + 1 rows, the short batch ends the purge
+        eq_([p for s, p in self.db.statements if s.startswith('DELETE')],
+            [[2], [2], [2]])
+        eq_(self.engine.execute(select([self.parent.c.name]).
+                    order_by(self.parent.c.id)).fetchall(),
+            [('0', ), ('1', )])
+
+    def test_truncate(self):
+        self.engine.execute(self.parent.insert(), [{'name': str(i)}
+                                                    for i in range(3)])
+        self.engine.execute(Truncate(self.parent))
+        eq_(self.engine.scalar(select([func.count()]).
+                                    select_from(self.parent)), 0)
+
+    def test_sequence_options(self):
+        self.db.add_sequence('order_seq', start=100, increment=10)
+        conn = self.engine.connect()
+        try:
+            options = self.engine.dialect.get_sequence_options(
+                                                    conn, 'order_seq')
+        finally:
+            conn.close()
+        eq_(options, {'start': 100, 'increment': 10,
+                      'db2_cache': 20, 'db2_order': False})
+        # Sequence takes the db2_* options through its info dictionary
+        seq = Sequence('order_seq', start=options.pop('start'),
+                       increment=options.pop('increment'))
+        seq.info.update(options)
+        eq_(str(CreateSequence(seq).compile(dialect=self.engine.dialect)),
+            "CREATE SEQUENCE order_seq INCREMENT BY 10 START WITH 100 "
+            "CACHE 20 NO ORDER")
+
+    def test_round_trips(self):
+        conn = self.engine.connect()
+        self.db.reset_counters()
+        conn.execute(select([self.parent])).fetchall()
+        eq_(self.db.round_trips, 1)
+        eq_(len(self.db.statements), 1)
+
+    def test_latency(self):
+        conn = self.engine.connect()
+        self.db.latency = 0.05
+        now = time.time()
+        conn.execute(select([self.parent])).fetchall()
+        assert time.time() - now >= 0.05
+
+    def test_staged_table_dropped_on_checkin(self):
+        from ibm_db_sa import stage_rows
+        conn = self.engine.connect()
+        keys = stage_rows(conn, 'keys', [Column('id', Integer)],
+                            [(1, ), (2, ), (3, )])
+        conn.execute(self.parent.insert(), [{'name': 'a'}, {'name': 'b'}])
+        eq_(conn.execute(select([self.parent.c.name]).
+                    select_from(self.parent.join(
+                            keys, keys.c.id == self.parent.c.id)).
+                    order_by(self.parent.c.name)).fetchall(),
+            [('a', ), ('b', )])
+        conn.close()
+        eq_(self.db.statements[-1][0], 'DROP TABLE "SESSION".keys')
+
+    def test_staged_table_drop_encoded(self):
+        from ibm_db_sa import stage_table, staging
+        conn = self.engine.connect()
+        self.engine.dialect.supports_unicode_statements = False
+        stage_table(conn, 'keys', [Column('id', Integer)])
+        # the driver is handed the DROP as the dialect encodes statements
+        drop, = conn.connection.info[staging._STAGED_TABLES].values()
+        assert isinstance(drop, str)
+        conn.close()
+        eq_(self.db.statements[-1][0], 'DROP TABLE "SESSION".keys')
+
+    def test_unicode_statements_detected(self):
+        self.engine.connect().close()
+        eq_(self.engine.dialect.supports_unicode_statements, True)
+
+    def test_encoded_statement_cached(self):
+        conn = self.engine.connect()
+        dialect = self.engine.dialect
+        dialect.supports_unicode_statements = False
+        compiled = select([self.parent]).compile(dialect=dialect)
+        first = conn.execute(compiled).context.statement
+        second = conn.execute(compiled).context.statement
+        assert isinstance(first, str)
+        assert first is second
+
+    def _compound_session(self, **kw):
+        class Parent(object):
+            def __init__(self, **kw):
+                self.__dict__.update(kw)
+        mapper(Parent, self.parent)
+        engine = create_engine(self.url, module=DBAPI(self.db),
+                                compound_dml=True)
+        return Parent, Session(bind=engine, **kw)
+
+    def test_compound_dml(self):
+        Parent, session = self._compound_session()
+        try:
+            session.connection()
+            self.db.reset_counters()
+            b = Parent(id=2, name='b')
+            session.add_all([Parent(id=1, name='a'), b])
+            session.flush()
+            b.name = 'c'
+            session.flush()
+            eq_(self.db.round_trips, 0)
+            session.commit()
+            # one compound statement, then COMMIT, and the ROLLBACK of
+            # the connection returned to the pool
+            eq_(self.db.round_trips, 3)
+            assert self.db.statements[0][0].startswith('BEGIN ATOMIC')
+            eq_(self.engine.execute(select([self.parent.c.name]).
+                            order_by(self.parent.c.id)).fetchall(),
+                [('a', ), ('c', )])
+        finally:
+            session.close()
+            clear_mappers()
+
+    def test_compound_dml_rowcount_checked(self):
+        Parent, session = self._compound_session(expire_on_commit=False)
+        try:
+            a = Parent(id=1, name='a')
+            session.add(a)
+            session.commit()
+            self.engine.execute(self.parent.delete())
+            a.name = 'x'
+            session.flush()
+            try:
+                session.commit()
+            except exc.DBAPIError, e:
+                assert ibm_compound.STALE_ROW_SQLSTATE in str(e)
+            else:
+                assert False, "rowcount mismatch not detected"
+        finally:
+            session.close()
+            clear_mappers()
+
+    def test_compound_dml_flushed_before_select(self):
+        Parent, session = self._compound_session()
+        try:
+            session.add(Parent(id=1, name='a'))
+            session.flush()
+            eq_(session.scalar(select([self.parent.c.name])), 'a')
+        finally:
+            session.close()
+            clear_mappers()
+
+    def test_compound_dml_flushed_before_raw_cursor(self):
+        Parent, session = self._compound_session()
+        session.bind = create_engine(self.url, module=DBAPI(self.db),
+                                     compound_dml=True, result_cache_size=1000)
+        try:
+            session.connection()
+            self.db.reset_counters()
+            b = Parent(id=2, name='b')
+            session.add_all([Parent(id=1, name='a'), b])
+            session.flush()
+            b.name = 'c'
+            session.flush()
+            session.connection().execution_options(lock_timeout=5).execute(
+                        select([self.parent.c.id]))
+            statements = [s.split()[0] for s, p in self.db.statements
+                            if s.split()[0] in ('BEGIN', 'SET')
+                                or 'CURRENT_SCHEMA' in s]
+            # the cache's identity lookup came after the INSERTs held
+            # back, SET LOCK TIMEOUT after the UPDATE
+            eq_(statements, ['BEGIN', 'SELECT', 'BEGIN', 'SET'])
+            session.commit()
+        finally:
+            session.close()
+            clear_mappers()
+
+    def test_compound_dml_core_runs_directly(self):
+        engine = create_engine(self.url, module=DBAPI(self.db),
+                                compound_dml=True)
+        conn = engine.connect()
+        try:
+            conn.execute(self.parent.insert(), [{'id': 1, 'name': 'a'},
+                                                {'id': 2, 'name': 'b'}])
+            # a compiled_cache, as the ORM uses, doesn't make a Core
+            # statement the ORM's
+            eq_(conn.execution_options(compiled_cache={}).execute(
+                        self.parent.update().where(self.parent.c.id == 10),
+                        name='x').rowcount, 0)
+            # rowcounts of statements matching no row or several
+            eq_(conn.execute(self.parent.update().
+                        where(self.parent.c.id == 10), name='x').rowcount, 0)
+            eq_(conn.execute(self.parent.update(), name='x').rowcount, 2)
+        finally:
+            conn.close()
+        assert not [s for s, p in self.db.statements
+                        if s.startswith('BEGIN ATOMIC')]
+
+    def test_compact_rows(self):
+        conn = self.engine.connect()
+        try:
+            created = datetime.datetime(2013, 1, 26, 12, 0)
+            conn.execute(self.parent.insert(), [
+                        {'name': str(i), 'created': created}
+                        for i in range(5)])
+            stmt = select([self.parent.c.id, self.parent.c.created]).\
+                        order_by(self.parent.c.id)
+            expected = [tuple(row) for row in conn.execute(stmt)]
+            for compact_rows in (True, 2):
+                result = conn.execution_options(
+                                compact_rows=compact_rows).execute(stmt)
+                eq_(result.fetchone(), expected[0])
+                rows = result.fetchmany(3) + result.fetchall()
+                eq_(rows, expected[1:])
+                # processed values, attribute access on plain tuples
+                eq_(rows[0].created, created)
+                eq_(type(rows[0]).__bases__, (tuple, ))
+        finally:
+            conn.close()
+
+    def test_prefetch_rows(self):
+        conn = self.engine.connect()
+        conn.execute(self.parent.insert(), [{'name': str(i)}
+                                                for i in range(25)])
+        result = conn.execution_options(prefetch_rows=10).execute(
+                        select([self.parent.c.name]).
+                        order_by(self.parent.c.id))
+        eq_(result.fetchone(), ('0', ))
+        eq_(len(result.fetchmany(12)), 12)
+        eq_([row[0] for row in result.fetchall()],
+            [str(i) for i in range(13, 25)])
+
+    def test_prefetch_rows_closed_early(self):
+        conn = self.engine.connect()
+        conn.execute(self.parent.insert(), [{'name': str(i)}
+                                                for i in range(25)])
+        result = conn.execution_options(prefetch_rows=5,
+                                        prefetch_blocks=1).execute(
+                        select([self.parent]))
+        result.fetchone()
+        result.close()
+        eq_(conn.scalar(select([self.parent.c.name]).
+                        where(self.parent.c.id == 1)), '0')
+
+    def _orders_procedure(self, arguments):
+        keys = arguments[0]
+        return [(['id'], [(key, ) for key in keys]),
+                (['id', 'doubled'], [(key, key * 2) for key in keys])]
+
+    def test_call_result_sets(self):
+        self.db.add_procedure('get_orders', self._orders_procedure,
+                                schema='app')
+        conn = self.engine.connect()
+        call = Call('get_orders', [1, 2, 3], schema='app')
+        eq_(unicode(call.compile(dialect=self.engine.dialect)),
+            "CALL app.get_orders(ARRAY[?, ?, ?])")
+        result = conn.execute(call)
+        eq_([row.id for row in result], [1, 2, 3])
+        assert result.nextset()
+        eq_([(row.id, row.doubled) for row in result.fetchall()],
+            [(1, 2), (2, 4), (3, 6)])
+        assert not result.nextset()
+        assert result.closed
+
+    def test_call_result_sets_iterated(self):
+        self.db.add_procedure('get_orders', self._orders_procedure)
+        conn = self.engine.connect()
+        result = conn.execute(Call('get_orders', [4, 5]))
+        eq_([r.keys() for r in result.result_sets()],
+            [['id'], ['id', 'doubled']])
+        eq_(conn.scalar(select([1])), 1)
+
+    def test_call_out_parameters(self):
+        def procedure(arguments):
+            arguments[1] = arguments[0] * 10
+            arguments[2] = arguments[2] + 1
+        self.db.add_procedure('scale', procedure)
+        conn = self.engine.connect()
+        result = conn.execute(Call('scale', 4,
+                                   outparam('scaled', Integer),
+                                   inoutparam('counter', 1, Integer)))
+        eq_(result.out_parameters, {'scaled': 40, 'counter': 2})
+
+    def test_call_out_parameters_with_array(self):
+        self.db.add_procedure('scale', lambda arguments: None)
+        conn = self.engine.connect()
+        assert_raises(exc.InvalidRequestError, conn.execute,
+                      Call('scale', [1, 2], outparam('scaled', Integer)))
+
+
+class BindTest(FakeDBAPITestBase):
+
+    def setup(self):
+        super(BindTest, self).setup()
+        self.events = Table('events', MetaData(),
+                    Column('id', Integer, primary_key=True),
+                    Column('day', Date),
+                    Column('done', Boolean))
+        self.db.add_table(self.events)
+
+    def test_native_binds(self):
+        conn = self.engine.connect()
+        conn.execute(self.events.insert(), id=1,
+                        day=datetime.datetime(2013, 1, 26, 12, 30), done=True)
+        eq_(list(self.db.statements[-1][1]), [1, datetime.date(2013, 1, 26), 1])
+        eq_(conn.execute(select([self.events.c.day, self.events.c.done])).
+                fetchall(),
+            [(datetime.date(2013, 1, 26), True)])
+
+    def test_setinputsizes_pyodbc(self):
+        dbapi = DBAPI(self.db)
+        engine = create_engine("db2+pyodbc400://", module=dbapi,
+                                use_setinputsizes=True)
+        conn = engine.connect()
+        conn.execute(self.events.insert(), id=1,
+                        day=datetime.date(2013, 1, 26), done=False)
+        conn.execute(self.parent.insert(), name='a')
+        eq_(self.db.input_sizes,
+            [[(dbapi.SQL_INTEGER, 10, 0), (dbapi.SQL_TYPE_DATE, 10, 0),
+              (dbapi.SQL_SMALLINT, 5, 0)],
+             [(dbapi.SQL_VARCHAR, 1, 0)]])
+
+        # strings are sized by the longest value bound, not the column
+        del self.db.input_sizes[:]
+        conn.execute(self.parent.insert(), [{'name': 'abc'}, {'name': 'ab'}])
+        conn.execute(select([self.parent.c.id]).where(
+                        self.parent.c.name.like('%' + 'a' * 40 + '%')))
+        eq_(self.db.input_sizes,
+            [[(dbapi.SQL_VARCHAR, 3, 0)], [(dbapi.SQL_VARCHAR, 42, 0)]])
+
+        # parameters of types without a fixed description are left to
+        # the driver
+        del self.db.input_sizes[:]
+        conn.execute("SELECT 1 FROM SYSIBM.SYSDUMMY1 WHERE 1 = ?", 1)
+        conn.execute(select([self.parent]).where(
+                        self.parent.c.name.like('%a%')).limit(1))
+        conn.execute(DDL("CREATE TABLE t (a INTEGER)"))
+        eq_(self.db.input_sizes, [[(dbapi.SQL_VARCHAR, 3, 0)]])
+
+    def test_setinputsizes_disabled(self):
+        # off unless enabled
+        for kw in ({}, {'use_setinputsizes': False}):
+            engine = create_engine("db2+pyodbc400://",
+                                    module=DBAPI(self.db), **kw)
+            engine.execute(self.parent.insert(), name='a')
+        eq_(self.db.input_sizes, [])
+
+    def test_fast_executemany(self):
+        rows = [{'name': str(i), 'created': datetime.datetime(2013, 1, 26)}
+                    for i in range(5)]
+        # VARCHAR(30) and TIMESTAMP take 62 bytes a row; two rows a batch
+        for kw in ({'executemany_buffer_size': 130},
+                   {'executemany_batch_size': 2}):
+            engine = create_engine("db2+pyodbc400://", module=DBAPI(self.db),
+                                   fast_executemany=True, **kw)
+            self.db.reset_counters()
+            eq_(engine.execute(self.parent.insert(), rows).rowcount, 5)
+            eq_([len(p) for s, p in self.db.statements
+                        if s.startswith('INSERT')], [2, 2, 1])
+
+        engine = create_engine("db2+pyodbc400://", module=DBAPI(self.db))
+        self.db.reset_counters()
+        engine.execute(self.parent.insert(), rows)
+        eq_([len(p) for s, p in self.db.statements
+                    if s.startswith('INSERT')], [5])
+        eq_(engine.scalar(select([func.count()]).select_from(self.parent)),
+            15)
+
+
+class MaterializedQueryTableTest(FakeDBAPITestBase):
+
+    def setup(self):
+        super(MaterializedQueryTableTest, self).setup()
+        self.totals = Table('parent_totals', MetaData(),
+                    Column('name', String(30)),
+                    Column('children', Integer))
+        self.create = CreateMaterializedQueryTable(self.totals,
+                    select([self.parent.c.name, func.count()]).
+                    select_from(self.parent.join(self.child)).
+                    where(self.parent.c.name != 'x').
+                    group_by(self.parent.c.name),
+                    maintained_by='user')
+
+    def test_compile(self):
+        eq_(str(self.create.compile(dialect=self.engine.dialect)),
+            "CREATE TABLE parent_totals (name, children) AS "
+            "(SELECT parent.name, count(*) AS count_1 \n"
+            "FROM parent INNER JOIN child ON parent.id = child.parent_id \n"
+            "WHERE parent.name != 'x' GROUP BY parent.name)\n"
+            "DATA INITIALLY DEFERRED REFRESH DEFERRED "
+            "ENABLE QUERY OPTIMIZATION MAINTAINED BY USER")
+        eq_(str(RefreshTable(self.totals, incremental=False).compile(
+                                        dialect=self.engine.dialect)),
+            "REFRESH TABLE parent_totals NOT INCREMENTAL")
+        assert_raises(ValueError, CreateMaterializedQueryTable,
+                      self.totals, select([self.parent]),
+                      refresh='immediate', maintained_by='user')
+
+    def test_create_and_refresh(self):
+        conn = self.engine.connect()
+        conn.execute(self.create)
+        conn.execute(self.parent.insert(), id=1, name='a')
+        conn.execute(self.child.insert(), [{'parent_id': 1},
+                                           {'parent_id': 1}])
+        eq_(conn.execute(select([self.totals])).fetchall(), [])
+        conn.execute(RefreshTable(self.totals))
+        eq_(conn.execute(select([self.totals])).fetchall(), [('a', 2)])
+
+    def _test_reflection(self, engine):
+        conn = engine.connect()
+        conn.execute(self.create)
+        mqts = engine.dialect.get_materialized_query_tables(conn)
+        eq_(mqts.keys(), ['parent_totals'])
+        eq_(mqts['parent_totals']['refresh'], 'deferred')
+        eq_(mqts['parent_totals']['maintained_by'], 'user')
+        eq_(mqts['parent_totals']['refresh_time'], None)
+        assert mqts['parent_totals']['definition'].startswith(
+                        'CREATE TABLE parent_totals (name, children) AS')
+        conn.execute(RefreshTable(self.totals))
+        assert engine.dialect.get_materialized_query_tables(conn)[
+                        'parent_totals']['refresh_time'] is not None
+        eq_(engine.dialect.get_materialized_query_table_names(conn),
+            ['parent_totals'])
+
+    def test_reflection(self):
+        self._test_reflection(self.engine)
+        insp = reflection.Inspector.from_engine(self.engine)
+        eq_(insp.get_view_names(), [])
+        eq_(sorted(insp.get_table_names()), ['child', 'parent'])
+
+    def test_reflection_as400(self):
+        self._test_reflection(create_engine("db2+pyodbc400://",
+                                            module=DBAPI(self.db)))
+
+    def test_refresh_age(self):
+        conn = self.engine.connect().execution_options(refresh_age='ANY')
+        dbapi_connection = conn.connection.connection
+        conn.execute(select([self.parent]))
+        conn.execute(select([self.parent]))
+        eq_(dbapi_connection.refresh_age, 'ANY')
+        eq_(len([s for s, p in self.db.statements
+                    if 'REFRESH AGE' in s]), 1)
+        conn.close()
+        # reset when the connection goes back to the pool
+        eq_(dbapi_connection.refresh_age, 0)
+
+
+class MaintenanceTest(FakeDBAPITestBase):
+
+    def setup(self):
+        super(MaintenanceTest, self).setup()
+        self.engines = []
+
+    def teardown(self):
+        # background maintenance holds a connection of the pool
+        for engine in self.engines:
+            engine.dialect.maintenance.join()
+
+    def _engine(self, **kw):
+        engine = create_engine(self.url, module=DBAPI(self.db),
+                               runstats_rows=100, **kw)
+        self.engines.append(engine)
+        return engine
+
+    def _insert(self, conn, count):
+        conn.execute(self.parent.insert(), [{'name': str(i)}
+                                                for i in range(count)])
+
+    def _runstats(self):
+        return [s for s, p in self.db.statements
+                    if s.startswith('CALL SYSPROC.ADMIN_CMD') and
+                        p[0].startswith('RUNSTATS')]
+
+    def test_runstats_after_threshold(self):
+        engine = self._engine()
+        conn = engine.connect()
+        self._insert(conn, 60)
+        self._insert(conn, 60)
+        # not within the COMMIT, but when the connection is checked in
+        eq_(self._runstats(), [])
+        conn.close()
+        eq_(len(self._runstats()), 1)
+        conn = engine.connect()
+        try:
+            eq_(engine.dialect.get_approximate_row_count(conn, 'parent'),
+                120)
+        finally:
+            conn.close()
+        eq_(engine.dialect.maintenance.stats()['runstats'], 1)
+
+    def test_rollback_discards_rows(self):
+        engine = self._engine()
+        conn = engine.connect()
+        trans = conn.begin()
+        self._insert(conn, 150)
+        trans.rollback()
+        self._insert(conn, 50)
+        conn.close()
+        eq_(self._runstats(), [])
+
+    def test_runstats_ratio(self):
+        engine = self._engine(runstats_ratio=0.5)
+        self._insert(engine, 400)
+        self.db.reset_counters()
+        # 150 rows written is under half of the 400 rows in the catalog
+        self._insert(engine, 150)
+        eq_(self._runstats(), [])
+        self._insert(engine, 100)
+        eq_(len(self._runstats()), 1)
+
+    def test_reorg_check(self):
+        engine = self._engine(reorg_check=True)
+        self.db.reorg_flags[('DB2INST1', 'PARENT')] = '-*-'
+        self._insert(engine, 100)
+        eq_(self.db.reorged, [('DB2INST1', 'PARENT')])
+        eq_(len(self._runstats()), 2)
+        eq_(engine.dialect.maintenance.stats()['reorgs'], 1)
+
+    def test_maintenance_async(self):
+        engine = self._engine(maintenance_async=True)
+        conn = engine.connect()
+        try:
+            self._insert(conn, 100)
+            engine.dialect.maintenance.join()
+            eq_(len(self._runstats()), 1)
+            eq_(engine.dialect.get_approximate_row_count(conn, 'parent'),
+                100)
+        finally:
+            conn.close()
+
+    @emits_warning('Maintenance of tables')
+    def test_maintenance_async_pool_failure(self):
+        engine = self._engine(maintenance_async=True, pool_size=1,
+                              max_overflow=0, pool_timeout=0.1)
+        conn = engine.connect()
+        try:
+            self._insert(conn, 100)
+            engine.dialect.maintenance.join()
+        finally:
+            conn.close()
+        eq_(self._runstats(), [])
+        eq_(engine.dialect.maintenance.stats()['failures'], 1)
+
+
+class ResultCacheTest(FakeDBAPITestBase):
+
+    def setup(self):
+        super(ResultCacheTest, self).setup()
+        self.engine = create_engine(self.url, module=DBAPI(self.db),
+                                    result_cache_size=1024 * 1024)
+        self.cache = self.engine.dialect.result_cache
+        self.other = Table('parent', MetaData(),
+                        Column('id', Integer, primary_key=True),
+                        Column('name', String(30)),
+                        schema='other')
+        self.db.add_table(self.other)
+        self.engine.execute(self.parent.insert(), id=1, name='a')
+
+    def _names(self, conn, table=None):
+        table = self.parent if table is None else table
+        return conn.execution_options(result_cache=True).execute(
+                    select([table.c.name]).order_by(table.c.id)).fetchall()
+
+    def test_cached(self):
+        conn = self.engine.connect()
+        try:
+            eq_(self._names(conn), [('a', )])
+            self.db.reset_counters()
+            eq_(self._names(conn), [('a', )])
+            eq_(self.db.round_trips, 0)
+        finally:
+            conn.close()
+        eq_(self.cache.stats()['hits'], 1)
+        # keyed on the connection's schema and user
+        key = list(self.cache._entries)[0]
+        eq_(key[0], ('db2inst1', 'db2inst1'))
+
+    def test_invalidated_at_commit(self):
+        conn, other = self.engine.connect(), self.engine.connect()
+        try:
+            eq_(self._names(other), [('a', )])
+            trans = conn.begin()
+            conn.execute(self.parent.insert(), id=2, name='b')
+            # the writing connection reads its own writes
+            eq_(len(self._names(conn)), 2)
+            eq_(self.cache.stats()['entries'], 1)
+            trans.commit()
+            eq_(self.cache.stats()['entries'], 0)
+            eq_(len(self._names(other)), 2)
+        finally:
+            conn.close()
+            other.close()
+
+    def test_invalidated_at_rollback(self):
+        conn = self.engine.connect()
+        try:
+            eq_(self._names(conn), [('a', )])
+            trans = conn.begin()
+            conn.execute("UPDATE parent SET name = 'b'")
+            trans.rollback()
+            eq_(self.cache.stats()['invalidations'], 1)
+        finally:
+            conn.close()
+
+    def test_schema_qualified(self):
+        conn = self.engine.connect()
+        try:
+            eq_(self._names(conn), [('a', )])
+            eq_(self._names(conn, self.other), [])
+            conn.execute(self.other.insert(), id=1, name='x')
+            conn.execute("DELETE FROM db2inst1.child")
+            eq_(self.cache.stats()['entries'], 1)
+            eq_(self._names(conn, self.other), [('x', )])
+        finally:
+            conn.close()
+
+    def test_unknown_writes_clear(self):
+        conn = self.engine.connect()
+        try:
+            eq_(self._names(conn), [('a', )])
+            trans = conn.begin()
+            conn.execute("CALL SYSPROC.ADMIN_CMD(?)",
+                         ("RUNSTATS ON TABLE DB2INST1.PARENT", ))
+            eq_(self.cache.stats()['entries'], 1)
+            trans.commit()
+            eq_(self.cache.stats()['entries'], 0)
+        finally:
+            conn.close()
+
+    def test_late_store_dropped(self):
+        tables = frozenset([('db2inst1', 'parent')])
+        stamp = self.cache.stamp(tables)
+        # a writer commits while the statement runs
+        self.cache.invalidate(tables)
+        self.cache.put(('k', ), tables, stamp, (('NAME', ), ), [('a', )])
+        eq_(self.cache.stats()['entries'], 0)
+        self.cache.put(('k', ), tables, self.cache.stamp(tables),
+                       (('NAME', ), ), [('a', )])
+        eq_(self.cache.stats()['entries'], 1)
+
+
+class TimeoutTest(FakeDBAPITestBase):
+
+    def test_timeout_cancels_activity(self):
+        conn = self.engine.connect()
+        start = time.time()
+        assert_raises(exc.OperationalError,
+                      conn.execution_options(timeout=0.2).execute,
+                      "CALL DBMS_ALERT.SLEEP(5)")
+        assert time.time() - start < 2
+        eq_(self.engine.dialect.watchdog.cancelled, 1)
+        # the connection is still usable
+        eq_(conn.scalar(select([self.parent.c.id]).limit(1)), None)
+
+    def test_timeout_pool_exhausted(self):
+        engine = create_engine(self.url, module=DBAPI(self.db),
+                               pool_size=1, max_overflow=0, pool_timeout=5)
+        conn = engine.connect()
+        try:
+            start = time.time()
+            assert_raises(exc.OperationalError,
+                          conn.execution_options(timeout=0.2).execute,
+                          "CALL DBMS_ALERT.SLEEP(5)")
+            # the watchdog doesn't wait for a connection of the pool
+            assert time.time() - start < 2
+            eq_(engine.dialect.watchdog.cancelled, 1)
+        finally:
+            conn.close()
+
+    def test_timeout_not_reached(self):
+        conn = self.engine.connect().execution_options(timeout=5)
+        conn.execute("CALL DBMS_ALERT.SLEEP(0.05)")
+        conn.execute(select([self.parent]))
+        eq_(self.engine.dialect.watchdog.cancelled, 0)
+        # the application handle is looked up once per connection
+        eq_(len([s for s, p in self.db.statements
+                    if 'MON_GET_APPLICATION_HANDLE' in s]), 1)
+
+    def test_timeout_pyodbc(self):
+        engine = create_engine("db2+pyodbc400://", module=DBAPI(self.db))
+        conn = engine.connect()
+        assert_raises(exc.OperationalError,
+                      conn.execution_options(timeout=0.2).execute,
+                      "CALL DBMS_ALERT.SLEEP(5)")
+        # the driver's own query timeout is used, rounded up to seconds
+        eq_(engine.dialect.watchdog.cancelled, 0)
+        eq_(conn.connection.connection.timeout, 0)
+
+    def test_lock_timeout(self):
+        conn = self.engine.connect().execution_options(lock_timeout=5)
+        dbapi_connection = conn.connection.connection
+        conn.execute(select([self.parent]))
+        conn.execute(select([self.parent]))
+        eq_(dbapi_connection.lock_timeout, 5)
+        eq_(len([s for s, p in self.db.statements
+                    if 'LOCK TIMEOUT' in s]), 1)
+        conn.close()
+        # reset when the connection goes back to the pool
+        eq_(dbapi_connection.lock_timeout, None)
+
+    def test_lock_timeout_isolation_level(self):
+        conn = self.engine.connect().execution_options(lock_timeout=5)
+        dbapi_connection = conn.connection.connection
+        conn.execute(select([self.parent]))
+        # as Connection._set_isolation_level() does
+        conn.connection._connection_record.finalize_callback = \
+                                        lambda dbapi_connection: None
+        conn.close()
+        eq_(dbapi_connection.lock_timeout, None)
+        conn = self.engine.connect()
+        try:
+            conn.execute(select([self.parent]))
+            eq_(dbapi_connection.lock_timeout, None)
+        finally:
+            conn.close()
+
+
+class RoutingTest(FakeDBAPITestBase):
+
+    def setup(self):
+        super(RoutingTest, self).setup()
+        self.standby_db = Database(standby=True, replay_delay=5)
+        self.standby_db.add_table(self.parent)
+        self.standby_db.add_table(self.child)
+        self.standby = create_engine(self.url,
+                                        module=DBAPI(self.standby_db))
+
+    def _router(self, **kw):
+        return RoutingEngine(self.engine, [self.standby], **kw)
+
+    def test_reads_go_to_standby(self):
+        router = self._router()
+        conn = router.connect()
+        try:
+            conn.execute(self.parent.insert(), id=1, name='a')
+            eq_(conn.execute(select([self.parent])).fetchall(), [])
+            eq_(conn.execute(select([self.parent.c.id], for_update=True)).
+                                fetchall(),
+                [(1, )])
+        finally:
+            conn.close()
+        stats = router.stats()
+        eq_(stats['primary']['statements'], 2)
+        eq_(stats['standby1']['statements'], 1)
+
+    def test_transaction_reads_primary(self):
+        self.engine.execute(self.parent.insert(), id=1, name='a')
+        conn = self._router().connect()
+        try:
+            trans = conn.begin()
+            # reads before the first write see the primary as well
+            eq_(len(conn.execute(select([self.parent])).fetchall()), 1)
+            conn.execute(self.parent.insert(), id=2, name='b')
+            eq_(len(conn.execute(select([self.parent])).fetchall()), 2)
+            trans.commit()
+            eq_(conn.execute(select([self.parent])).fetchall(), [])
+        finally:
+            conn.close()
+
+    def test_data_change_statements_not_read_only(self):
+        assert is_read_only("WITH t AS (SELECT id FROM parent) "
+                            "SELECT * FROM t")
+        assert not is_read_only("SELECT id FROM FINAL TABLE "
+                                "(INSERT INTO parent (name) VALUES ('a'))")
+        assert not is_read_only("WITH t AS (SELECT 1 FROM SYSIBM.SYSDUMMY1) "
+                                "INSERT INTO parent (name) SELECT 'a' FROM t")
+        assert not is_read_only("SELECT id FROM parent FOR UPDATE")
+
+    def test_staleness(self):
+        router = self._router(max_staleness=1)
+        router.execute(select([self.parent])).fetchall()
+        eq_(router.stats()['standby1']['statements'], 0)
+        eq_(router.stats()['standby1']['replay_delay'], 5)
+        eq_(router.stats()['primary']['statements'], 1)
+
+    def test_staleness_probe_unlocked(self):
+        router = self._router(max_staleness=10)
+        locked = []
+
+        @event.listens_for(self.standby, 'before_cursor_execute')
+        def probe(conn, cursor, statement, parameters, context, many):
+            if 'MON_GET_HADR' in statement:
+                locked.append(router._mutex.locked())
+        eq_(router.execute(select([self.parent])).fetchall(), [])
+        eq_(locked, [False])
+        eq_(router.stats()['standby1']['statements'], 1)
+
+    def test_fallback_on_rejection(self):
+        self.db.add_sequence('order_seq', start=100, increment=10)
+        router = self._router()
+        eq_(router.scalar("SELECT NEXTVAL FOR order_seq "
+                          "FROM SYSIBM.SYSDUMMY1"), 100)
+        stats = router.stats()
+        eq_(stats['standby1']['fallbacks'], 1)
+        eq_(stats['primary']['statements'], 1)
+
+
+class ExportTest(FakeDBAPITestBase):
+
+    def setup(self):
+        super(ExportTest, self).setup()
+        self.dir = tempfile.mkdtemp()
+        self.engine.execute(self.parent.insert(),
+                [{'name': u'n\xe9%d' % i,
+                  'created': datetime.datetime(2013, 1, 26, 12, i)}
+                 for i in range(10)])
+
+    def teardown(self):
+        shutil.rmtree(self.dir)
+
+    def _read(self, path):
+        f = open(path, 'rb')
+        try:
+            return list(csv.reader(f))
+        finally:
+            f.close()
+
+    def test_csv(self):
+        path = os.path.join(self.dir, 'parent.csv')
+        eq_(export(self.engine, self.parent, path, format='csv',
+                    batch_size=3),
+            [(path, 10)])
+        rows = self._read(path)
+        eq_(rows[0], ['id', 'name', 'created'])
+        eq_(rows[1], ['1', 'n\xc3\xa90', '2013-01-26 12:00:00'])
+        eq_(len(rows), 11)
+
+    def test_csv_partitions(self):
+        path = os.path.join(self.dir, 'parent')
+        results = export(self.engine, 'parent', path, format='csv',
+                            partition_column='id', partitions=3)
+        eq_([(os.path.basename(p), count) for p, count in results],
+            [('part-00000.csv', 3), ('part-00001.csv', 4),
+             ('part-00002.csv', 3)])
+        ids = []
+        for p, count in results:
+            ids.extend(int(row[0]) for row in self._read(p)[1:])
+        eq_(sorted(ids), range(1, 11))
+
+    def test_csv_partitions_null_and_negative_keys(self):
+        keys = [None, -5, -4, -3, None, 0, 1, 2, None, 7]
+        self.engine.execute(self.child.insert(),
+                            [{'parent_id': key} for key in keys])
+        path = os.path.join(self.dir, 'child')
+        results = export(self.engine,
+                            select([self.child.c.id, self.child.c.parent_id]),
+                            path, format='csv',
+                            partition_column=self.child.c.parent_id,
+                            partitions=3)
+        # MOD(ABS(key), 3), and a partition for the NULL keys
+        eq_([(os.path.basename(p), count) for p, count in results],
+            [('part-00000.csv', 2), ('part-00001.csv', 3),
+             ('part-00002.csv', 2), ('part-00003.csv', 3)])
+        ids = []
+        for p, count in results:
+            ids.extend(int(row[0]) for row in self._read(p)[1:])
+        eq_(sorted(ids), range(1, 11))
+
+    def test_type_names(self):
+        from ibm_db_sa import base
+        eq_([db2_type_name(t) for t in (Integer(), Numeric(10, 2),
+                                         String(5), base.DOUBLE(),
+                                         base.VARGRAPHIC(5))],
+            ['INTEGER', 'DECIMAL', 'VARCHAR', 'DOUBLE', 'VARGRAPHIC'])
+
+
+class CompileTest(fixtures.TestBase, AssertsCompiledSQL):
+
+    __dialect__ = DB2Dialect_ibm_db()
+
+    t = table('t', column('id'))
+
+    def test_in_list_buckets(self):
+        dialect = DB2Dialect_ibm_db(in_list_buckets=True,
+                                    in_list_max_bucket=4,
+                                    in_list_max_length=10)
+        self.assert_compile(select([self.t.c.id]).
+                                where(self.t.c.id.in_([1, 2, 3])),
+            "SELECT t.id FROM t WHERE t.id IN (:id_1, :id_2, :id_3, :id_3)",
+            dialect=dialect)
+        # multiples of in_list_max_bucket, up to in_list_max_length
+        self.assert_compile(select([self.t.c.id]).
+                                where(~self.t.c.id.in_(range(9))),
+            "SELECT t.id FROM t WHERE t.id NOT IN (:id_1, :id_2, :id_3, "
+            ":id_4, :id_5, :id_6, :id_7, :id_8, :id_9, :id_9)",
+            dialect=dialect)
+        assert_raises(exc.CompileError, select([self.t.c.id]).
+                            where(self.t.c.id.in_(range(11))).compile,
+                      dialect=dialect)
+        eq_(dict(dialect.in_list_shapes), {4: 1, 10: 1})
+
+    def test_in_list_shapes_threads(self):
+        dialect = DB2Dialect_ibm_db(in_list_buckets=True)
+        stmt = select([self.t.c.id]).where(self.t.c.id.in_([1, 2, 3]))
+
+        def compile():
+            for i in range(200):
+                stmt.compile(dialect=dialect)
+        threads = [threading.Thread(target=compile) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        eq_(dict(dialect.in_list_shapes), {4: 800})
+
+    def test_truncate(self):
+        self.assert_compile(Truncate(self.t),
+            "TRUNCATE TABLE t DROP STORAGE IGNORE DELETE TRIGGERS IMMEDIATE")
+        self.assert_compile(Truncate(self.t, reuse_storage=True,
+                                     restrict_when_delete_triggers=True),
+            "TRUNCATE TABLE t REUSE STORAGE "
+            "RESTRICT WHEN DELETE TRIGGERS IMMEDIATE")
+
+    def test_detach_partition(self):
+        archive = Table('orders_2012', MetaData(), Column('id', Integer),
+                        schema='archive')
+        self.assert_compile(DetachPartition(self.t, 'p2012', 'orders_2012'),
+            "ALTER TABLE t DETACH PARTITION p2012 INTO orders_2012")
+        self.assert_compile(DetachPartition(self.t, 'p2012', archive),
+            "ALTER TABLE t DETACH PARTITION p2012 INTO archive.orders_2012")
+
+    def test_delete_chunk(self):
+        self.assert_compile(DeleteChunk(self.t, self.t.c.id > 5, 100),
+            "DELETE FROM (SELECT t.id AS id FROM t WHERE t.id > :id_1 "
+            "FETCH FIRST 100 ROWS ONLY)")
+
+    def _orders(self, **kw):
+        return Table('orders', MetaData(),
+                     Column('id', Integer, primary_key=True,
+                            info=kw.pop('identity', {})),
+                     Column('customer_id', Integer),
+                     Column('total', Numeric(10, 2)), **kw)
+
+    def test_create_table_options(self):
+        self.assert_compile(CreateTable(self._orders(
+                    db2_tablespace='ts_data', db2_index_tablespace='ts_index',
+                    db2_long_tablespace='ts_long',
+                    db2_distribute_by=['customer_id'],
+                    db2_compress='static', db2_organize_by='row')),
+            "CREATE TABLE orders ("
+            "id INT NOT NULL GENERATED BY DEFAULT AS IDENTITY "
+            "(START WITH 1), customer_id INT, total DECIMAL(10, 2), "
+            "PRIMARY KEY (id))"
+            "IN ts_data"
+            "INDEX IN ts_index"
+            "LONG IN ts_long"
+            "DISTRIBUTE BY HASH (customer_id)"
+            "COMPRESS YES STATIC"
+            "ORGANIZE BY ROW")
+        self.assert_compile(CreateTable(self._orders(
+                    db2_distribute_by='random', db2_compress=False)),
+            "CREATE TABLE orders ("
+            "id INT NOT NULL GENERATED BY DEFAULT AS IDENTITY "
+            "(START WITH 1), customer_id INT, total DECIMAL(10, 2), "
+            "PRIMARY KEY (id))"
+            "DISTRIBUTE BY RANDOM"
+            "COMPRESS NO")
+
+    def test_identity_options(self):
+        self.assert_compile(CreateTable(self._orders(identity={
+                    'db2_generated_always': True, 'db2_start': 100,
+                    'db2_increment': 10, 'db2_cache': 50,
+                    'db2_order': True})),
+            "CREATE TABLE orders ("
+            "id INT NOT NULL GENERATED ALWAYS AS IDENTITY "
+            "(START WITH 100 INCREMENT BY 10 CACHE 50 ORDER), "
+            "customer_id INT, total DECIMAL(10, 2), PRIMARY KEY (id))")
+        self.assert_compile(CreateTable(self._orders(identity={
+                    'db2_cache': 0, 'db2_order': False})),
+            "CREATE TABLE orders ("
+            "id INT NOT NULL GENERATED BY DEFAULT AS IDENTITY "
+            "(START WITH 1 NO CACHE NO ORDER), "
+            "customer_id INT, total DECIMAL(10, 2), PRIMARY KEY (id))")
+
+    def test_create_index_options(self):
+        orders = self._orders()
+        self.assert_compile(CreateIndex(Index('ix_orders',
+                    orders.c.customer_id, unique=True,
+                    db2_include=['total'], db2_cluster=True,
+                    db2_pctfree=10, db2_allow_reverse_scans=False,
+                    db2_compress=True)),
+            "CREATE UNIQUE INDEX ix_orders ON orders (customer_id) "
+            "INCLUDE (total) CLUSTER PCTFREE 10 DISALLOW REVERSE SCANS "
+            "COMPRESS YES")
+        self.assert_compile(CreateIndex(Index('ix_orders',
+                    orders.c.customer_id, db2_allow_reverse_scans=True,
+                    db2_compress=False)),
+            "CREATE INDEX ix_orders ON orders (customer_id) "
+            "ALLOW REVERSE SCANS COMPRESS NO")
+        # INCLUDE columns need a unique index
+        assert_raises(exc.CompileError, CreateIndex(Index('ix_orders',
+                            orders.c.customer_id,
+                            db2_include=['total'])).compile,
+                      dialect=self.__dialect__)
+
+    def _numeric_processor(self, result_type, type_, coltype='DECIMAL'):
+        dialect = DB2Dialect_ibm_db()
+        dialect._set_decimal_result_type(result_type)
+        return type_.dialect_impl(dialect).result_processor(dialect, coltype)
+
+    def test_decimal_string_processors(self):
+        process = self._numeric_processor(str, Numeric(10, 2))
+        eq_(process('12.3'), decimal.Decimal('12.30'))
+        eq_(str(process('12.3')), '12.30')
+        eq_(process(None), None)
+        # all 31 digits of a DECIMAL(31, 2) are kept
+        eq_(process('12345678901234567890123456789.01'),
+            decimal.Decimal('12345678901234567890123456789.01'))
+        # shared by the columns of a scale
+        assert self._numeric_processor(str, Numeric(5, 2)) is process
+        eq_(self._numeric_processor(str, Numeric())('1.25'),
+            decimal.Decimal('1.25'))
+        eq_(self._numeric_processor(str, Numeric(10, 2,
+                                        asdecimal=False))('12.3'), 12.3)
+
+    def test_decimal_native_processors(self):
+        eq_(self._numeric_processor(decimal.Decimal, Numeric(10, 2)), None)
+        eq_(self._numeric_processor(decimal.Decimal, Numeric(10, 2,
+                        asdecimal=False))(decimal.Decimal('12.3')), 12.3)
+
+    def test_float_column_processors(self):
+        # DOUBLE columns are fetched as floats whatever the DECIMAL type,
+        # and aren't converted again
+        for result_type in (str, decimal.Decimal):
+            for coltype in ('DOUBLE', float):
+                eq_(self._numeric_processor(result_type,
+                        Numeric(asdecimal=False), coltype), None)
+
+    def test_in_list_buckets_off(self):
+        self.assert_compile(select([self.t.c.id]).
+                                where(self.t.c.id.in_([1, 2, 3])),
+            "SELECT t.id FROM t WHERE t.id IN (:id_1, :id_2, :id_3)")